@@ -1,633 +1,4068 @@
 
 import os
+import sys
 import json
 import threading
+import time
+import atexit
+import queue
+import gzip
+import hashlib
 import random
+import math
+import bisect
+import heapq
+import shutil
+import filecmp
+import csv
+import codecs
+import sqlite3
+import signal
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, g
 from flask import send_from_directory
+from werkzeug.routing import BaseConverter
 import re
 import markdown
-from collections import defaultdict
+import click
+from collections import Counter, defaultdict, deque, OrderedDict
+from contextlib import contextmanager, nullcontext
+from functools import partial
 
 app = Flask(__name__)
 bracket_lock = threading.Lock()
+participants_lock = threading.Lock() # Held while a participant list is rewritten
 
 BRACKET_FILE = "bracket.json"
 
+# Where brackets are kept: "json" for a JSON file plus event log per
+# tournament, or "sqlite" for one SQLite database holding every tournament
+# (see `flask import-bracket` to move existing JSON brackets into it).
+STORAGE_BACKEND = "json"
+SQLITE_FILE = "brackets.db"
+
+# Other tournaments hosted alongside the default one keep their brackets here,
+# one <tournament id>.json each, and are served under /api/t/<tournament id>/.
+TOURNAMENTS_DIR = "tournaments"
+DEFAULT_TOURNAMENT = "default" # Served at /api/ and stored in BRACKET_FILE
+TOURNAMENT_ID_REGEX = r"[A-Za-z0-9_-]{1,64}"
+# How many tournaments may be held in memory before idle ones are evicted,
+# and how long one must go unused before it counts as idle.
+MAX_OPEN_TOURNAMENTS = 16
+TOURNAMENT_IDLE_SECONDS = 300
+
+# The default tournament's participant list, one "Name (H)" per line, H
+# being one of HOUSES or N/A. Other tournaments can have their own in
+# TOURNAMENTS_DIR/<tournament id>.participants.txt (see /api/participants).
+PARTICIPANTS_FILE = "participants.txt"
+HOUSES = "YCBMA"
+MAX_PARTICIPANT_NAME_LENGTH = 100
+# Participant imports skip lines longer than this, and report at most this
+# many errors (and duplicates) individually before only counting them.
+MAX_IMPORT_LINE_BYTES = 4096
+IMPORT_MAX_ERRORS = 100
+
 PROBLEMS_DIR = "static/problems"
+PROBLEM_CATALOG_FILE = "problem_catalog.json"
+
+# HKT is UTC+8
+HKT_TZ = timezone(timedelta(hours=8))
+
+# Clients batch completions for a moment before sending them and report how
+# long each one waited; the server trusts at most this much of that wait. The
+# page holds a batch for 200 ms (COMPLETION_BATCH_MS in script.js), plus a
+# little for a busy browser to get round to sending it.
+MAX_COMPLETION_QUEUE_MS = 250
+
+# How long the writer waits after a change before flushing, so that a burst
+# of completions ends up as a single write.
+FLUSH_DELAY_SECONDS = 0.5
+
+# /api/stream sends a comment this often so proxies don't drop idle connections.
+STREAM_KEEPALIVE_SECONDS = 15
+# Events a slow stream client may fall behind by before it is told to reload.
+STREAM_QUEUE_SIZE = 100
+# How many versions back /api/bracket?since= can answer with a delta.
+DELTA_HISTORY = 1000
+# Changes are appended to an event log next to the bracket file; after this many
+# the log is compacted into a fresh snapshot of the whole bracket.
+EVENTS_PER_SNAPSHOT = 500
+# How many earlier snapshots (and their logs) are kept for point-in-time restore.
+SNAPSHOT_HISTORY = 50
+
+# Render every problem when the app starts, so the first reveal is served from memory.
+PRERENDER_PROBLEMS = True
+# How often a cached problem checks whether its markdown file has been edited.
+PROBLEM_RECHECK_SECONDS = 2
+# How long browsers may reuse a problem before checking back with its ETag.
+PROBLEM_MAX_AGE_SECONDS = 60
+# Rendered problems smaller than this aren't worth compressing.
+GZIP_MIN_BYTES = 1024
+# The most matches /api/matches and /multimatch will show at once.
+MAX_BATCH_MATCHES = 32
+# How many past uses the catalog remembers per problem.
+PROBLEM_USAGE_HISTORY = 50
+
+# Problem difficulty for each round, by kind of match. Rounds past the end of
+# a curve use its last entry. Can be overridden per bracket in create_bracket.
+DIFFICULTY_CURVES = {
+    "upper": [1, 2, 3],   # Single elimination, the upper bracket and hybrid rounds
+    "lower": [1],         # Lower bracket of double elimination
+    "third_place": 2,
+    "grand_final": 3,
+}
+
+# How many of the fastest solves and top participants /api/standings lists.
+STANDINGS_FASTEST = 10
+STANDINGS_LEADERBOARD = 20
+
+# Submissions are judged against a problem's hidden test cases, kept as
+# <case>.in / <case>.out pairs in PROBLEM_TESTS_DIR/<problem name>/, or
+# against its examples if it has none. Keep this out of static/, where
+# everything is served publicly.
+PROBLEM_TESTS_DIR = "problem_tests"
+# How many test runs go at once, each in its own subprocess.
+JUDGE_WORKERS = os.cpu_count() or 2
+# Limits on each run: wall time, then CPU time, memory and output, which
+# the OS enforces where it can.
+JUDGE_TIMEOUT_SECONDS = 5
+JUDGE_CPU_SECONDS = 2
+JUDGE_MEMORY_BYTES = 512 * 1024 * 1024
+JUDGE_OUTPUT_BYTES = 1024 * 1024
+JUDGE_MAX_CODE_BYTES = 64 * 1024
+# Hidden inputs larger than this are read by submissions straight from their
+# file rather than kept in memory.
+JUDGE_STREAM_INPUT_BYTES = 1024 * 1024
+# How much of the output or error from a failed example is shown back.
+JUDGE_SHOWN_BYTES = 2000
+# How many submissions are remembered for /api/submission.
+JUDGE_HISTORY = 1000
+# The Python submissions run on.
+JUDGE_PYTHON = sys.executable
+# Each run is sandboxed with Linux namespaces, which needs no privileges
+# (see JUDGE_SANDBOX): no network, its own processes, and a root directory
+# of its own holding only these paths (read-only) and the interpreter's
+# install, so none of the app's files, PROBLEM_TESTS_DIR included. /tmp and
+# its working directory share a fresh in-memory scratch space of
+# JUDGE_SCRATCH_BYTES, gone when the run ends.
+JUDGE_SANDBOX_PATHS = ("/usr", "/bin", "/lib", "/lib32", "/lib64", "/etc/ld.so.cache", "/dev/null", "/dev/urandom")
+JUDGE_SCRATCH_BYTES = 16 * 1024 * 1024
+# Where the sandbox can't be set up (not Linux, or user namespaces turned
+# off), submissions are refused unless this is set, when they run unsandboxed
+# as the server's own user with only the resource limits: for judging code
+# you trust, never contests.
+JUDGE_TRUSTED_CODE = False
+
+# Stations a tournament's matches are played at, until set with POST
+# /api/schedule. The default tournament keeps its station settings in
+# SCHEDULE_FILE, others in TOURNAMENTS_DIR/<tournament id>.schedule.json.
+STATIONS = 8
+SCHEDULE_FILE = "schedule.json"
+
+# Latency histogram buckets for /metrics, in seconds.
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# The sampling profiler, off until turned on with POST /api/profiler, takes a
+# sample this often and keeps counts for at most this many distinct stacks.
+PROFILER_INTERVAL_SECONDS = 0.01
+PROFILER_MAX_STACKS = 5000
+
+# Bounds on the search for a draw that keeps houses apart.
+SEEDING_TIME_BUDGET_SECONDS = 0.3
+SEEDING_RESTARTS = 20
+SEEDING_SWAPS_PER_PARTICIPANT = 20
+
+
+# -----------------------------
+# Metrics
+# -----------------------------
+
+class Metrics:
+    """
+    Counters and histograms kept in memory, for /metrics to report in the
+    Prometheus text format. A series is a metric name plus its labels;
+    every metric is declared up front with describe(). Histograms all use
+    METRICS_BUCKETS. Gauges are read from a callback when rendered, so they
+    cost nothing in between.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._described = {} # name -> (type, help), in the order they are rendered
+        self._counters = defaultdict(int) # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [count per bucket (and +Inf), sum]
+        self._gauges = {} # name -> callback returning [(labels dict, value)]
+
+    def describe(self, name, kind, help_text, callback=None):
+        self._described[name] = (kind, help_text)
+        if callback is not None:
+            self._gauges[name] = callback
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes how long the with block took, in seconds, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        """Every series in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+        by_name = defaultdict(list)
+        for (name, labels), value in counters.items():
+            by_name[name].append((labels, value))
+        for (name, labels), series in histograms.items():
+            by_name[name].append((labels, series))
+
+        lines = []
+        for name, (kind, help_text) in self._described.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if name in self._gauges:
+                for labels, value in self._gauges[name]():
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+            elif kind == "counter":
+                for labels, value in sorted(by_name[name]):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            else:
+                for labels, series in sorted(by_name[name]):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), series):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {series[-1]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class SamplingProfiler:
+    """
+    While running, samples the stack of every other thread each interval and
+    counts how often each distinct stack is seen, so a slow spot during a
+    live event can be found without restarting the server. Off until
+    start()ed (see /api/profiler). Stacks are reported in the collapsed
+    "thread;outer;...;inner count" form flame graph tools read. Past
+    max_stacks distinct stacks, new ones are counted under "(other)".
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL_SECONDS, max_stacks=PROFILER_MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            if self._thread is not None:
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks = defaultdict(int)
+            self.samples = 0
+
+    def collapsed(self):
+        """The stacks seen so far, most frequent first, one "stack count" per line."""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: -item[1])
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        collected = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            collected.append(";".join(reversed(stack)))
+        with self._lock:
+            self.samples += 1
+            for stack in collected:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = "(other)"
+                self._stacks[stack] += 1
+
+
+metrics = Metrics()
+profiler = SamplingProfiler()
+
+metrics.describe("http_request_duration_seconds", "histogram", "Time to handle a request, by route, method and status.")
+metrics.describe("bracket_storage_duration_seconds", "histogram", "Time taken by bracket loads and saves.")
+metrics.describe("bracket_storage_operations_total", "counter", "Bracket loads and saves, by outcome.")
+metrics.describe("cache_requests_total", "counter", "Lookups in the problem, test case, bracket JSON and standings caches, by hit or miss.")
+metrics.describe("problem_render_duration_seconds", "histogram", "Time to render a problem's markdown.")
+metrics.describe("json_encode_duration_seconds", "histogram", "Time to encode the cached bracket and standings JSON.")
+metrics.describe("bracket_layout_duration_seconds", "histogram", "Time to work out a bracket's layout after its structure changes.")
+
+
+# -----------------------------
+# Bracket Store
+# -----------------------------
+
+class Match:
+    """
+    One match in the compact form the server works with. Participants are ids
+    into the bracket's participant table (see Bracket.participant_id), and
+    results are elapsed times in integer microseconds, a "DNF" label
+    (possibly with a note, like "DNF (votes)"), or None. start_time is a
+    server time (see server_time_us). Players and results are held in
+    tuples, so copies for a snapshot can share them. Rarely used keys, like
+    is_third_place or sub_matches, live in `extra`.
+
+    from_dict() and to_dict() convert to and from the JSON shape the API,
+    the frontend and the bracket files use.
+    """
+
+    __slots__ = (
+        "match_num", "winner_proceeds_to", "loser_proceeds_to", "problem", "problem_difficulty",
+        "players", "results", "start_time", "round", "bracket", "is_bye", "winner_slot", "loser_slot", "extra",
+    )
+
+    # Keys with a slot of their own; those that are None are left out of to_dict().
+    OPTIONAL_KEYS = ("round", "bracket", "is_bye", "winner_slot", "loser_slot")
+
+    def __init__(self, match_num, problem_difficulty=None, round_num=None, extra=None):
+        self.match_num = match_num
+        self.winner_proceeds_to = None
+        self.loser_proceeds_to = None
+        self.problem = None
+        self.problem_difficulty = problem_difficulty
+        self.players = () # participant id (or None) for participant1, participant2, ...
+        self.results = () # and their results
+        self.start_time = None
+        self.round = round_num
+        extra = dict(extra) if extra else {}
+        for key in self.OPTIONAL_KEYS[1:]:
+            setattr(self, key, extra.pop(key, None))
+        self.extra = extra or None
+
+    def player(self, slot):
+        """The participant id in a 1-based slot, or None."""
+        self._check_slot(slot)
+        return self.players[slot - 1] if slot <= len(self.players) else None
+
+    def result(self, slot):
+        self._check_slot(slot)
+        return self.results[slot - 1] if slot <= len(self.results) else None
+
+    def set_player(self, slot, participant_id):
+        self._check_slot(slot)
+        self._grow(slot)
+        self.players = self.players[:slot - 1] + (participant_id,) + self.players[slot:]
+
+    def set_result(self, slot, result):
+        self._check_slot(slot)
+        self._grow(slot)
+        self.results = self.results[:slot - 1] + (result,) + self.results[slot:]
+
+    @staticmethod
+    def _check_slot(slot):
+        # Slots count from 1; 0 or less would silently index from the end.
+        if slot < 1:
+            raise IndexError(f"Participant slots start at 1, not {slot}")
+
+    def _grow(self, slots):
+        missing = slots - len(self.players)
+        if missing > 0:
+            self.players += (None,) * missing
+            self.results += (None,) * missing
+
+    def copy(self):
+        match = Match.__new__(Match)
+        match.assign(self)
+        return match
+
+    def assign(self, other):
+        """Makes this match a copy of another, in place."""
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+        if other.extra:
+            self.extra = dict(other.extra)
+
+    def to_dict(self, participants):
+        match = {
+            "match_num": self.match_num,
+            "winner_proceeds_to": self.winner_proceeds_to,
+            "loser_proceeds_to": self.loser_proceeds_to,
+            "problem": self.problem,
+            "problem_difficulty": self.problem_difficulty,
+        }
+        for i, participant_id in enumerate(self.players, start=1):
+            match[f"participant{i}"] = participants[participant_id] if participant_id is not None else None
+        for i, result in enumerate(self.results, start=1):
+            match[f"participant{i}_result"] = format_elapsed(result) if isinstance(result, int) else result
+        match["start_time"] = format_server_time(self.start_time) if self.start_time is not None else None
+        for key in self.OPTIONAL_KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                match[key] = value
+        if self.extra:
+            match.update(self.extra)
+        return match
+
+    @classmethod
+    def from_dict(cls, data, bracket):
+        """Builds a match from its JSON shape, adding its participants to the bracket's table."""
+        data = dict(data)
+        num, difficulty, round_num = data.pop("match_num"), data.pop("problem_difficulty", None), data.pop("round", None)
+        winner_proceeds_to = data.pop("winner_proceeds_to", None)
+        loser_proceeds_to = data.pop("loser_proceeds_to", None)
+        problem = data.pop("problem", None)
+        start_time = parse_server_time(data.pop("start_time", None))
+        players, results = [], []
+        for i in range(1, 5):
+            if f"participant{i}" in data or f"participant{i}_result" in data:
+                participant = data.pop(f"participant{i}", None)
+                players.append(bracket.participant_id(participant) if participant else None)
+                results.append(parse_elapsed(data.pop(f"participant{i}_result", None)))
+        match = cls(num, difficulty, round_num, data) # What's left is the optional and rarely used keys
+        match.winner_proceeds_to = winner_proceeds_to
+        match.loser_proceeds_to = loser_proceeds_to
+        match.problem = problem
+        match.start_time = start_time
+        match.players, match.results = tuple(players), tuple(results)
+        return match
+
+
+class Bracket:
+    """
+    The list of Match records together with an index by match_num, the
+    reverse "fed by" edges (which matches send their winner or loser into a
+    match) and the table of participants the matches refer to by id.
+    Iterating over it yields the matches in their original order.
+    Structural changes should go through add() and link() so the index stays
+    consistent; results and participants can be edited on the matches
+    directly, as long as the match is marked with touch() first.
+    """
+
+    def __init__(self, matches=None, participants=None):
+        self.matches = matches if matches is not None else []
+        # Only ever appended to, so snapshots can share it.
+        self.participants = participants if participants is not None else []
+        self._participant_ids = {(p["name"], p.get("house")): i for i, p in enumerate(self.participants)}
+        self.changed = set() # match_nums modified in the current transaction
+        self.seeding = None # seed_draw()'s report on the draw, for a freshly generated bracket
+        self.schedule = None # Its ScheduleIndex, built on the Scheduler's first use of a live bracket
+        self.reindex()
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        bracket = cls()
+        for data in dicts:
+            bracket.add(Match.from_dict(data, bracket))
+        bracket.changed.clear()
+        return bracket
+
+    def to_dicts(self):
+        return [match.to_dict(self.participants) for match in self.matches]
+
+    def participant_id(self, participant):
+        """The id of a participant ({"name": ..., "house": ...}), adding them to the table if new."""
+        key = (participant["name"], participant.get("house"))
+        participant_id = self._participant_ids.get(key)
+        if participant_id is None:
+            participant_id = self._participant_ids[key] = len(self.participants)
+            self.participants.append(participant)
+        return participant_id
+
+    def reindex(self):
+        self.by_num = {}
+        self.fed_by = defaultdict(list) # match_num -> [(source match_num, "winner" or "loser")]
+        for match in self.matches:
+            self._index(match)
+
+    def _index(self, match):
+        self.by_num[match.match_num] = match
+        for edge in ("winner", "loser"):
+            target = getattr(match, f"{edge}_proceeds_to")
+            if target:
+                self.fed_by[target].append((match.match_num, edge))
+
+    def __iter__(self):
+        return iter(self.matches)
+
+    def __len__(self):
+        return len(self.matches)
+
+    def get(self, match_num):
+        return self.by_num.get(match_num)
+
+    def touch(self, match_num):
+        self.changed.add(match_num)
+
+    def feeders(self, match_num):
+        """Returns the (source match_num, edge) pairs that lead into a match."""
+        return self.fed_by.get(match_num, [])
+
+    def add(self, match):
+        self.matches.append(match)
+        self._index(match)
+        self.touch(match.match_num)
+
+    def link(self, source_num, edge, target_num):
+        """Sends the winner or loser of one match on to another match."""
+        source = self.by_num[source_num]
+        self.touch(source_num)
+        old_target = getattr(source, f"{edge}_proceeds_to")
+        if old_target:
+            self.fed_by[old_target].remove((source_num, edge))
+        setattr(source, f"{edge}_proceeds_to", target_num)
+        if target_num:
+            self.fed_by[target_num].append((source_num, edge))
+
+
+class BracketSnapshot:
+    """
+    A read-only copy of the bracket as it was at one version. Readers are
+    handed the latest snapshot, so they never wait for a writer and never see
+    a half-applied change. Matches are converted to their JSON shape only
+    when they are sent out.
+    """
+
+    def __init__(self, version, matches, participants, layout=None):
+        self.version = version
+        self.matches = matches
+        self.participants = participants
+        self.by_num = {m.match_num: m for m in matches}
+        self._json = None
+        self._layout = layout # JSON, passed on from the previous snapshot while the structure is unchanged
+
+    def to_json(self):
+        """The compact JSON for the whole bracket, encoded at most once per snapshot."""
+        if self._json is None:
+            metrics.inc("cache_requests_total", cache="bracket_json", result="miss")
+            with metrics.timer("json_encode_duration_seconds", document="bracket"):
+                self._json = json.dumps(self.to_dicts(), separators=(",", ":"))
+        else:
+            metrics.inc("cache_requests_total", cache="bracket_json", result="hit")
+        return self._json
+
+    def layout_json(self):
+        """The JSON for bracket_layout(), worked out at most once per bracket structure."""
+        if self._layout is None:
+            with metrics.timer("bracket_layout_duration_seconds"):
+                self._layout = json.dumps(bracket_layout(self.matches), separators=(",", ":"))
+        return self._layout
+
+    def to_dicts(self, match_nums=None):
+        """The matches (all of them, or those in match_nums) in their JSON shape."""
+        matches = self.matches if match_nums is None else [self.by_num[num] for num in match_nums]
+        return [match.to_dict(self.participants) for match in matches]
+
+    def participant(self, participant_id):
+        return self.participants[participant_id] if participant_id is not None else None
+
+    def __iter__(self):
+        return iter(self.matches)
+
+    def __len__(self):
+        return len(self.matches)
+
+    def get(self, match_num):
+        return self.by_num.get(match_num)
+
+
+def replay_events(bracket, events):
+    """
+    Applies logged events to a Bracket. Each event holds the whole of every
+    match it changed, so replaying is just putting those back, and replaying
+    an event twice does no harm.
+    """
+    for event in events:
+        for data in event["matches"]:
+            current = bracket.get(data["match_num"])
+            if current is not None:
+                current.assign(Match.from_dict(data, bracket))
+
+
+class JsonFileStorage:
+    """
+    Keeps a bracket in a JSON file plus an event log. The bracket file is a
+    snapshot of the whole bracket and every transaction since is appended to
+    the log (bracket.events.jsonl for bracket.json) as one line holding the
+    matches it left changed. Loading replays the log over the snapshot. Every
+    EVENTS_PER_SNAPSHOT events, or when the whole bracket is replaced, the log
+    is compacted into a new snapshot and the old snapshot and log are moved
+    into a history directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        base = os.path.splitext(path)[0]
+        self.log_path = base + ".events.jsonl"
+        self.history_dir = base + ".history"
+        self._log_seq = None # Version of the snapshot the log starts from
+        self._log_events = 0 # Events in the log since that snapshot
+
+    def __str__(self):
+        return self.path
+
+    def load(self):
+        """Returns the bracket (a Bracket, or None if there isn't one) with its log replayed."""
+        bracket = self._read_snapshot(self.path)
+        if bracket is not None:
+            replay_events(bracket, self._open_log())
+        return bracket
+
+    def read(self):
+        """Like load(), but never writes anything (for importing the files elsewhere)."""
+        bracket = self._read_snapshot(self.path)
+        header, events = self._read_log(self.log_path)
+        if bracket is not None and header is not None and not self._stale_log(header):
+            replay_events(bracket, events)
+        return bracket
+
+    def save(self, snapshot, events, replaced, version):
+        """
+        Appends events to the log, or, if the bracket was replaced or the log
+        is due for compaction, starts a new snapshot (which already includes
+        the events). version is the store's current one, for when snapshot is None.
+        """
+        if replaced or self._log_events + len(events) >= EVENTS_PER_SNAPSHOT:
+            self._compact(snapshot, version)
+        elif events:
+            self._append(events)
+
+    def segments(self):
+        """
+        Returns (version, time, events, load snapshot) for every snapshot in
+        the history and then the current one, oldest first.
+        """
+        segments = []
+        for seq in self._archived():
+            prefix = os.path.join(self.history_dir, str(seq))
+            header, events = self._read_log(prefix + ".events.jsonl")
+            if header is not None:
+                segments.append((seq, header["at"], events, partial(self._read_snapshot, prefix + ".json")))
+        header, events = self._read_log(self.log_path)
+        if header is not None and not self._stale_log(header):
+            segments.append((header["version"], header["at"], events, partial(self._read_snapshot, self.path)))
+        return segments
+
+    def _open_log(self):
+        """Returns the current log's events, first starting a log for a bracket file from before there was one."""
+        header, events = self._read_log(self.log_path)
+        if header is None or self._stale_log(header):
+            if os.path.exists(self.path):
+                # Versions are times in milliseconds, so the file's age stands in for one.
+                mtime = os.path.getmtime(self.path)
+                self._write_log_header(int(mtime * 1000), datetime.fromtimestamp(mtime, HKT_TZ))
+            return []
+        self._log_seq = header["version"]
+        self._log_events = len(events)
+        return events
+
+    def _stale_log(self, header):
+        """
+        Whether the log belongs to an earlier snapshot than the current one,
+        which is left behind if compaction is cut short between writing the
+        new snapshot and starting the new log. Compaction first archives the
+        snapshot a log starts from under the log's version, so the log is
+        stale if that archived copy is no longer the current snapshot. The
+        current snapshot then already includes every event in the log.
+        """
+        archived = os.path.join(self.history_dir, f"{header['version']}.json")
+        if not os.path.exists(archived) or not os.path.exists(self.path):
+            return False
+        return not (os.path.samefile(archived, self.path) or filecmp.cmp(archived, self.path, shallow=False))
+
+    def _archived(self):
+        if not os.path.isdir(self.history_dir):
+            return []
+        return sorted(
+            int(name[:-len(".events.jsonl")]) for name in os.listdir(self.history_dir)
+            if name.endswith(".events.jsonl")
+        )
+
+    @staticmethod
+    def _read_snapshot(path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return Bracket.from_dicts(json.load(f))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _read_log(path):
+        """Returns the log's header line and its events, or (None, []) if there is no log."""
+        if not os.path.exists(path):
+            return None, []
+        header, events = None, []
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break # A line cut short by a crash mid-append; nothing after it is valid
+                if header is None:
+                    header = record
+                else:
+                    events.append(record)
+        return header, events
+
+    def _append(self, events):
+        data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events)
+        with open(self.log_path, "a") as f:
+            f.write(data)
+        self._log_events += len(events)
+
+    def _compact(self, snapshot, version):
+        """Starts a new snapshot and log, moving the old ones into the history."""
+        if self._log_seq is None: # Replaced before it was ever loaded
+            self._open_log()
+        os.makedirs(self.history_dir, exist_ok=True)
+        prefix = os.path.join(self.history_dir, str(self._log_seq))
+        # Hard links, so the files being archived stay in place until the
+        # new ones atomically replace them.
+        for path, archived in ((self.path, prefix + ".json"), (self.log_path, prefix + ".events.jsonl")):
+            if self._log_seq is not None and os.path.exists(path) and not os.path.exists(archived):
+                try:
+                    os.link(path, archived)
+                except OSError:
+                    shutil.copyfile(path, archived)
+        seq = snapshot.version if snapshot is not None else version
+        # The new snapshot goes first, so the events in the old log are never
+        # lost. If we crash before the new log is started, _stale_log() sees
+        # that the old log's snapshot has been replaced and it isn't replayed.
+        self._write(None if snapshot is None else snapshot.to_json())
+        self._write_log_header(seq, datetime.now(HKT_TZ))
+        self._prune_history()
+
+    def _write_log_header(self, seq, at):
+        self._log_seq = seq
+        self._log_events = 0
+        header = json.dumps({"version": seq, "at": at.isoformat(), "op": "snapshot"}, separators=(",", ":"))
+        self._write_file(self.log_path, header + "\n")
+
+    def _prune_history(self):
+        for seq in self._archived()[:-SNAPSHOT_HISTORY]:
+            for suffix in (".json", ".events.jsonl"):
+                path = os.path.join(self.history_dir, str(seq) + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _write(self, data):
+        if data is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        self._write_file(self.path, data)
+
+    @staticmethod
+    def _write_file(path, data):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file then rename over the original, so a crash
+        # mid-write never leaves a half-written file behind.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+            # On disk before the rename, so the rename can't outlive its contents
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class SqliteStorage:
+    """
+    Keeps brackets in a SQLite database with one row per match, so saving a
+    transaction only rewrites the matches it changed. Every tournament shares
+    the one database, keyed by tournament id, and the participants of each
+    match are indexed by name. Events are kept as rows too, along with a
+    snapshot of the whole bracket whenever it is replaced and every
+    EVENTS_PER_SNAPSHOT events, which is the history restore() works from.
+    The database runs in WAL mode, so reading never waits for a write.
+    """
+
+    SCHEMA = """
+        PRAGMA journal_mode=WAL;
+        CREATE TABLE IF NOT EXISTS matches (
+            tournament TEXT NOT NULL,
+            match_num INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (tournament, match_num)
+        );
+        CREATE TABLE IF NOT EXISTS match_participants (
+            tournament TEXT NOT NULL,
+            match_num INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            house TEXT,
+            PRIMARY KEY (tournament, match_num, slot)
+        );
+        CREATE INDEX IF NOT EXISTS match_participants_by_name ON match_participants (tournament, name);
+        CREATE TABLE IF NOT EXISTS events (
+            tournament TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            at TEXT NOT NULL,
+            op TEXT NOT NULL,
+            matches TEXT NOT NULL,
+            PRIMARY KEY (tournament, version)
+        );
+        CREATE TABLE IF NOT EXISTS snapshots (
+            tournament TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            at TEXT NOT NULL,
+            matches TEXT, -- NULL when the bracket was deleted
+            PRIMARY KEY (tournament, version)
+        );
+    """
+
+    def __init__(self, db_path, tournament_id):
+        self.db_path = db_path
+        self.tournament_id = tournament_id
+        self._events_since_snapshot = None # Counted from the database on first use
+        with self._connect() as db:
+            db.executescript(self.SCHEMA)
+
+    def __str__(self):
+        return f"{self.db_path} ({self.tournament_id})"
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            db.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; only the last commits can be lost in a power cut
+            with db: # Commits, or rolls back if the block raises
+                yield db
+        finally:
+            db.close()
+
+    def load(self):
+        """Returns the bracket as a Bracket, or None if there isn't one."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT data FROM matches WHERE tournament = ? ORDER BY match_num", (self.tournament_id,)
+            ).fetchall()
+        if not rows:
+            return None
+        return Bracket.from_dicts(json.loads(data) for data, in rows)
+
+    def save(self, snapshot, events, replaced, version):
+        """
+        Writes the changed matches and the events in one transaction. If the
+        bracket was replaced, every row is rewritten and a snapshot stored.
+        version is the store's current one, for when snapshot is None.
+        """
+        with self._connect() as db:
+            if self._events_since_snapshot is None:
+                self._events_since_snapshot = db.execute(
+                    "SELECT COUNT(*) FROM events WHERE tournament = ? AND version > "
+                    "(SELECT COALESCE(MAX(version), 0) FROM snapshots WHERE tournament = ?)",
+                    (self.tournament_id, self.tournament_id),
+                ).fetchone()[0]
+
+            if replaced:
+                db.execute("DELETE FROM matches WHERE tournament = ?", (self.tournament_id,))
+                db.execute("DELETE FROM match_participants WHERE tournament = ?", (self.tournament_id,))
+                if snapshot is not None:
+                    self._write_matches(db, snapshot.to_dicts())
+                self._write_snapshot(db, snapshot, version)
+                return
+
+            # Only the last state of each match matters for its row.
+            latest = {}
+            for event in events:
+                for match in event["matches"]:
+                    latest[match["match_num"]] = match
+            self._write_matches(db, latest.values())
+            db.executemany(
+                "INSERT OR REPLACE INTO events (tournament, version, at, op, matches) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.tournament_id, e["version"], e["at"], e["op"], json.dumps(e["matches"], separators=(",", ":")))
+                    for e in events
+                ],
+            )
+            self._events_since_snapshot += len(events)
+            if self._events_since_snapshot >= EVENTS_PER_SNAPSHOT and snapshot is not None:
+                self._write_snapshot(db, snapshot, version)
+
+    def segments(self):
+        """
+        Returns (version, time, events, load snapshot) for every stored
+        snapshot, oldest first, each with the events logged after it.
+        """
+        with self._connect() as db:
+            snapshots = db.execute(
+                "SELECT version, at FROM snapshots WHERE tournament = ? ORDER BY version", (self.tournament_id,)
+            ).fetchall()
+            rows = db.execute(
+                "SELECT version, at, op, matches FROM events WHERE tournament = ? ORDER BY version", (self.tournament_id,)
+            ).fetchall()
+        events = [{"version": v, "at": at, "op": op, "matches": json.loads(matches)} for v, at, op, matches in rows]
+        segments = []
+        for i, (seq, at) in enumerate(snapshots):
+            end = snapshots[i + 1][0] if i + 1 < len(snapshots) else float("inf")
+            segment_events = [e for e in events if seq < e["version"] < end]
+            segments.append((seq, at, segment_events, partial(self._load_snapshot, seq)))
+        return segments
+
+    @staticmethod
+    def tournament_ids(db_path):
+        """Every tournament with a bracket in the database."""
+        if not os.path.exists(db_path):
+            return []
+        db = sqlite3.connect(db_path)
+        try:
+            return [t for t, in db.execute("SELECT DISTINCT tournament FROM matches")]
+        finally:
+            db.close()
+
+    def _load_snapshot(self, seq):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT matches FROM snapshots WHERE tournament = ? AND version = ?", (self.tournament_id, seq)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return Bracket.from_dicts(json.loads(row[0]))
+
+    def _write_matches(self, db, matches):
+        matches = list(matches)
+        db.executemany(
+            "INSERT OR REPLACE INTO matches (tournament, match_num, data) VALUES (?, ?, ?)",
+            [(self.tournament_id, m["match_num"], json.dumps(m, separators=(",", ":"))) for m in matches],
+        )
+        db.executemany(
+            "DELETE FROM match_participants WHERE tournament = ? AND match_num = ?",
+            [(self.tournament_id, m["match_num"]) for m in matches],
+        )
+        db.executemany(
+            "INSERT INTO match_participants (tournament, match_num, slot, name, house) VALUES (?, ?, ?, ?, ?)",
+            [
+                (self.tournament_id, m["match_num"], slot, p["name"], p.get("house"))
+                for m in matches
+                for slot in range(1, 5)
+                for p in [m.get(f"participant{slot}")]
+                if p
+            ],
+        )
+
+    def _write_snapshot(self, db, snapshot, version):
+        seq = snapshot.version if snapshot is not None else version
+        db.execute(
+            "INSERT OR REPLACE INTO snapshots (tournament, version, at, matches) VALUES (?, ?, ?, ?)",
+            (self.tournament_id, seq, datetime.now(HKT_TZ).isoformat(), None if snapshot is None else snapshot.to_json()),
+        )
+        self._events_since_snapshot = 0
+        # Keep the newest SNAPSHOT_HISTORY snapshots and the events after the oldest of them.
+        oldest = db.execute(
+            "SELECT version FROM snapshots WHERE tournament = ? ORDER BY version DESC LIMIT 1 OFFSET ?",
+            (self.tournament_id, SNAPSHOT_HISTORY),
+        ).fetchone()
+        if oldest is not None:
+            db.execute("DELETE FROM snapshots WHERE tournament = ? AND version <= ?", (self.tournament_id, oldest[0]))
+            db.execute("DELETE FROM events WHERE tournament = ? AND version <= ?", (self.tournament_id, oldest[0]))
+
+
+def open_storage(tournament_id):
+    """The storage backend for a tournament, as chosen by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteStorage(SQLITE_FILE, tournament_id)
+    if tournament_id == DEFAULT_TOURNAMENT:
+        return JsonFileStorage(BRACKET_FILE)
+    return JsonFileStorage(os.path.join(TOURNAMENTS_DIR, tournament_id + ".json"))
+
+
+class BracketStore:
+    """
+    Holds the bracket in memory as the single source of truth.
+    Storage is only read once, on first access, and is written by a
+    background thread some time after a change (write-behind). Several
+    changes made within FLUSH_DELAY_SECONDS are coalesced into one write.
+
+    Changes go through transaction(), which serialises writers on the store's
+    lock. When a transaction finishes, copies of the matches it touched are
+    published as a new BracketSnapshot, which is what readers get, and are
+    pushed to every subscribe()d stream as a server-sent event. Each
+    transaction is also queued as an event for the storage backend (see
+    JsonFileStorage and SqliteStorage), whose history restore() rebuilds
+    earlier states from.
+    """
+
+    def __init__(self, storage, lock=None, flush_delay=FLUSH_DELAY_SECONDS):
+        self.storage = storage
+        self.lock = lock or threading.Lock()
+        self.flush_delay = flush_delay
+        # Versions start from the current time in milliseconds so they keep
+        # increasing across restarts, and a client's ETag or ?since= from before
+        # a restart can never be mistaken for a current version.
+        self.version = int(time.time() * 1000)
+        self._replaced_version = self.version # Last time the whole bracket was replaced
+        self._changes = deque(maxlen=DELTA_HISTORY) # (version, match_nums changed)
+        self._bracket = None # The live bracket, only touched while holding self.lock
+        self._snapshot = None
+        self._standings = None # Built by _load() and kept up to date by _publish(), under self.lock
+        self._standings_json = None # (version, JSON) of the last standings asked for
+        self._loaded = False
+        self._dirty = False
+        self._pending = [] # Events not yet saved
+        self._replaced = False # Whether the whole bracket was replaced since the last flush
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._closed = False
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+
+    def snapshot(self):
+        """Returns the latest published BracketSnapshot, or None if there is no bracket."""
+        if not self._loaded:
+            with self.lock:
+                self._load()
+        return self._snapshot
+
+    @contextmanager
+    def transaction(self, op="update"):
+        """
+        Yields the live Bracket (or None) to a single writer at a time.
+        Writers must call bracket.touch(match_num) for every match they change.
+        If the block raises, the touched matches are restored from the last
+        snapshot; otherwise they are published as a new version and logged as
+        an event of kind `op` (e.g. "start", "complete", "dnf", "reset").
+        """
+        with self.lock:
+            self._load()
+            bracket = self._bracket
+            if bracket is None:
+                yield None
+                return
+            bracket.changed.clear()
+            try:
+                yield bracket
+            except BaseException:
+                touched = list(bracket.changed)
+                self._rollback(bracket)
+                if bracket.schedule is not None:
+                    bracket.schedule.refresh(bracket, touched)
+                raise
+            if bracket.changed:
+                self._publish(bracket.changed, op)
+                if bracket.schedule is not None:
+                    bracket.schedule.refresh(bracket, bracket.changed)
+
+    def set(self, bracket):
+        """Replaces the whole bracket."""
+        if not isinstance(bracket, Bracket):
+            bracket = Bracket.from_dicts(bracket)
+        with self.lock:
+            self._loaded = True
+            self._bracket = bracket
+            self._publish()
+
+    def clear(self):
+        """Drops the bracket and removes the file on the next flush."""
+        with self.lock:
+            self._loaded = True
+            self._bracket = None
+            self._publish()
+
+    def flush(self):
+        """Saves any pending change immediately."""
+        with self._write_lock:
+            with self._cond:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                events, self._pending = self._pending, []
+                replaced, self._replaced = self._replaced, False
+                snapshot = self._snapshot
+            # Snapshots are never modified once published, so they can be
+            # saved without holding up readers or writers.
+            try:
+                with metrics.timer("bracket_storage_duration_seconds", op="save"):
+                    self.storage.save(snapshot, events, replaced, self.version)
+            except Exception:
+                metrics.inc("bracket_storage_operations_total", op="save", outcome="error")
+                # Put the events back for the next flush to retry. Replaying an
+                # event that did get saved does no harm, and if the bracket has
+                # been replaced since, its new snapshot already includes them.
+                with self._cond:
+                    if not self._replaced:
+                        self._pending = events + self._pending
+                    self._replaced = self._replaced or replaced
+                    self._dirty = True
+                raise
+            metrics.inc("bracket_storage_operations_total", op="save", outcome="ok")
+
+    def history(self):
+        """
+        Lists the points restore() can start from, oldest first: the version
+        and time of each snapshot and how many events were logged after it.
+        """
+        self.flush()
+        return [
+            {"version": seq, "at": at, "events": len(events)}
+            for seq, at, events, _ in self.storage.segments()
+        ]
+
+    def restore(self, at):
+        """
+        Replaces the bracket with the one it was at the given time, rebuilt
+        from the newest snapshot before then plus the events logged up to it.
+        The bracket being replaced is itself kept in the history, so a restore
+        can be undone. Raises ValueError if the history doesn't reach back that far.
+        """
+        self.flush()
+        found = None
+        for segment in self.storage.segments():
+            if datetime.fromisoformat(segment[1]) <= at:
+                found = segment
+        if found is None:
+            raise ValueError(f"No snapshot from before {at.isoformat()}")
+        _, _, events, load_snapshot = found
+        bracket = load_snapshot()
+        if bracket is not None:
+            replay_events(bracket, (e for e in events if datetime.fromisoformat(e["at"]) <= at))
+        if bracket is None:
+            self.clear()
+        else:
+            self.set(bracket)
+        return bracket
+
+    def standings_json(self):
+        """Returns (version, JSON) for the current standings, encoded at most once per version."""
+        cached = self._standings_json
+        if cached is not None and self._loaded and cached[0] == self.version:
+            metrics.inc("cache_requests_total", cache="standings", result="hit")
+            return cached
+        with self.lock:
+            self._load()
+            if self._standings_json is None or self._standings_json[0] != self.version:
+                metrics.inc("cache_requests_total", cache="standings", result="miss")
+                with metrics.timer("json_encode_duration_seconds", document="standings"):
+                    data = json.dumps(self._standings.to_dict(), separators=(",", ":"))
+                self._standings_json = (self.version, data)
+            else:
+                metrics.inc("cache_requests_total", cache="standings", result="hit")
+            return self._standings_json
+
+    def close(self):
+        """Writes any pending change and stops the writer thread."""
+        with self.lock:
+            with self._cond:
+                self._closed = True
+                self._cond.notify()
+        self.flush()
+
+    @property
+    def has_subscribers(self):
+        with self._subscribers_lock:
+            return bool(self._subscribers)
+
+    @property
+    def subscriber_count(self):
+        with self._subscribers_lock:
+            return len(self._subscribers)
+
+    def _load(self):
+        if self._loaded:
+            return
+        try:
+            with metrics.timer("bracket_storage_duration_seconds", op="load"):
+                self._bracket = self.storage.load()
+            metrics.inc("bracket_storage_operations_total", op="load", outcome="ok")
+        except Exception as e:
+            metrics.inc("bracket_storage_operations_total", op="load", outcome="error")
+            app.logger.error("Failed to load %s: %s", self.storage, e)
+            self._bracket = None
+        if self._bracket is not None:
+            backfill_advancement_slots(self._bracket)
+            self._snapshot = BracketSnapshot(self.version, [m.copy() for m in self._bracket], self._bracket.participants)
+            self._snapshot.layout_json()
+        self._standings = Standings(self._bracket.participants, self._bracket) if self._bracket is not None else Standings()
+        self._loaded = True
+
+    def _publish(self, changed=None, op="update"):
+        """Publishes a new snapshot. changed=None means the whole bracket was replaced."""
+        bracket = self._bracket
+        old = self._snapshot
+        if bracket is None:
+            snapshot = None
+        elif changed is None or old is None:
+            snapshot = BracketSnapshot(self.version + 1, [m.copy() for m in bracket], bracket.participants)
+            # Only replacing the whole bracket changes its structure, so this
+            # is the one place the layout needs working out again.
+            snapshot.layout_json()
+        else:
+            # Only the changed matches are copied; the rest are shared with the old snapshot.
+            copies = {num: bracket.get(num).copy() for num in changed}
+            snapshot = BracketSnapshot(
+                self.version + 1, [copies.get(m.match_num, m) for m in old.matches], bracket.participants,
+                layout=old.layout_json(),
+            )
+        if changed is None or old is None:
+            self._standings = Standings(bracket.participants, bracket) if bracket is not None else Standings()
+        else:
+            for num in changed:
+                self._standings.apply(old.get(num), bracket.get(num))
+        self.version += 1
+        if changed is None:
+            self._replaced_version = self.version
+            self._changes.clear()
+        else:
+            self._changes.append((self.version, frozenset(changed)))
+        # The changed matches in their JSON shape, for both the log and the streams.
+        changed_dicts = snapshot.to_dicts(changed) if snapshot is not None and changed is not None else None
+        with self._cond:
+            # Swapped in together with queueing the event, so a flush always
+            # sees a snapshot that includes every event it takes.
+            self._snapshot = snapshot
+            if changed is None:
+                self._replaced = True
+                self._pending.clear()
+            else:
+                self._pending.append({
+                    "version": self.version,
+                    "at": datetime.now(HKT_TZ).isoformat(),
+                    "op": op,
+                    "matches": changed_dicts,
+                })
+            self._schedule_flush()
+
+        if changed_dicts is not None:
+            payload = {"version": self.version, "matches": changed_dicts}
+            self._broadcast(format_sse("matches", payload, self.version))
+        else:
+            # Created or deleted: clients should fetch the whole bracket again.
+            self._broadcast(format_sse("bracket", {"version": self.version}, self.version))
+
+    def changes_since(self, since, snapshot):
+        """
+        Returns the match_nums changed after version `since` up to the given
+        snapshot, or None if that is too far back to answer from the history
+        (or predates the current bracket) and the client needs everything.
+        """
+        if since < self._replaced_version:
+            return None
+        changes = list(self._changes) # Copied in one step; writers may append meanwhile
+        if since < snapshot.version and (not changes or changes[0][0] > since + 1):
+            return None
+        changed = set()
+        for version, match_nums in changes:
+            if since < version <= snapshot.version:
+                changed |= match_nums
+        return changed
+
+    def subscribe(self):
+        """Returns a queue that receives a formatted event for every change."""
+        q = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        with self._subscribers_lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._subscribers_lock:
+            self._subscribers.discard(q)
+
+    def _broadcast(self, event):
+        # The event is encoded once and shared by every subscriber.
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # This client has fallen too far behind to catch up from deltas,
+                # so drop what it has queued and tell it to reload instead.
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(format_sse("bracket", {"version": self.version}, self.version))
+
+    def _rollback(self, bracket):
+        old = self._snapshot
+        for num in bracket.changed:
+            bracket.get(num).assign(old.get(num))
+        bracket.changed.clear()
+
+    def _schedule_flush(self):
+        self._dirty = True
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+        self._cond.notify()
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty:
+                    # Closed with nothing left to write. A late change starts a new writer.
+                    self._writer = None
+                    return
+            # Give further changes a chance to land before writing.
+            time.sleep(self.flush_delay)
+            try:
+                self.flush()
+            except Exception as e:
+                app.logger.error("Failed to write %s: %s", self.storage, e)
+
+
+class TournamentRegistry:
+    """
+    Hands out one BracketStore per tournament, so every tournament has its own
+    lock, snapshots, streams and storage. Stores are opened on first use and kept
+    in least-recently-used order; once more than max_open are held, the least
+    recently used ones that have been idle for idle_seconds and have nobody
+    streaming them are flushed and dropped. The default tournament is never
+    evicted.
+    """
+
+    def __init__(self, directory, default_store, max_open=MAX_OPEN_TOURNAMENTS, idle_seconds=TOURNAMENT_IDLE_SECONDS):
+        self.directory = directory
+        self.default_store = default_store
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self._stores = OrderedDict() # tournament id -> [BracketStore, last used (monotonic)]
+        self._lock = threading.Lock()
+
+    def get(self, tournament_id):
+        """Returns the store for a tournament, opening it if needed."""
+        if tournament_id == DEFAULT_TOURNAMENT:
+            return self.default_store
+        if not re.fullmatch(TOURNAMENT_ID_REGEX, tournament_id):
+            raise ValueError(f"Invalid tournament id: {tournament_id!r}")
+        now = time.monotonic()
+        with self._lock:
+            entry = self._stores.get(tournament_id)
+            if entry is None:
+                entry = self._stores[tournament_id] = [BracketStore(open_storage(tournament_id)), now]
+            else:
+                entry[1] = now
+                self._stores.move_to_end(tournament_id)
+            evicted = self._evict(now)
+        for store in evicted:
+            store.close()
+        return entry[0]
+
+    def open_stores(self):
+        """(tournament id, BracketStore) for every tournament held in memory."""
+        with self._lock:
+            return [(DEFAULT_TOURNAMENT, self.default_store)] + [(tid, entry[0]) for tid, entry in self._stores.items()]
+
+    def ids(self):
+        """
+        Every tournament with a bracket, in storage or only in memory so far.
+        A store held in memory without one, such as one opened by a request
+        for a mistyped id, doesn't count.
+        """
+        found = {DEFAULT_TOURNAMENT}
+        if STORAGE_BACKEND == "sqlite":
+            found.update(SqliteStorage.tournament_ids(SQLITE_FILE))
+        elif os.path.isdir(self.directory):
+            found.update(
+                name[:-len(".json")] for name in os.listdir(self.directory)
+                if name.endswith(".json") and re.fullmatch(TOURNAMENT_ID_REGEX, name[:-len(".json")])
+            )
+        with self._lock:
+            stores = [(tid, entry[0]) for tid, entry in self._stores.items()]
+        for tournament_id, store in stores:
+            # What's in memory is newer than storage, which may not have caught up yet.
+            if store.snapshot() is not None:
+                found.add(tournament_id)
+            else:
+                found.discard(tournament_id)
+        return sorted(found)
+
+    def flush_all(self):
+        self.default_store.flush()
+        with self._lock:
+            stores = [store for store, _ in self._stores.values()]
+        for store in stores:
+            store.flush()
+
+    def _evict(self, now):
+        evicted = []
+        for tournament_id, (store, last_used) in list(self._stores.items()):
+            if len(self._stores) <= self.max_open:
+                break
+            if now - last_used < self.idle_seconds or store.has_subscribers:
+                continue
+            del self._stores[tournament_id]
+            evicted.append(store)
+        return evicted
+
+
+bracket_store = BracketStore(open_storage(DEFAULT_TOURNAMENT), lock=bracket_lock)
+tournaments = TournamentRegistry(TOURNAMENTS_DIR, bracket_store)
+atexit.register(tournaments.flush_all)
+
+metrics.describe("tournaments_open", "gauge", "Tournaments held in memory.",
+                 lambda: [({}, len(tournaments.open_stores()))])
+metrics.describe("stream_subscribers", "gauge", "Clients following a tournament on /api/stream.",
+                 lambda: [({"tournament": tid}, store.subscriber_count) for tid, store in tournaments.open_stores()])
+metrics.describe("profiler_running", "gauge", "Whether the sampling profiler is on.",
+                 lambda: [({}, int(profiler.running))])
+
+
+# -----------------------------
+# Utility Functions
+# -----------------------------
+
+def parse_elapsed(value):
+    """
+    Turns a result as stored in JSON ("0:09:37.421486", "DNF", "DNF (votes)"
+    or None) into what a Match holds: integer microseconds, the DNF label
+    itself, or None.
+    """
+    if value is None or value == "null" or value == "":
+        return None
+    if isinstance(value, int) or value.startswith("DNF"):
+        return value
+    days = 0
+    if "day" in value: # str(timedelta) writes "1 day, 0:00:00" past 24 hours
+        day_part, value = value.split(", ")
+        days = int(day_part.split()[0])
+    h, m, s = value.split(":")
+    seconds, _, fraction = s.partition(".")
+    return ((days * 24 + int(h)) * 60 + int(m)) * 60 * 1_000_000 + int(seconds) * 1_000_000 + int(fraction.ljust(6, "0"))
+
+def format_elapsed(microseconds):
+    """The inverse of parse_elapsed for a time: the str(timedelta) the frontend expects."""
+    return str(timedelta(microseconds=microseconds))
+
+def result_rank(result):
+    """Orders results: the fastest time first, DNFs (including notes like "DNF (votes)") last."""
+    return result if isinstance(result, int) else float("inf")
+
+# The server clock: wall-clock time read once at startup, advanced by the
+# monotonic clock from then on, so NTP corrections or a changed system clock
+# mid-match can't stretch or shrink anyone's time.
+_CLOCK_ANCHOR_US = time.time_ns() // 1000
+_CLOCK_ANCHOR_NS = time.monotonic_ns()
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def server_time_us():
+    """The current server time, in integer microseconds since the Unix epoch."""
+    return _CLOCK_ANCHOR_US + (time.monotonic_ns() - _CLOCK_ANCHOR_NS) // 1000
+
+def format_server_time(microseconds):
+    """A server time as the ISO string (in HKT) the frontend and bracket files use."""
+    return (_EPOCH + timedelta(microseconds=microseconds)).astimezone(HKT_TZ).isoformat()
+
+def parse_server_time(value):
+    """The inverse of format_server_time; None stays None."""
+    if not value:
+        return None
+    if isinstance(value, int):
+        return value
+    return (datetime.fromisoformat(value) - _EPOCH) // timedelta(microseconds=1)
+
+def format_sse(event, data, event_id=None):
+    """Formats one server-sent event."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+def load_bracket(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Returns a read-only snapshot of a tournament's bracket, reading its file
+    only on first use. Use tournaments.get(tournament_id).transaction() to
+    make changes.
+    """
+    return tournaments.get(tournament_id).snapshot()
+
+def get_problems_by_difficulty():
+    """
+    Groups the problem markdown files by the difficulty prefix in their
+    filename (e.g., '1-easy.md', '2-medium.md'), using the problem catalog.
+    """
+    return {difficulty: list(files) for difficulty, files in problem_catalog.by_difficulty().items()}
+
+def save_bracket(bracket, tournament_id=DEFAULT_TOURNAMENT):
+    """Replaces a tournament's in-memory bracket and schedules a write to disk."""
+    tournaments.get(tournament_id).set(bracket)
+
+
+def curve_difficulty(curve, round_num):
+    """The difficulty for a round; rounds past the end of the curve use its last entry."""
+    return curve[min(round_num, len(curve)) - 1]
+
+def resolve_difficulty_curves(overrides=None):
+    """Merges per-request overrides (e.g. from create_bracket's payload) over DIFFICULTY_CURVES."""
+    curves = dict(DIFFICULTY_CURVES)
+    for kind, value in (overrides or {}).items():
+        if kind not in curves:
+            raise ValueError(f"Unknown difficulty curve '{kind}'. Expected one of: {', '.join(curves)}.")
+        if isinstance(curves[kind], list):
+            if not isinstance(value, list) or not value or not all(isinstance(d, int) for d in value):
+                raise ValueError(f"Difficulty curve '{kind}' must be a non-empty list of difficulties.")
+        elif not isinstance(value, int):
+            raise ValueError(f"Difficulty for '{kind}' must be a single difficulty.")
+        curves[kind] = value
+    return curves
+
+
+class ProblemShortage(ValueError):
+    """Raised when the problem pool can't cover a bracket. shortfalls maps difficulty -> problems missing."""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        details = ", ".join(f"{missing} more level {difficulty}" for difficulty, missing in sorted(shortfalls.items()))
+        super().__init__(
+            f"Not enough unique problems for this bracket: need {details}. "
+            f"Please add more problems to the /problems directory."
+        )
+
+
+def problem_demand(matches):
+    """Counts how many problems of each difficulty the matches need."""
+    demand = defaultdict(int)
+    for match in matches:
+        if match.problem_difficulty and not match.problem:
+            demand[match.problem_difficulty] += 1
+    return demand
+
+def plan_problems(matches, problems_by_difficulty):
+    """
+    Picks a distinct problem for every match that needs one, in a single pass
+    over the whole bracket. Checks every difficulty up front and raises
+    ProblemShortage with the exact shortfall for each, rather than failing
+    part-way through. Problems used least often in past brackets come first;
+    ties are broken randomly.
+    """
+    demand = problem_demand(matches)
+    shortfalls = {
+        difficulty: needed - len(problems_by_difficulty.get(difficulty, ()))
+        for difficulty, needed in demand.items()
+        if needed > len(problems_by_difficulty.get(difficulty, ()))
+    }
+    if shortfalls:
+        raise ProblemShortage(shortfalls)
+
+    pools = {}
+    for difficulty, needed in demand.items():
+        candidates = random.sample(list(problems_by_difficulty[difficulty]), len(problems_by_difficulty[difficulty]))
+        candidates.sort(key=problem_use_count) # Stable, so equally-used problems stay shuffled
+        pools[difficulty] = iter(candidates[:needed])
+    return pools
+
+def assign_problems(matches, problems_by_difficulty):
+    """Gives every match that needs a problem one of the planned problems."""
+    pools = plan_problems(matches, problems_by_difficulty)
+    for match in matches:
+        if match.problem_difficulty and not match.problem:
+            match.problem = next(pools[match.problem_difficulty])
+    return matches
+
+def problem_use_count(filename):
+    entry = problem_catalog.entries.get(filename)
+    return len(entry["used"]) if entry else 0
+
+class _HouseCounts:
+    """
+    How many participants of each house sit in every block of the draw, at
+    every level (a level-L block is 2^L neighbouring slots, i.e. everyone who
+    could meet by round L). This lets a swap of two participants be scored
+    in O(log n) instead of re-scoring the whole draw.
+    """
+
+    def __init__(self, house_at, levels, num_houses):
+        self.levels = levels
+        self.num_houses = num_houses
+        self.house_at = house_at # slot -> house id, or -1 for byes and N/A
+        self.counts = [None] + [[0] * (((len(house_at) - 1) >> level) + 1) * num_houses for level in range(1, levels + 1)]
+        for slot, house in enumerate(house_at):
+            if house >= 0:
+                for level in range(1, levels + 1):
+                    self.counts[level][(slot >> level) * num_houses + house] += 1
+
+        # Two participants who first meet in round r only both get there with
+        # probability 4^-(r-1) if every match is a coin flip, so that is the
+        # weight of a same-house pairing that meets in round r. In the hybrid
+        # draw, round levels+1 is the round-robin final.
+        self.weights = [0.0] + [4.0 ** -(r - 1) for r in range(1, levels + 2)]
+        per_house = defaultdict(int)
+        for house in house_at:
+            if house >= 0:
+                per_house[house] += 1
+        self.total_pairs = sum(c * (c - 1) // 2 for c in per_house.values())
+
+    def pairs_by_level(self):
+        """Same-house pairs who share a block, at each level."""
+        return [0] + [sum(c * (c - 1) // 2 for c in self.counts[level]) for level in range(1, self.levels + 1)]
+
+    def score(self):
+        """The expected number of same-house meetings over the whole bracket."""
+        shared = self.pairs_by_level()
+        score = 0.0
+        for r in range(1, self.levels + 1):
+            score += self.weights[r] * (shared[r] - shared[r - 1])
+        return score + self.weights[self.levels + 1] * (self.total_pairs - shared[self.levels])
+
+    def meetings_by_round(self):
+        """How many same-house pairs would first meet in each round."""
+        shared = self.pairs_by_level()
+        by_round = {r: shared[r] - shared[r - 1] for r in range(1, self.levels + 1)}
+        if self.total_pairs > shared[self.levels]:
+            by_round[self.levels + 1] = self.total_pairs - shared[self.levels]
+        return by_round
+
+    def swap_delta(self, a, b):
+        """The change in score if the participants in slots a and b swapped."""
+        ha, hb = self.house_at[a], self.house_at[b]
+        delta = 0.0
+        for level in range(1, self.levels + 1):
+            block_a, block_b = a >> level, b >> level
+            if block_a == block_b:
+                break # Same block here means the same block at every level above
+            counts = self.counts[level]
+            change = 0
+            if ha >= 0:
+                change += counts[block_b * self.num_houses + ha] - (counts[block_a * self.num_houses + ha] - 1)
+            if hb >= 0:
+                change += counts[block_a * self.num_houses + hb] - (counts[block_b * self.num_houses + hb] - 1)
+            # Moving pairs apart at this level pushes their meeting one round later
+            delta += change * (self.weights[level] - self.weights[level + 1])
+        return delta
+
+    def swap(self, a, b):
+        ha, hb = self.house_at[a], self.house_at[b]
+        for level in range(1, self.levels + 1):
+            block_a, block_b = a >> level, b >> level
+            if block_a == block_b:
+                break
+            counts = self.counts[level]
+            if ha >= 0:
+                counts[block_a * self.num_houses + ha] -= 1
+                counts[block_b * self.num_houses + ha] += 1
+            if hb >= 0:
+                counts[block_b * self.num_houses + hb] -= 1
+                counts[block_a * self.num_houses + hb] += 1
+        self.house_at[a], self.house_at[b] = hb, ha
+
+
+def _bit_reverse(i, bits):
+    return int(format(i, f"0{bits}b")[::-1], 2) if bits else 0
+
+def _bye_matches(num_matches, byes):
+    """Which first-round matches get a bye, spread through the draw in bit-reversed order."""
+    bits = (num_matches - 1).bit_length()
+    bye_matches = set()
+    for i in range(2 ** bits):
+        if len(bye_matches) == byes:
+            break
+        j = _bit_reverse(i, bits)
+        if j < num_matches:
+            bye_matches.add(j)
+    return bye_matches
+
+def _house_ids(participants_list_of_dicts):
+    """Maps each participant to a house number; N/A (no house) is -1 so it never counts as a clash."""
+    ids = {}
+    house_ids = []
+    for p in participants_list_of_dicts:
+        house = p.get("house")
+        if not house or house == "N/A":
+            house_ids.append(-1)
+        else:
+            house_ids.append(ids.setdefault(house, len(ids)))
+    return house_ids, max(len(ids), 1)
+
+def seed_draw(participants_list_of_dicts, size, levels, time_budget=None, rng=random):
+    """
+    Lays participants out over `size` first-round slots (slots 2i and 2i+1
+    meet in match i), with None for each bye, keeping people from the same
+    house apart for as many rounds as possible. `levels` is the number of
+    1v1 rounds the slots feed.
+
+    Each attempt starts from a house-spread layout: participants grouped by
+    house are dealt into slots in bit-reversed order, which puts members of
+    a house as far apart in the tree as possible. Random swaps that lower the
+    expected number of same-house meetings are then kept. Attempts restart
+    with a fresh shuffle until SEEDING_RESTARTS or time_budget (by default
+    SEEDING_TIME_BUDGET_SECONDS, looked up on each call) runs out.
+
+    Returns (slots, score), where score gives the expected number of
+    same-house meetings and how many same-house pairs first meet in each
+    round, so different draws can be compared.
+    """
+    n = len(participants_list_of_dicts)
+    num_matches = size // 2
+    bye_matches = _bye_matches(num_matches, size - n)
+    real_slots = [s for s in range(size) if not (s % 2 == 1 and s // 2 in bye_matches)]
+    bits = (size - 1).bit_length()
+    spread_slots = sorted(real_slots, key=lambda s: _bit_reverse(s, bits))
+    house_ids, num_houses = _house_ids(participants_list_of_dicts)
+
+    if time_budget is None:
+        time_budget = SEEDING_TIME_BUDGET_SECONDS
+    deadline = time.perf_counter() + time_budget
+    best = None
+    for attempt in range(SEEDING_RESTARTS):
+        # Group by house, largest house first, in a random order within each house.
+        order = list(range(n))
+        rng.shuffle(order)
+        house_sizes = defaultdict(int)
+        for i in order:
+            house_sizes[house_ids[i]] += 1
+        order.sort(key=lambda i: (-house_sizes[house_ids[i]], house_ids[i]))
+
+        occupant = [None] * size
+        for slot, i in zip(spread_slots, order):
+            occupant[slot] = i
+        counts = _HouseCounts([house_ids[i] if i is not None else -1 for i in occupant], levels, num_houses)
+        score = counts.score()
+
+        for _ in range(SEEDING_SWAPS_PER_PARTICIPANT * n):
+            if score <= 0 or time.perf_counter() > deadline:
+                break
+            a, b = rng.choice(real_slots), rng.choice(real_slots)
+            if counts.house_at[a] == counts.house_at[b]:
+                continue
+            delta = counts.swap_delta(a, b)
+            if delta < -1e-12:
+                counts.swap(a, b)
+                occupant[a], occupant[b] = occupant[b], occupant[a]
+                score += delta
+
+        score = counts.score() # Recomputed exactly, without the running sum's rounding
+        if best is None or score < best[0]:
+            best = (score, occupant, counts.meetings_by_round())
+        if score <= 0 or time.perf_counter() > deadline:
+            break
+
+    score, occupant, by_round = best
+    slots = [participants_list_of_dicts[i] if i is not None else None for i in occupant]
+    return slots, {"expected_same_house_meetings": round(score, 4), "same_house_pairs_by_round": by_round}
+
+def score_draw(slots, levels):
+    """Scores an existing first-round layout the same way seed_draw does."""
+    house_ids, num_houses = _house_ids([p or {} for p in slots])
+    counts = _HouseCounts([h if p else -1 for h, p in zip(house_ids, slots)], levels, num_houses)
+    return {"expected_same_house_meetings": round(counts.score(), 4), "same_house_pairs_by_round": counts.meetings_by_round()}
+
+def _new_match(bracket, round_num, difficulty, extra=None):
+    """
+    Adds an empty 1v1 match with the next match_num to the bracket. Its
+    problem is assigned by assign_problems() once the whole bracket is planned.
+    """
+    match = Match(len(bracket) + 1, difficulty, round_num, extra)
+    match.players = (None, None)
+    match.results = (None, None)
+    bracket.add(match)
+    return match
+
+def draw_size(n, base=1):
+    """The smallest base * 2^k (k >= 1) that fits n participants."""
+    size = base * 2
+    while size < n:
+        size *= 2
+    return size
+
+def _build_elimination_rounds(bracket, slots, curve, stop_at=1, extra=None):
+    """
+    Builds knockout rounds over the first-round slots, pairing the winners of
+    neighbouring matches, until stop_at matches are left in a round.
+    Returns the rounds as lists of matches.
+    """
+    current = []
+    for i in range(0, len(slots), 2):
+        match = _new_match(bracket, 1, curve_difficulty(curve, 1), extra)
+        match.players = tuple(bracket.participant_id(p) if p else None for p in slots[i:i + 2])
+        current.append(match)
+    rounds = [current]
+
+    while len(current) > stop_at:
+        round_num = len(rounds) + 1
+        next_round = []
+        for i in range(0, len(current), 2):
+            match = _new_match(bracket, round_num, curve_difficulty(curve, round_num), extra)
+            bracket.link(current[i].match_num, "winner", match.match_num)
+            bracket.link(current[i + 1].match_num, "winner", match.match_num)
+            next_round.append(match)
+        rounds.append(next_round)
+        current = next_round
+    return rounds
+
+def resolve_byes(bracket):
+    """
+    Marks every match that can only ever receive one participant (or none) as
+    a bye, so it needs no problem, and moves byes' participants straight on.
+    Matches are visited in match_num order, which always puts a match after
+    the matches that feed it, so this is a single linear pass.
+    """
+    entrants = {}
+    for match in bracket:
+        count = sum(1 for p in match.players[:2] if p is not None)
+        for source_num, edge in bracket.feeders(match.match_num):
+            # A bye still sends its one participant on, but never has a loser
+            if entrants[source_num] == 2 or (edge == "winner" and entrants[source_num] == 1):
+                count += 1
+        entrants[match.match_num] = count
+        if count < 2:
+            match.is_bye = True
+            match.problem_difficulty = None
+    advance_from(bracket, [m.match_num for m in bracket if m.is_bye])
+
+def generate_single_elim(participants_list_of_dicts, curves=DIFFICULTY_CURVES):
+    """
+    Generates a single-elimination bracket for any number of participants
+    (at least 2). The draw is padded to a power of two with byes.
+    """
+    n = len(participants_list_of_dicts)
+    if n < 2:
+        raise ValueError("Single elimination needs at least 2 participants.")
+
+    bracket = Bracket()
+    size = draw_size(n)
+    slots, bracket.seeding = seed_draw(participants_list_of_dicts, size, levels=size.bit_length() - 1)
+    rounds = _build_elimination_rounds(bracket, slots, curves["upper"])
+
+    # --- Add 3rd place playoff ---
+    if n >= 4:
+        # The semi-finals are the two matches that feed into the final match.
+        third_place = _new_match(bracket, len(rounds), curves["third_place"], {"is_third_place": True})
+        for semi_final in rounds[-2]:
+            bracket.link(semi_final.match_num, "loser", third_place.match_num)
+
+    resolve_byes(bracket)
+    return bracket
+
+def generate_double_elim(participants_list_of_dicts, curves=DIFFICULTY_CURVES):
+    """
+    Generates a double-elimination bracket for any number of participants
+    (at least 3). The upper bracket is padded to a power of two with byes;
+    lower bracket matches left without two entrants become byes as well.
+    """
+    n = len(participants_list_of_dicts)
+    if n < 3:
+        raise ValueError("Double elimination needs at least 3 participants.")
+
+    bracket = Bracket()
+
+    # --- 1. Upper Bracket ---
+    size = draw_size(n)
+    slots, bracket.seeding = seed_draw(participants_list_of_dicts, size, levels=size.bit_length() - 1)
+    upper_rounds = _build_elimination_rounds(bracket, slots, curves["upper"], extra={"bracket": "upper"})
+
+    # --- 2. Lower Bracket ---
+    # Round 1 pairs up the losers of upper round 1. After that, each upper
+    # round's losers drop in to play the lower bracket's survivors ("minor"
+    # rounds), and the survivors are then paired off ("major" rounds).
+    lower_round_num = 1
+    survivors = []
+    first_round_upper = upper_rounds[0]
+    for i in range(0, len(first_round_upper), 2):
+        match = _new_match(bracket, lower_round_num, curve_difficulty(curves["lower"], lower_round_num), {"bracket": "lower"})
+        bracket.link(first_round_upper[i].match_num, "loser", match.match_num)
+        bracket.link(first_round_upper[i + 1].match_num, "loser", match.match_num)
+        survivors.append(match)
+
+    for r, upper_round in enumerate(upper_rounds[1:], start=2):
+        lower_round_num += 1
+        # Alternate the order losers drop in, so early opponents don't meet again straight away.
+        dropping = upper_round if r % 2 else upper_round[::-1]
+        minor = []
+        for survivor, upper_match in zip(survivors, dropping):
+            match = _new_match(bracket, lower_round_num, curve_difficulty(curves["lower"], lower_round_num), {"bracket": "lower"})
+            bracket.link(survivor.match_num, "winner", match.match_num)
+            bracket.link(upper_match.match_num, "loser", match.match_num)
+            minor.append(match)
+        survivors = minor
+
+        if len(survivors) > 1:
+            lower_round_num += 1
+            major = []
+            for i in range(0, len(survivors), 2):
+                match = _new_match(bracket, lower_round_num, curve_difficulty(curves["lower"], lower_round_num), {"bracket": "lower"})
+                bracket.link(survivors[i].match_num, "winner", match.match_num)
+                bracket.link(survivors[i + 1].match_num, "winner", match.match_num)
+                major.append(match)
+            survivors = major
+
+    # --- 3. Grand Final ---
+    # participant1 is the winner of the upper bracket, participant2 the winner of the lower bracket
+    grand_final = _new_match(
+        bracket, len(upper_rounds) + 1, curves["grand_final"], {"is_grand_final": True, "bracket": "final"}
+    )
+    bracket.link(upper_rounds[-1][0].match_num, "winner", grand_final.match_num)
+    bracket.link(survivors[0].match_num, "winner", grand_final.match_num)
+
+    resolve_byes(bracket)
+    return bracket
+
+def generate_hybrid_elim(participants_list_of_dicts, curves=DIFFICULTY_CURVES):
+    """
+    Generates a bracket for any number of participants (at least 4).
+    Runs 1v1 rounds until 3 participants remain, then creates a 3-way
+    round-robin final. The draw is padded to 3 x a power of two with byes.
+    """
+    n = len(participants_list_of_dicts)
+    if n < 4:
+        raise ValueError("Hybrid elimination needs at least 4 participants.")
+
+    bracket = Bracket()
+    size = draw_size(n, base=3)
+    slots, bracket.seeding = seed_draw(participants_list_of_dicts, size, levels=(size // 3).bit_length() - 1)
+    rounds = _build_elimination_rounds(bracket, slots, curves["upper"], stop_at=3)
+    resolve_byes(bracket)
+
+    # --- Create 3-way Round-Robin Final ---
+    # These are the sub-matches of the final; the three finalists are placed by hand.
+    final_round_num = len(rounds) + 1
+    sub_matches = [
+        _new_match(bracket, final_round_num, curve_difficulty(curves["upper"], final_round_num))
+        for _ in range(3)
+    ]
+    bracket.add(Match(len(bracket) + 1, extra={
+        "match_type": "three_way_round_robin",
+        "sub_matches": [m.match_num for m in sub_matches], # Store match_nums, not objects
+        "winner": None # Overall winner
+    }))
+    return bracket
+
+
+# -----------------------------
+# Bracket Layout
+# -----------------------------
+
+def bracket_layout(matches):
+    """
+    Where each match goes when the bracket is drawn, so displays can place
+    them without following the winner_proceeds_to edges themselves:
+    {"columns": ..., "rows": ..., "matches": {match_num: {"column": ..., "row": ..., "section": ...}}}.
+    Columns count rounds from 0 at the left and rows count match heights
+    from 0 at the top. A match fed by others sits halfway between them, so
+    rows can be fractional. "section" is the part of the bracket a match
+    is drawn in: "main" and "third_place" for single elimination, "upper",
+    "lower" and "final" for double elimination, and "main" and
+    "round_robin" for hybrid, where the round-robin final and its three
+    sub-matches all share one position for the display to arrange them around.
+    """
+    layout = {}
+    round_robin = next((m for m in matches if (m.extra or {}).get("match_type") == "three_way_round_robin"), None)
+    if round_robin is not None:
+        sub_matches = round_robin.extra.get("sub_matches") or []
+        regular = [m for m in matches if m is not round_robin and m.match_num not in sub_matches]
+        rows = _tree_layout(regular, layout, 0, "main")
+        column = max((entry["column"] for entry in layout.values()), default=-1) + 1
+        for num in [round_robin.match_num, *sub_matches]:
+            layout[num] = {"column": column, "row": max(rows - 1, 0) / 2, "section": "round_robin"}
+    elif any(m.bracket == "lower" or (m.extra or {}).get("is_grand_final") for m in matches):
+        finals = [m for m in matches if m.bracket == "final" or (m.extra or {}).get("is_grand_final")]
+        upper = [m for m in matches if m.bracket != "lower" and m not in finals]
+        rows = _tree_layout(upper, layout, 0, "upper")
+        _tree_layout([m for m in matches if m.bracket == "lower"], layout, rows + 1, "lower") # A row's gap between them
+        for final in finals:
+            _place_after_feeders(final, matches, layout, "final")
+    else:
+        third_places = [m for m in matches if (m.extra or {}).get("is_third_place")]
+        _tree_layout([m for m in matches if m not in third_places], layout, 0, "main")
+        final = next((m for m in matches if m.winner_proceeds_to is None and m not in third_places), None)
+        for third_place in third_places:
+            # Drawn underneath the final, clear of its larger box
+            below = layout[final.match_num] if final is not None else {"column": 0, "row": -2}
+            layout[third_place.match_num] = {"column": below["column"], "row": below["row"] + 2, "section": "third_place"}
+
+    return {
+        "columns": max((entry["column"] for entry in layout.values()), default=-1) + 1,
+        "rows": math.ceil(max((entry["row"] for entry in layout.values()), default=-1) + 1),
+        "matches": layout,
+    }
+
+def _tree_layout(matches, layout, first_row, section):
+    """
+    Lays out one knockout tree. A match that no other in `matches` sends its
+    winner to takes the next row in column 0; any other goes one column to
+    the right of the matches that feed it, halfway between them. Relies on
+    a match always coming after the matches that feed it, as generated
+    brackets do. Returns the row after the last one taken.
+    """
+    nums = {m.match_num for m in matches}
+    feeders = defaultdict(list)
+    for match in matches:
+        if match.winner_proceeds_to in nums:
+            feeders[match.winner_proceeds_to].append(match.match_num)
+    next_row = first_row
+    for match in matches:
+        placed = [layout[num] for num in feeders[match.match_num] if num in layout]
+        if placed:
+            rows = [entry["row"] for entry in placed]
+            entry = {"column": max(entry["column"] for entry in placed) + 1, "row": (min(rows) + max(rows)) / 2}
+        else:
+            entry = {"column": 0, "row": next_row}
+            next_row += 1
+        entry["section"] = section
+        layout[match.match_num] = entry
+    return next_row
+
+def _place_after_feeders(match, matches, layout, section):
+    """Puts a match one column past the last of the matches that send their winners to it, halfway between them."""
+    placed = [layout[m.match_num] for m in matches if m.winner_proceeds_to == match.match_num and m.match_num in layout]
+    if placed:
+        rows = [entry["row"] for entry in placed]
+        column, row = max(entry["column"] for entry in placed) + 1, (min(rows) + max(rows)) / 2
+    else:
+        column, row = max((entry["column"] for entry in layout.values()), default=-1) + 1, 0
+    layout[match.match_num] = {"column": column, "row": row, "section": section}
+
+
+# -----------------------------
+# Problem Rendering
+# -----------------------------
+
+class RenderedProblem:
+    """The HTML for one problem, with its ETag and a gzipped copy made on first use."""
+
+    def __init__(self, html, mtime):
+        self.html = html.encode("utf-8")
+        self.mtime = mtime
+        self.etag = hashlib.sha1(self.html).hexdigest()[:16]
+        self.checked_at = time.monotonic()
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.html)
+        return self._gzipped
+
+
+class ProblemCache:
+    """
+    Rendered problem HTML keyed by filename. An entry is re-rendered when its
+    markdown file's mtime changes, which is checked at most every
+    PROBLEM_RECHECK_SECONDS, so a burst of requests for the same problem
+    costs one render and no disk access.
+    """
+
+    def __init__(self, problems_dir):
+        self.problems_dir = problems_dir
+        self._entries = {}
+        self._render_lock = threading.Lock()
+
+    def get(self, filename):
+        """Returns the RenderedProblem, or None if there is no such problem."""
+        entry = self._entries.get(filename)
+        if entry and time.monotonic() - entry.checked_at < PROBLEM_RECHECK_SECONDS:
+            metrics.inc("cache_requests_total", cache="problem", result="hit")
+            return entry
+        # Only one thread renders at a time; the others wait and reuse its result.
+        with self._render_lock:
+            entry = self._entries.get(filename)
+            if entry and time.monotonic() - entry.checked_at < PROBLEM_RECHECK_SECONDS:
+                metrics.inc("cache_requests_total", cache="problem", result="hit")
+                return entry
+            path = os.path.join(self.problems_dir, filename)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                self._entries.pop(filename, None)
+                return None
+            if entry and entry.mtime == mtime:
+                metrics.inc("cache_requests_total", cache="problem", result="hit")
+                entry.checked_at = time.monotonic()
+                return entry
+            metrics.inc("cache_requests_total", cache="problem", result="miss")
+            with metrics.timer("problem_render_duration_seconds"), open(path) as f:
+                entry = RenderedProblem(markdown.markdown(f.read()), mtime)
+            self._entries[filename] = entry
+            return entry
+
+    def prerender(self):
+        """Renders every markdown file in the problems directory."""
+        if not os.path.isdir(self.problems_dir):
+            return
+        for f in os.listdir(self.problems_dir):
+            if f.endswith(".md"):
+                self.get(f)
+
+
+problem_cache = ProblemCache(PROBLEMS_DIR)
+if PRERENDER_PROBLEMS:
+    problem_cache.prerender()
+
+
+# -----------------------------
+# Problem Catalog
+# -----------------------------
+
+class ProblemCatalog:
+    """
+    Metadata for every problem in PROBLEMS_DIR: difficulty, title, the assets
+    it references, a content hash and when it was last used in a bracket.
+    The catalog is kept in PROBLEM_CATALOG_FILE between runs. refresh() only
+    re-reads markdown files whose mtime or size has changed, and is run at
+    most every PROBLEM_RECHECK_SECONDS.
+    """
+
+    heading_regex = re.compile(r'^#+\s*(.+?)\s*$', re.MULTILINE)
+    asset_regex = re.compile(r'<img[^>]*\ssrc="([^"]+)"|!\[[^\]]*\]\(([^)\s]+)')
+
+    def __init__(self, problems_dir, path):
+        self.problems_dir = problems_dir
+        self.path = path
+        self.entries = {} # filename -> entry dict
+        self._by_difficulty = defaultdict(set)
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def by_difficulty(self):
+        """Returns {difficulty: set of filenames}."""
+        self.refresh()
+        return self._by_difficulty
+
+    def get(self, filename):
+        self.refresh()
+        return self.entries.get(filename)
+
+    def refresh(self, force=False):
+        if not force and self._checked_at is not None and time.monotonic() - self._checked_at < PROBLEM_RECHECK_SECONDS:
+            return
+        with self._lock:
+            if not os.path.exists(self.problems_dir):
+                os.makedirs(self.problems_dir) # Ensure directory exists
+            changed = False
+            seen = set()
+            for f in os.listdir(self.problems_dir):
+                # Assumes problem names like "1-problem-name.md"; others are ignored
+                if not f.endswith(".md") or not f[0].isdigit():
+                    continue
+                seen.add(f)
+                stat = os.stat(os.path.join(self.problems_dir, f))
+                entry = self.entries.get(f)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    continue
+                self._add(self._scan(f, stat, entry))
+                changed = True
+            for f in set(self.entries) - seen:
+                self._remove(f)
+                changed = True
+            self._checked_at = time.monotonic()
+            if changed:
+                self._save()
+
+    def record_usage(self, bracket):
+        """Notes that each problem in the bracket has just been used."""
+        used_at = datetime.now(HKT_TZ).isoformat()
+        with self._lock:
+            for match in bracket:
+                entry = self.entries.get(match.problem)
+                if entry:
+                    entry["used"].append({"at": used_at, "match_num": match.match_num})
+                    del entry["used"][:-PROBLEM_USAGE_HISTORY]
+            self._save()
+
+    def _scan(self, filename, stat, old_entry):
+        with open(os.path.join(self.problems_dir, filename), "rb") as f:
+            content = f.read()
+        text = content.decode("utf-8", errors="replace")
+        heading = self.heading_regex.search(text)
+        return {
+            "filename": filename,
+            "difficulty": int(filename[0]),
+            "title": heading.group(1) if heading else filename[1:-3],
+            "assets": [a or b for a, b in self.asset_regex.findall(text)],
+            "hash": hashlib.sha1(content).hexdigest(),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "used": old_entry["used"] if old_entry else [],
+        }
+
+    def _add(self, entry):
+        self._remove(entry["filename"])
+        self.entries[entry["filename"]] = entry
+        self._by_difficulty[entry["difficulty"]].add(entry["filename"])
+
+    def _remove(self, filename):
+        entry = self.entries.pop(filename, None)
+        if entry:
+            self._by_difficulty[entry["difficulty"]].discard(filename)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                for entry in json.load(f):
+                    self._add(entry)
+        except Exception:
+            # A damaged catalog is simply rebuilt from the problem files.
+            self.entries = {}
+            self._by_difficulty = defaultdict(set)
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self.entries.values()), f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+problem_catalog = ProblemCatalog(PROBLEMS_DIR, PROBLEM_CATALOG_FILE)
+
+
+# -----------------------------
+# Advancement
+# -----------------------------
+
+def match_outcome(match):
+    """
+    Returns (winner, loser) participant ids once both results are in,
+    otherwise None. A bye is decided as soon as its one participant arrives,
+    and has no loser.
+    """
+    if match.is_bye:
+        entrant = next((p for p in match.players[:2] if p is not None), None)
+        return (entrant, None) if entrant is not None else None
+    r1, r2 = match.result(1), match.result(2)
+    if r1 is None or r2 is None:
+        return None
+    if result_rank(r1) < result_rank(r2):
+        return match.player(1), match.player(2)
+    return match.player(2), match.player(1)
+
+def advance_from(bracket, match_nums):
+    """
+    Sends the winner and loser of each decided match in match_nums on to the
+    matches they proceed to, and returns the match_nums that were filled in.
+    A participant sent into a bye carries straight on through it.
+    The slot a match feeds is chosen the first time it is decided and stored
+    on the match as winner_slot / loser_slot. Advancing the same match again
+    (e.g. after a reset) writes to that same slot, so it can never place a
+    participant twice.
+    """
+    filled = set()
+    pending = deque(dict.fromkeys(match_nums)) # De-duplicate, keeping order
+    while pending:
+        match_num = pending.popleft()
+        match = bracket.get(match_num)
+        outcome = match_outcome(match) if match else None
+        if not outcome:
+            continue
+        for edge, participant in zip(("winner", "loser"), outcome):
+            target = bracket.get(getattr(match, f"{edge}_proceeds_to"))
+            if not target or participant is None:
+                continue
+            slot = getattr(match, f"{edge}_slot")
+            if slot is None:
+                slot = _first_empty_slot(target, 4 if edge == "winner" else 2)
+                if slot is None:
+                    continue
+                bracket.touch(match_num)
+                setattr(match, f"{edge}_slot", slot)
+            bracket.touch(target.match_num)
+            target.set_player(slot, participant)
+            filled.add(target.match_num)
+            if target.is_bye:
+                pending.append(target.match_num)
+    return filled
+
+def _first_empty_slot(match, max_slots):
+    for i in range(1, max_slots + 1):
+        if match.player(i) is None:
+            return i
+    return None
+
+def backfill_advancement_slots(bracket):
+    """
+    Brackets saved before slots were recorded only hold the placed participants.
+    Work out which slot each decided match fed, once, so that later
+    advancements from those matches overwrite rather than duplicate.
+    """
+    for match in bracket:
+        outcome = match_outcome(match)
+        if not outcome:
+            continue
+        for edge, participant in zip(("winner", "loser"), outcome):
+            target = bracket.get(getattr(match, f"{edge}_proceeds_to"))
+            if not target or getattr(match, f"{edge}_slot") is not None or participant is None:
+                continue
+            name = bracket.participants[participant]["name"]
+            for i, placed in enumerate(target.players, start=1):
+                if placed is not None and bracket.participants[placed]["name"] == name:
+                    setattr(match, f"{edge}_slot", i)
+                    break
+
+
+# -----------------------------
+# Standings
+# -----------------------------
+
+def match_winner(match):
+    """
+    The participant id who won a match, or None while it is undecided.
+    Byes don't count as wins. A final with more than two participants is won
+    by the fastest once everyone has a result.
+    """
+    if match.is_bye:
+        return None
+    if sum(1 for p in match.players if p is not None) > 2:
+        entries = [(result_rank(r), p) for p, r in zip(match.players, match.results) if p is not None]
+        if any(r is None for p, r in zip(match.players, match.results) if p is not None):
+            return None
+        return min(entries)[1]
+    outcome = match_outcome(match)
+    return outcome[0] if outcome else None
+
+
+class _Tally:
+    """Running totals for one house or one participant."""
+
+    __slots__ = ("wins", "losses", "solves", "dnfs", "total_us", "times")
+
+    def __init__(self):
+        self.wins = self.losses = self.solves = self.dnfs = self.total_us = 0
+        self.times = [] # Sorted (elapsed_us, match_num, participant id) of every solve
+
+    def to_dict(self, participants):
+        fastest = self.times[0] if self.times else None
+        return {
+            "wins": self.wins,
+            "losses": self.losses,
+            "solves": self.solves,
+            "dnfs": self.dnfs,
+            "average_time": format_elapsed(self.total_us // self.solves) if self.solves else None,
+            "fastest": _solve_dict(fastest, participants) if fastest else None,
+        }
+
+
+def _solve_dict(solve, participants):
+    elapsed, match_num, participant_id = solve
+    participant = participants[participant_id]
+    return {"name": participant["name"], "house": participant.get("house"), "time": format_elapsed(elapsed), "match_num": match_num}
+
+
+class Standings:
+    """
+    Per-house and per-participant totals (wins, losses, solves, DNFs,
+    average and fastest times) for a bracket. They are kept up to date by
+    taking back each changed match's old contribution and adding its new one
+    (apply()), so a completion costs only the matches it touched, however
+    large the bracket. Solve times are kept sorted so the fastest can still
+    be found after a reset takes one away.
+    """
+
+    def __init__(self, participants=None, matches=()):
+        self.participants = participants if participants is not None else [] # The bracket's participant table
+        self.houses = defaultdict(_Tally)
+        self.players = defaultdict(_Tally) # participant id -> _Tally
+        self.fastest = [] # Every solve, sorted, as in _Tally.times
+        for match in matches:
+            self._add(match, 1)
+
+    def apply(self, old, new):
+        """Replaces one match's contribution: old and new are the match before and after (or None)."""
+        if old is not None:
+            self._add(old, -1)
+        if new is not None:
+            self._add(new, 1)
+
+    def _tallies(self, participant_id):
+        house = self.participants[participant_id].get("house") or "N/A"
+        return self.players[participant_id], self.houses[house]
+
+    def _add(self, match, sign):
+        for participant_id, result in zip(match.players, match.results):
+            if participant_id is None or result is None:
+                continue
+            tallies = self._tallies(participant_id)
+            if isinstance(result, int):
+                solve = (result, match.match_num, participant_id)
+                for tally in tallies:
+                    tally.solves += sign
+                    tally.total_us += sign * result
+                for times in (tallies[0].times, tallies[1].times, self.fastest):
+                    if sign > 0:
+                        bisect.insort(times, solve)
+                    else:
+                        times.remove(solve)
+            else:
+                for tally in tallies:
+                    tally.dnfs += sign
+        winner = match_winner(match)
+        if winner is not None:
+            for tally in self._tallies(winner):
+                tally.wins += sign
+            for participant_id in match.players:
+                if participant_id is not None and participant_id != winner:
+                    for tally in self._tallies(participant_id):
+                        tally.losses += sign
+
+    def to_dict(self):
+        """
+        The standings as /api/standings returns them, houses ranked by wins
+        then solves, and participants by wins then fastest solve. Remaining
+        ties go by house name or participant id, so the order depends only on
+        the results and not on the order they came in.
+        """
+        participants = self.participants
+        houses = sorted(
+            ((house, tally) for house, tally in self.houses.items() if tally.wins or tally.losses or tally.solves or tally.dnfs),
+            key=lambda item: (-item[1].wins, -item[1].solves, item[0]),
+        )
+        leaders = heapq.nsmallest(
+            STANDINGS_LEADERBOARD,
+            (item for item in self.players.items() if item[1].wins or item[1].solves),
+            key=lambda item: (-item[1].wins, item[1].times[0][0] if item[1].times else float("inf"), item[0]),
+        )
+        return {
+            "houses": [dict(house=house, **tally.to_dict(participants)) for house, tally in houses],
+            "leaderboard": [
+                dict(name=participants[pid]["name"], house=participants[pid].get("house"), **tally.to_dict(participants))
+                for pid, tally in leaders
+            ],
+            "fastest": [_solve_dict(solve, participants) for solve in self.fastest[:STANDINGS_FASTEST]],
+        }
+
+
+# -----------------------------
+# Participants
+# -----------------------------
+
+# A line of a participant list: the name, then the house in parentheses.
+PARTICIPANT_LINE_REGEX = re.compile(r"^(?P<name>.*?)\s*\((?P<house>[^()]*)\)\s*$")
+
+def participants_path(tournament_id, own=False):
+    """
+    Where a tournament's participant list is kept. Other tournaments read
+    PARTICIPANTS_FILE until they are given a list of their own; with own set,
+    this is where that list goes.
+    """
+    if tournament_id == DEFAULT_TOURNAMENT:
+        return PARTICIPANTS_FILE
+    path = os.path.join(TOURNAMENTS_DIR, tournament_id + ".participants.txt")
+    return path if own or os.path.exists(path) else PARTICIPANTS_FILE
+
+def format_participant(participant):
+    """The line for a participant in a participant list, e.g. "Ryan (Y)"."""
+    return f"{participant['name']} ({participant['house']})"
+
+
+class ParticipantList:
+    """
+    Validates and de-duplicates participants as they are read, one record at
+    a time, so a list of any size costs only a key per participant.
+    Participants are the same if they have the same name, ignoring case and
+    runs of whitespace, and the same house (there are two Ryans, in
+    different houses); a repeat is dropped as a duplicate. Errors and
+    duplicates are reported by line (or, for a JSON array, by item), keeping
+    the first IMPORT_MAX_ERRORS of each.
+    """
+
+    def __init__(self):
+        self.seen = {} # (name key, house) -> line first seen on, or None if already registered
+        self.count = 0
+        self.errors = []
+        self.error_count = 0
+        self.duplicates = []
+        self.duplicate_count = 0
+
+    def add(self, line, name, house, error=None):
+        """Checks one record and returns it as {"name": ..., "house": ...}, or None if it is rejected."""
+        if error is None:
+            name, house, error = _validate_participant(name, house)
+        if error is not None:
+            self.error(line, error)
+            return None
+        key = (name.casefold(), house)
+        if key in self.seen:
+            self.duplicate_count += 1
+            if len(self.duplicates) < IMPORT_MAX_ERRORS:
+                self.duplicates.append({"line": line, "name": name, "house": house, "duplicate_of": self.seen[key]})
+            return None
+        self.seen[key] = line
+        self.count += 1
+        return {"name": name, "house": house}
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def summary(self):
+        return {
+            "imported": self.count,
+            "errors": self.errors,
+            "error_count": self.error_count,
+            "duplicates": self.duplicates,
+            "duplicate_count": self.duplicate_count,
+        }
+
+
+def _validate_participant(name, house):
+    """Returns (name, house, None) tidied up, or (None, None, error message)."""
+    if not isinstance(name, str):
+        return None, None, "Missing name"
+    if house is not None and not isinstance(house, str):
+        return None, None, "House must be a string"
+    name = " ".join(name.split())
+    if not name:
+        return None, None, "Missing name"
+    if len(name) > MAX_PARTICIPANT_NAME_LENGTH:
+        return None, None, f"Name is longer than {MAX_PARTICIPANT_NAME_LENGTH} characters"
+    if not name.isprintable():
+        return None, None, "Name contains control characters"
+    house = (house or "").strip().upper() or "N/A"
+    if house != "N/A" and house not in HOUSES:
+        return None, None, f"Unknown house {house!r} (expected one of {', '.join(HOUSES)} or N/A)"
+    return name, house, None
+
+
+def _read_lines(stream):
+    """
+    Yields (line number, text, error) for each line of a byte stream,
+    decoding one line at a time. A line that is too long or isn't UTF-8
+    comes back as (line number, None, error) and the rest still follow.
+    """
+    line_num = 0
+    while True:
+        raw = stream.readline(MAX_IMPORT_LINE_BYTES + 1)
+        if not raw:
+            return
+        line_num += 1
+        if len(raw) > MAX_IMPORT_LINE_BYTES:
+            while raw and not raw.endswith(b"\n"):
+                raw = stream.readline(MAX_IMPORT_LINE_BYTES)
+            yield line_num, None, f"Line is longer than {MAX_IMPORT_LINE_BYTES} bytes"
+            continue
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            yield line_num, None, "Not valid UTF-8"
+            continue
+        if line_num == 1:
+            text = text.lstrip("\ufeff")
+        yield line_num, text.rstrip("\r\n"), None
+
+def _text_records(stream):
+    """Records from a participants.txt style list: "Name (H)" per line, the house being optional."""
+    for line, text, error in _read_lines(stream):
+        if error is not None:
+            yield line, None, None, error
+        elif text.strip():
+            match = PARTICIPANT_LINE_REGEX.match(text)
+            if match:
+                yield line, match.group("name"), match.group("house"), None
+            else:
+                yield line, text, None, None
+
+def _csv_records(stream):
+    """
+    Records from CSV, one participant per row. The first row is taken as a
+    header if it has a "name" column (and maybe a "house" one); otherwise the
+    columns are name then house.
+    """
+    columns = None
+    for line, text, error in _read_lines(stream):
+        if error is not None:
+            yield line, None, None, error
+            continue
+        if not text.strip():
+            continue
+        try:
+            row = next(csv.reader([text]))
+        except csv.Error as e:
+            yield line, None, None, f"Invalid CSV: {e}"
+            continue
+        if columns is None:
+            header = [cell.strip().casefold() for cell in row]
+            if "name" in header:
+                columns = (header.index("name"), header.index("house") if "house" in header else None)
+                continue
+            columns = (0, 1)
+        name_col, house_col = columns
+        name = row[name_col] if name_col < len(row) else None
+        house = row[house_col] if house_col is not None and house_col < len(row) else None
+        yield line, name, house, None
+
+def _record_fields(value):
+    """(name, house, error) for one JSON record: a name, or {"name": ..., "house": ...}."""
+    if isinstance(value, str):
+        return value, None, None
+    if isinstance(value, dict):
+        return value.get("name"), value.get("house"), None
+    return None, None, "Expected a name or {\"name\": ..., \"house\": ...}"
+
+def _ndjson_records(stream):
+    """Records from newline-delimited JSON, one per line."""
+    for line, text, error in _read_lines(stream):
+        if error is not None:
+            yield line, None, None, error
+            continue
+        if not text.strip():
+            continue
+        try:
+            value = json.loads(text)
+        except ValueError as e:
+            yield line, None, None, f"Invalid JSON: {e}"
+            continue
+        yield (line, *_record_fields(value))
+
+def _json_records(stream, chunk_size=64 * 1024):
+    """
+    Records from a JSON array, parsed a chunk at a time rather than read
+    whole. The "line" of each record is its position in the array. Raises
+    ValueError if the document itself isn't a well-formed array, or an item
+    runs past MAX_IMPORT_LINE_BYTES, since nothing after that point can be
+    trusted.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        try:
+            buf = buf[pos:] + text_decoder.decode(chunk, final=eof)
+        except UnicodeDecodeError:
+            raise ValueError("The upload is not valid UTF-8") from None
+        pos = 0
+
+    def next_char():
+        # Skips whitespace and returns the next character, or "" at the end.
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos] if pos < len(buf) else ""
+            fill()
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array of participants")
+    pos += 1
+    item = 0
+    if next_char() == "]":
+        return
+    while True:
+        item += 1
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                reason = getattr(e, "msg", e) # Not a JSONDecodeError for e.g. too many digits
+                if eof:
+                    raise ValueError(f"Invalid JSON in item {item}: {reason}") from None
+                if len(buf) - pos > MAX_IMPORT_LINE_BYTES:
+                    # Reading on for its end could mean reading the whole upload.
+                    raise ValueError(
+                        f"Item {item} is invalid or longer than {MAX_IMPORT_LINE_BYTES} bytes: {reason}"
+                    ) from None
+                fill()
+                continue
+            # A value that runs right to the end of what has been read may be
+            # cut short (e.g. a number), so read on before trusting it.
+            if end == len(buf) and not eof:
+                if end - pos > MAX_IMPORT_LINE_BYTES:
+                    raise ValueError(f"Item {item} is longer than {MAX_IMPORT_LINE_BYTES} bytes")
+                fill()
+                continue
+            too_long = end - pos > MAX_IMPORT_LINE_BYTES
+            pos = end
+            break
+        if too_long:
+            # Came in whole with the last chunk; skipped like an overlong line.
+            yield item, None, None, f"Item is longer than {MAX_IMPORT_LINE_BYTES} bytes"
+        else:
+            yield (item, *_record_fields(value))
+        separator = next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected , or ] after item {item}")
+        pos += 1
+        next_char()
+
+PARTICIPANT_FORMATS = {
+    "text": _text_records,
+    "csv": _csv_records,
+    "ndjson": _ndjson_records,
+    "json": _json_records,
+}
+
+def read_participants(path):
+    """
+    Reads a participant list file. Returns (participants, checked), where
+    checked is the ParticipantList holding any errors and duplicates.
+    """
+    checked = ParticipantList()
+    participants = []
+    with open(path, "rb") as f:
+        for record in _text_records(f):
+            participant = checked.add(*record)
+            if participant is not None:
+                participants.append(participant)
+    return participants, checked
+
+def import_participants(records, path, append_to=None, skip_invalid=False):
+    """
+    Writes the participants in records (as yielded by one of the
+    PARTICIPANT_FORMATS) to the participant list at path, after those of the
+    list at append_to if one is given. They are streamed to a temporary file
+    that only replaces the list once every record has been read, and only
+    if none were invalid unless skip_invalid is set. Returns the
+    ParticipantList with what was imported, rejected and dropped.
+    """
+    checked = ParticipantList()
+    tmp_path = path + ".tmp"
+    with participants_lock:
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                if append_to and os.path.exists(append_to):
+                    existing, _ = read_participants(append_to)
+                    for participant in existing:
+                        checked.seen[(participant["name"].casefold(), participant["house"])] = None
+                        out.write(format_participant(participant) + "\n")
+                for record in records:
+                    participant = checked.add(*record)
+                    if participant is not None:
+                        out.write(format_participant(participant) + "\n")
+            if checked.error_count and not skip_invalid:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return checked
+
+
+# -----------------------------
+# Judging
+# -----------------------------
+
+class TestCase:
+    """
+    One input and its expected output. The input is kept as bytes, ready to
+    write to a submission's stdin, unless it is larger than
+    JUDGE_STREAM_INPUT_BYTES, in which case input_path names the file the
+    submission reads it from instead. The expected output is kept as the
+    lines outputs_match() compares. Hidden cases never show their details to
+    contestants.
+    """
+
+    __slots__ = ("name", "input", "input_path", "expected", "hidden")
+
+    def __init__(self, name, input, expected_output, hidden, input_path=None):
+        self.name = name
+        self.input = input
+        self.input_path = input_path
+        self.expected = output_lines(expected_output)
+        self.hidden = hidden
+
+
+# A problem's examples: "### Input:" or "### Output:" followed by an indented block.
+EXAMPLE_HEADING_REGEX = re.compile(r"^#+\s*(?:Sample\s+|Example\s+)?(Input|Output)\s*:?\s*$", re.IGNORECASE)
+
+def parse_examples(text):
+    """The (input, output) pairs from a problem's markdown, in order."""
+    blocks = {"input": [], "output": []}
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        heading = EXAMPLE_HEADING_REGEX.match(lines[i])
+        i += 1
+        if not heading:
+            continue
+        while i < len(lines) and not lines[i].strip():
+            i += 1
+        block = []
+        if i < len(lines) and lines[i].lstrip().startswith("```"):
+            i += 1
+            while i < len(lines) and not lines[i].lstrip().startswith("```"):
+                block.append(lines[i])
+                i += 1
+            i += 1
+        elif i < len(lines) and lines[i].startswith(("    ", "\t")):
+            while i < len(lines) and (lines[i].startswith(("    ", "\t")) or not lines[i].strip()):
+                block.append(lines[i][4:] if lines[i].startswith("    ") else lines[i][1:])
+                i += 1
+        else:
+            # Some examples are written as a plain paragraph instead.
+            while i < len(lines) and lines[i].strip() and not lines[i].startswith("#"):
+                block.append(lines[i])
+                i += 1
+        while block and not block[-1].strip():
+            block.pop()
+        blocks[heading.group(1).lower()].append("\n".join(block) + "\n")
+    return list(zip(blocks["input"], blocks["output"]))
+
+def output_lines(text):
+    """An output as outputs_match() compares it: its lines without trailing whitespace or trailing blank lines."""
+    lines = [line.rstrip() for line in text.splitlines()]
+    while lines and not lines[-1]:
+        lines.pop()
+    return tuple(lines)
+
+def outputs_match(actual, case):
+    """Whether a submission's output is the one a TestCase expects."""
+    return output_lines(actual) == case.expected
+
 
-# HKT is UTC+8
-HKT_TZ = timezone(timedelta(hours=8))
+class TestCaseStore:
+    """
+    The test cases for every problem, read and parsed once and then kept in
+    memory. A problem's cases are its hidden ones from
+    PROBLEM_TESTS_DIR/<problem name>/, each a <case>.in file with a matching
+    <case>.out, or failing those the examples in its markdown (a problem
+    whose examples allow more than one answer needs hidden cases).
 
+    Cases are stored by a hash of the files they came from, so problems with
+    the same content share one copy. Like ProblemCache, each problem's files
+    are checked for changes (by mtime and size) at most every
+    PROBLEM_RECHECK_SECONDS, and only one thread loads at a time, so when a
+    round starts and every match needs the same problems at once, each is
+    loaded once.
+    """
 
-# -----------------------------
-# Utility Functions
-# -----------------------------
+    def __init__(self, problems_dir, tests_dir):
+        self.problems_dir = problems_dir
+        self.tests_dir = tests_dir
+        self._problems = {} # problem -> [file signature, content hash, checked at (monotonic)]
+        self._cases = {} # content hash -> list of TestCase
+        self._lock = threading.Lock()
 
-def parse_time(time_str):
-    if not time_str or time_str in ["DNF", "null"]:
-        return float('inf') # Treat DNF or None as an infinitely large time
-    h, m, s = time_str.split(":")
-    return float(h) * 3600 + float(m) * 60 + float(s)
+    def get(self, problem):
+        """Returns the problem's list of TestCases (empty if it has none)."""
+        entry = self._problems.get(problem)
+        if entry and time.monotonic() - entry[2] < PROBLEM_RECHECK_SECONDS:
+            metrics.inc("cache_requests_total", cache="test_cases", result="hit")
+            return self._cases[entry[1]]
+        with self._lock:
+            entry = self._problems.get(problem)
+            if entry and time.monotonic() - entry[2] < PROBLEM_RECHECK_SECONDS:
+                metrics.inc("cache_requests_total", cache="test_cases", result="hit")
+                return self._cases[entry[1]]
+            signature = self._signature(problem)
+            if entry and entry[0] == signature:
+                metrics.inc("cache_requests_total", cache="test_cases", result="hit")
+                entry[2] = time.monotonic()
+                return self._cases[entry[1]]
+            metrics.inc("cache_requests_total", cache="test_cases", result="miss")
+            content_hash, cases = self._load(problem)
+            self._cases.setdefault(content_hash, cases)
+            self._problems[problem] = [signature, content_hash, time.monotonic()]
+            # Drop any cases no problem refers to any more.
+            in_use = {entry[1] for entry in self._problems.values()}
+            for unused in set(self._cases) - in_use:
+                del self._cases[unused]
+            return self._cases[content_hash]
 
-def load_bracket():
-    if not os.path.exists(BRACKET_FILE):
-        return None
+    def _case_dir(self, problem):
+        return os.path.join(self.tests_dir, os.path.splitext(problem)[0])
+
+    def _signature(self, problem):
+        """(name, mtime, size) of the markdown and every file in the problem's tests directory."""
+        paths = [os.path.join(self.problems_dir, problem)]
+        case_dir = self._case_dir(problem)
+        if os.path.isdir(case_dir):
+            paths.extend(os.path.join(case_dir, name) for name in sorted(os.listdir(case_dir)))
+        signature = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self, problem):
+        """Reads a problem's cases and returns (content hash, cases)."""
+        content_hash = hashlib.sha1()
+        cases = []
+        case_dir = self._case_dir(problem)
+        if os.path.isdir(case_dir):
+            for name in sorted(os.listdir(case_dir)):
+                base, ext = os.path.splitext(name)
+                in_path, out_path = os.path.join(case_dir, name), os.path.join(case_dir, base + ".out")
+                if ext != ".in" or not os.path.exists(out_path):
+                    continue
+                content_hash.update(base.encode("utf-8") + b"\0")
+                if os.path.getsize(in_path) > JUDGE_STREAM_INPUT_BYTES:
+                    # Hashed a block at a time and left on disk for the submission to read.
+                    given = None
+                    with open(in_path, "rb") as f:
+                        for block in iter(partial(f.read, 1024 * 1024), b""):
+                            content_hash.update(block)
+                else:
+                    with open(in_path, "rb") as f:
+                        given = f.read()
+                    content_hash.update(given)
+                with open(out_path, "rb") as f:
+                    expected = f.read()
+                content_hash.update(b"\0" + expected + b"\0")
+                cases.append(TestCase(base, given, expected.decode("utf-8", errors="replace"), True,
+                                      input_path=in_path if given is None else None))
+        if cases:
+            return "hidden:" + content_hash.hexdigest(), cases
+
+        try:
+            with open(os.path.join(self.problems_dir, problem), "rb") as f:
+                content = f.read()
+        except OSError:
+            return "none", []
+        examples = parse_examples(content.decode("utf-8", errors="replace"))
+        cases = [
+            TestCase(f"Example {i}", given.encode("utf-8"), expected, False)
+            for i, (given, expected) in enumerate(examples, start=1)
+        ]
+        return "examples:" + hashlib.sha1(content).hexdigest(), cases
+
+
+# Run in the judging interpreter before the submission: applies the
+# resource limits it is given on the command line, then runs the code as
+# __main__. Limits are left off where the OS has no resource module.
+JUDGE_BOOTSTRAP = """
+import sys, runpy
+try:
+    import resource
+except ImportError:
+    resource = None
+cpu, memory, output = (int(v) for v in sys.argv[1:4])
+if resource is not None:
+    for limit, value in ((resource.RLIMIT_CPU, cpu), (resource.RLIMIT_AS, memory), (resource.RLIMIT_FSIZE, output), (resource.RLIMIT_NPROC, 0), (resource.RLIMIT_CORE, 0)):
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+sys.argv = sys.argv[4:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+# Run by the judging interpreter in front of JUDGE_BOOTSTRAP to sandbox it:
+#   python -I -c JUDGE_SANDBOX <run dir> <scratch bytes> <paths...> -- <command...>
+# In new user, mount, network, IPC, UTS and PID namespaces it mounts the
+# scratch space at <run dir>/root, binds the paths read-only into it along
+# with /work holding <run dir>/solution.py, and makes it the root directory.
+# Then it runs the command as an unprivileged user of the namespace, which
+# leaves it no capabilities, and passes on how it ended. Exits with
+# SANDBOX_FAILED, saying why on stderr, if the sandbox couldn't be set up.
+SANDBOX_FAILED = 125
+JUDGE_SANDBOX = """
+import ctypes, os, resource, shutil, signal, sys
+run_dir, scratch = sys.argv[1], int(sys.argv[2])
+split = sys.argv.index("--")
+paths, command = sys.argv[3:split], sys.argv[split + 1:]
+NEWNS, NEWUTS, NEWIPC, NEWUSER, NEWPID, NEWNET = 0x20000, 0x4000000, 0x8000000, 0x10000000, 0x20000000, 0x40000000
+RDONLY, NOSUID, NODEV, NOEXEC, REMOUNT, BIND, REC, PRIVATE = 1, 2, 4, 8, 32, 4096, 16384, 1 << 18
+
+def check(result, what):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"{what}: {os.strerror(errno)}")
 
+def mount(source, target, fstype, flags, data=None, what="mount"):
+    encode = lambda v: v.encode() if v is not None else None
+    check(libc.mount(encode(source), encode(target), encode(fstype), flags, encode(data)), f"{what} {target}")
+
+def bind(path, root):
+    target = root + path
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.islink(path):
+        os.symlink(os.readlink(path), target)
+        return
+    if os.path.isdir(path):
+        os.makedirs(target, exist_ok=True)
+    else:
+        open(target, "w").close()
+    mount(path, target, None, BIND | REC)
+    # A bind made read-only has to keep the flags of the mount it came from
+    kept = {os.ST_NOSUID: NOSUID, os.ST_NODEV: NODEV, os.ST_NOEXEC: NOEXEC, os.ST_NOATIME: 1024, os.ST_NODIRATIME: 2048, os.ST_RELATIME: 1 << 21}
+    flags = sum(flag for st, flag in kept.items() if os.statvfs(path).f_flag & st)
+    mount(None, target, None, REMOUNT | BIND | RDONLY | flags, what="remount")
+
+try:
+    libc = ctypes.CDLL(None, use_errno=True)
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    uid, gid = os.getuid(), os.getgid()
+    check(libc.unshare(NEWUSER | NEWNS | NEWNET | NEWIPC | NEWUTS | NEWPID), "unshare")
+    # Seen as user 1000 inside, which holds no capabilities once it runs the command
+    for name, text in (("setgroups", "deny"), ("uid_map", f"1000 {uid} 1"), ("gid_map", f"1000 {gid} 1")):
+        with open(f"/proc/self/{name}", "w") as f:
+            f.write(text)
+except Exception as e: # Not Linux, or no user namespaces
+    print(f"sandbox: {e}", file=sys.stderr)
+    sys.exit(125)
+
+# The first process in the new PID namespace sets it up, runs the command
+# in a child (as its init, the command would be spared signals such as
+# SIGXCPU) and reports how that ended down a pipe. Once it exits, anything
+# the command left running is killed.
+report_r, report_w = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.close(report_r)
     try:
-        with open(BRACKET_FILE) as f:
-            return json.load(f)
-    except Exception:
-        return None
+        mount(None, "/", None, REC | PRIVATE)
+        root = os.path.join(run_dir, "root")
+        mount("tmpfs", root, "tmpfs", NOSUID | NODEV, f"size={scratch},mode=755")
+        for path in paths:
+            if os.path.lexists(path):
+                bind(path, root)
+        for name in ("work", "tmp"):
+            os.mkdir(os.path.join(root, name), 0o1777)
+        shutil.copyfile(os.path.join(run_dir, "solution.py"), os.path.join(root, "work", "solution.py"))
+        os.chroot(root)
+        os.chdir("/work")
+        check(libc.prctl(38, 1, 0, 0, 0), "no_new_privs") # PR_SET_NO_NEW_PRIVS
+        child = os.fork()
+        if child == 0:
+            os.execve(command[0], command, {})
+        _, status = os.waitpid(child, 0)
+        os.write(report_w, str(status).encode())
+        os._exit(0)
+    except OSError as e:
+        print(f"sandbox: {e}", file=sys.stderr)
+    os._exit(125)
 
-def get_problems_by_difficulty():
+os.close(report_w)
+_, status = os.waitpid(pid, 0)
+report = os.read(report_r, 64)
+if report:
+    status = int(report)
+if os.WIFSIGNALED(status):
+    sig = os.WTERMSIG(status)
+    if sig != signal.SIGKILL: # Which can't be handled anyway
+        signal.signal(sig, signal.SIG_DFL)
+    os.kill(os.getpid(), sig)
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+def run_test(code_path, case, sandbox=True):
     """
-    Scans the PROBLEMS_DIR and groups markdown files by a difficulty
-    prefix in their filename (e.g., '1-easy.md', '2-medium.md').
+    Runs a submission on one test case in its own subprocess: in a scratch
+    directory, with an empty environment, the limits in JUDGE_BOOTSTRAP and
+    JUDGE_TIMEOUT_SECONDS of wall time, and in JUDGE_SANDBOX unless sandbox
+    is False, when it can do whatever the server's user can. Returns
+    {"status", "time_ms"} and, for a failed example, what went wrong. Raises
+    RuntimeError if the sandbox couldn't be set up.
     """
-    problems_by_difficulty = defaultdict(list)
-    if not os.path.exists(PROBLEMS_DIR):
-        os.makedirs(PROBLEMS_DIR) # Ensure directory exists
-    for f in os.listdir(PROBLEMS_DIR):
-        if f.endswith(".md"):
-            try:
-                # Assumes problem names like "1-problem-name.md"
-                difficulty_str = f[0]
-                if difficulty_str.isdigit():
-                    difficulty = int(difficulty_str)
-                    problems_by_difficulty[difficulty].append(f)
-            except (ValueError, IndexError):
-                # Ignore files without a valid numeric prefix
-                pass
-    return problems_by_difficulty
-
-PROBLEMS_BY_DIFFICULTY = get_problems_by_difficulty()
-
-def save_bracket(bracket):
-    with open(BRACKET_FILE, "w") as f:
-        json.dump(bracket, f, indent=4)
-
-
-def assign_problem(round_num, available_problems_by_difficulty):
-    """
-    Assigns a problem based on the round number and available problems.
-    Removes the chosen problem from the available pool to prevent duplicates.
-    """
-    # Difficulty ramps up: 1 for Round 1, 2 for Round 2, and 3 for all subsequent rounds.
-    if round_num == 1:
-        difficulty = 1
-    elif round_num == 2:
-        difficulty = 2
-    else: # Rounds 3, 4, 5, etc., will all use difficulty 3
-        difficulty = 3
-
-    if not available_problems_by_difficulty.get(difficulty):
-        # This should be caught by the pre-check, but is a safeguard.
-        raise ValueError(f"Not enough unique problems for difficulty level {difficulty}.")
-    
-    # Check if the list for the required difficulty is empty
-    if not available_problems_by_difficulty[difficulty]:
-        # This is the crucial check. If we're out of problems for this difficulty, raise an error.
-        # This error will be caught by the pre-flight check in `create_bracket`.
-        raise ValueError(
-            f"Not enough unique problems for difficulty level {difficulty}. "
-            f"Please add more 'level {difficulty}' problems to the /problems directory."
+    # A large input is handed over as the file itself, opened here since the
+    # sandbox can't see it; anything else is written down a pipe.
+    stdin_source = open(case.input_path, "rb") if case.input_path else nullcontext(subprocess.PIPE)
+    with stdin_source as stdin, \
+            tempfile.TemporaryDirectory(prefix="run-") as run_dir, \
+            open(os.path.join(run_dir, "stdout"), "w+b") as stdout, \
+            open(os.path.join(run_dir, "stderr"), "w+b") as stderr:
+        python = os.path.realpath(JUDGE_PYTHON)
+        limits = [
+            # One byte over the output limit, so going over it shows in the output's length.
+            str(JUDGE_CPU_SECONDS), str(JUDGE_MEMORY_BYTES), str(JUDGE_OUTPUT_BYTES + 1),
+        ]
+        if sandbox:
+            shutil.copyfile(code_path, os.path.join(run_dir, "solution.py"))
+            os.mkdir(os.path.join(run_dir, "root"))
+            install = os.path.dirname(os.path.dirname(python)) # <prefix>/bin/python
+            command = [
+                python, "-I", "-c", JUDGE_SANDBOX, run_dir, str(JUDGE_SCRATCH_BYTES), *JUDGE_SANDBOX_PATHS, install,
+                "--", python, "-I", "-c", JUDGE_BOOTSTRAP, *limits, "/work/solution.py",
+            ]
+        else:
+            command = [python, "-I", "-c", JUDGE_BOOTSTRAP, *limits, code_path]
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            command, cwd=run_dir, env={}, stdin=stdin, stdout=stdout, stderr=stderr,
+            start_new_session=True, # So a timeout can kill anything it started too
         )
+        try:
+            proc.communicate(case.input if case.input_path is None else None, timeout=JUDGE_TIMEOUT_SECONDS)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            _kill_process_group(proc)
+            proc.wait()
+            timed_out = True
+        elapsed = time.perf_counter() - start
+        metrics.observe("judge_test_duration_seconds", elapsed)
+
+        stdout.seek(0)
+        output = stdout.read(JUDGE_OUTPUT_BYTES + 1)
+        stderr.seek(0)
+        errors = stderr.read(JUDGE_OUTPUT_BYTES).decode("utf-8", errors="replace")
+
+    if sandbox and proc.returncode == SANDBOX_FAILED and errors.startswith("sandbox: "):
+        raise RuntimeError(errors.strip())
+    code = proc.returncode
+    killed_by = -code if code < 0 else None # The signal that ended it, on POSIX
+    if timed_out or killed_by in (getattr(signal, "SIGXCPU", None), getattr(signal, "SIGKILL", None)):
+        status = "time_limit"
+    elif len(output) > JUDGE_OUTPUT_BYTES or killed_by == getattr(signal, "SIGXFSZ", None):
+        status = "output_limit"
+    elif code != 0:
+        status = "memory_limit" if "MemoryError" in errors else "runtime_error"
+    else:
+        status = "passed" if outputs_match(output.decode("utf-8", errors="replace"), case) else "wrong_answer"
+
+    result = {"test": case.name, "status": status, "time_ms": round(elapsed * 1000, 1)}
+    if not case.hidden and status != "passed":
+        if status == "wrong_answer":
+            result["expected"] = "\n".join(case.expected) + "\n"
+            result["output"] = output[:JUDGE_SHOWN_BYTES].decode("utf-8", errors="replace")
+        elif status == "runtime_error":
+            result["error"] = errors[-JUDGE_SHOWN_BYTES:]
+    return result
+
+def _kill_process_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, OSError): # No process groups (Windows), or already gone
+        proc.kill()
+
+
+class Submission:
+    """One contestant's code for one match, and how judging it went."""
 
-    problem_file = available_problems_by_difficulty[difficulty].pop(0) # Get and remove first problem
-    return problem_file, difficulty
+    __slots__ = ("id", "tournament_id", "match_num", "participant", "submitted_at", "start_time", "status", "tests", "remaining", "completed", "dir")
 
-def smart_shuffle_participants(participants_list_of_dicts):
+    def __init__(self, tournament_id, match_num, participant, submitted_at, start_time, num_tests):
+        self.id = os.urandom(8).hex()
+        self.tournament_id = tournament_id
+        self.match_num = match_num
+        self.participant = participant # The slot in the match, 1 or 2
+        self.submitted_at = submitted_at # Server time (see server_time_us)
+        self.start_time = start_time # When the match it was submitted for started
+        self.status = "queued"
+        self.tests = [None] * num_tests
+        self.remaining = num_tests
+        self.completed = False # Whether acceptance completed the match
+        self.dir = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "tournament": self.tournament_id,
+            "match_num": self.match_num,
+            "participant": self.participant,
+            "submitted_at": format_server_time(self.submitted_at),
+            "status": self.status,
+            "tests": [t for t in self.tests if t is not None],
+            "completed": self.completed,
+        }
+
+
+class Judge:
     """
-    Shuffles participants to minimize same-house matchups in the first round.
-    It arranges the list so that when paired sequentially (p1 vs p2, p3 vs p4),
-    the chances of p1 and p2 being from the same house are low.
+    Judges submissions against their problem's test cases. Every test of
+    every submission is queued on one pool of JUDGE_WORKERS threads, each of
+    which waits on one sandboxed subprocess (see run_test), so many matches
+    are judged at once and the runs are spread over the cores. Whether the
+    sandbox works here is tried once, on first use; if it doesn't,
+    submissions are refused unless JUDGE_TRUSTED_CODE is set. Once a test
+    fails, the submission's remaining queued tests are skipped. An accepted
+    submission completes its match through record_completions(), timed to
+    when it was submitted rather than when judging finished, unless the
+    match has been reset and restarted in the meantime. The last
+    JUDGE_HISTORY submissions are kept for /api/submission to report on.
     """
-    participants_by_house = defaultdict(list)
-    for p in participants_list_of_dicts:
-        participants_by_house[p['house']].append(p)
 
-    # Sort houses by number of participants, descending. This helps place the largest groups first.
-    sorted_houses = sorted(participants_by_house.keys(), key=lambda h: len(participants_by_house[h]), reverse=True)
+    def __init__(self, workers=JUDGE_WORKERS, history=JUDGE_HISTORY):
+        self.workers = workers
+        self.history = history
+        self._pool = None # Started on first use
+        self._submissions = OrderedDict() # id -> Submission
+        self._lock = threading.Lock()
+        self._sandboxed = None # Whether the sandbox works here, once tried
 
-    shuffled_list = []
-    
-    # We will draw one participant from each house in a round-robin fashion.
-    # This continues until all participants are placed.
-    while len(shuffled_list) < len(participants_list_of_dicts):
-        for house in sorted_houses:
-            if participants_by_house[house]:
-                # For an element of randomness, pop a random participant from the house list
-                participant_to_add = participants_by_house[house].pop(random.randint(0, len(participants_by_house[house])-1))
-                shuffled_list.append(participant_to_add)
+    @property
+    def sandboxed(self):
+        """Whether tests run in JUDGE_SANDBOX, trying it out the first time it's asked."""
+        with self._lock:
+            if self._sandboxed is None:
+                self._sandboxed = self._try_sandbox()
+            return self._sandboxed
 
-    return shuffled_list
+    @property
+    def available(self):
+        """Whether submissions can be judged at all (see JUDGE_TRUSTED_CODE)."""
+        return self.sandboxed or JUDGE_TRUSTED_CODE
 
-def generate_single_elim(participants_list_of_dicts, available_problems):
+    def _try_sandbox(self):
+        with tempfile.TemporaryDirectory(prefix="submission-") as directory:
+            code_path = os.path.join(directory, "solution.py")
+            with open(code_path, "w") as f:
+                f.write("print(input())")
+            try:
+                result = run_test(code_path, TestCase("sandbox", b"ok\n", "ok", True))
+            except Exception as e:
+                app.logger.warning("Submissions can't be sandboxed here: %s", e)
+                return False
+        if result["status"] != "passed":
+            app.logger.warning("Submissions can't be sandboxed here: the test run ended %s", result["status"])
+            return False
+        return True
 
-    n = len(participants_list_of_dicts)
+    def submit(self, tournament_id, match_num, participant, problem, code, submitted_at, start_time):
+        """
+        Queues code for judging and returns its Submission. start_time is
+        when the match was started, as the code was submitted. Raises
+        ValueError if the problem has no tests.
+        """
+        cases = test_cases.get(problem)
+        if not cases:
+            raise ValueError(f"{problem} has no test cases to judge against")
+        submission = Submission(tournament_id, match_num, participant, submitted_at, start_time, len(cases))
+        submission.dir = tempfile.mkdtemp(prefix="submission-")
+        code_path = os.path.join(submission.dir, "solution.py")
+        with open(code_path, "w", encoding="utf-8") as f:
+            f.write(code)
 
-    # For single elim, we need a power of 2.
-    # The logic can be extended to handle non-power-of-2 with byes, but for now we'll stick to the requirement.
-    is_power_of_two = (n > 0) and ((n & (n - 1)) == 0)
-    if not is_power_of_two:
-         raise ValueError("Single elimination requires a power of 2 number of participants.")
-
-    # --- Pre-flight check for problems ---
-    rounds_to_play = (n - 1).bit_length() -1
-    required_problems = defaultdict(int)
-    for r in range(1, rounds_to_play + 1):
-        matches_in_round = n // (2**r)
-        difficulty = 1 if r == 1 else 2 if r == 2 else 3
-        required_problems[difficulty] += matches_in_round
-    if n >= 4: # 3rd place match
-        difficulty = 1 if rounds_to_play == 1 else 2 if rounds_to_play == 2 else 3
-        required_problems[difficulty] += 1
-
-    # Use the new smart shuffle instead of random.shuffle
-    participants_list_of_dicts = smart_shuffle_participants(participants_list_of_dicts)
-
-    total_rounds = 0
-    temp_n = n
-    while temp_n > 1: temp_n //= 2; total_rounds += 1
-
-    total_matches = n - 1
-    matches = []
-
-    # --- Create empty matches first ---
-    for match_num in range(1, total_matches + 1):
-        matches.append({
-            "match_num": match_num,
-            "winner_proceeds_to": None,
-            "loser_proceeds_to": None,
-            "problem": None, # Will assign later
-            "problem_difficulty": None,
-            "participant1": None,
-            "participant2": None,
-            "participant1_result": None,
-            "participant2_result": None,
-            "start_time": None
-        })
-    
-    # --- Fill first round and assign problems ---
-    first_round_matches_count = n // 2
-    for i in range(first_round_matches_count):
-        match_idx = i
-        matches[match_idx]["participant1"] = participants_list_of_dicts[i*2]
-        matches[match_idx]["participant2"] = participants_list_of_dicts[i*2 + 1]
-        problem_file, difficulty = assign_problem(1, available_problems)
-        matches[match_idx]["problem"], matches[match_idx]["problem_difficulty"] = problem_file, difficulty
-
-    # --- Wire winners correctly ---
-    current_round_start_idx = 0
-    current_round_size = first_round_matches_count
-    next_match_start_idx = first_round_matches_count
-    current_round_num = 1
-
-    while current_round_size > 1:
-        current_round_num += 1
-        for i in range(0, current_round_size, 2):
-            parent_match_idx = next_match_start_idx + (i // 2)
-
-            matches[current_round_start_idx + i]["winner_proceeds_to"] = matches[parent_match_idx]["match_num"]
-            matches[current_round_start_idx + i + 1]["winner_proceeds_to"] = matches[parent_match_idx]["match_num"]
-            
-            # Assign problem for the parent match (which is in the next round)
-            problem_file, difficulty = assign_problem(current_round_num, available_problems)
-            matches[parent_match_idx]["problem"], matches[parent_match_idx]["problem_difficulty"] = problem_file, difficulty
-
-        current_round_start_idx = next_match_start_idx
-        current_round_size //= 2
-        next_match_start_idx += current_round_size
-
-    # --- Add 3rd place playoff ---    
-    if n >= 4:
-        # The semi-finals are the two matches that feed into the final match.
-        final_match_num = total_matches
-        semi_final_matches_indices = [i for i, m in enumerate(matches) if m.get("winner_proceeds_to") == final_match_num]
-
-        third_place_match_num = len(matches) + 1
-        # Force 3rd place match to be a 2-star problem
-        problem_file, difficulty = assign_problem(2, available_problems)
-
-        matches.append({
-            "match_num": third_place_match_num,
-            "winner_proceeds_to": None,
-            "loser_proceeds_to": None, # This will be wired later
-            "problem": problem_file,
-            "problem_difficulty": difficulty,
-            "participant1": None,
-            "participant2": None,
-            "participant1_result": None,
-            "participant2_result": None,
-            "start_time": None,
-            "is_third_place": True
-        })
-
-        # Wire semifinal losers
-        for match_index in semi_final_matches_indices:
-            matches[match_index]["loser_proceeds_to"] = third_place_match_num
-    return matches
-    
-def _generate_ub_matches(participants_list, available_problems):
-    # Use the new smart shuffle
-    participants_list_of_dicts = smart_shuffle_participants(participants_list)
-    n = len(participants_list_of_dicts)
-    
-    total_ub_matches = n - 1
-    ub_matches = []
-
-    total_rounds = 0
-    temp_n = n
-    while temp_n > 1:
-        temp_n //= 2
-        total_rounds += 1
-
-    for match_num in range(1, total_ub_matches + 1):
-        ub_matches.append({
-            "match_num": match_num,
-            "winner_proceeds_to": None,
-            "loser_proceeds_to": None,
-            "problem": None,
-            "problem_difficulty": None,
-            "participant1": None,
-            "participant2": None,
-            "participant1_result": None,
-            "participant2_result": None,
-            "start_time": None
-        })
-
-    first_round_matches_count = n // 2
-    for i in range(first_round_matches_count):
-        match_idx = i
-        ub_matches[match_idx]["participant1"] = participants_list_of_dicts[i*2]
-        ub_matches[match_idx]["participant2"] = participants_list_of_dicts[i*2 + 1]
-        problem_file, difficulty = assign_problem(1, available_problems)
-        ub_matches[match_idx]["problem"], ub_matches[match_idx]["problem_difficulty"] = problem_file, difficulty
-
-    current_round_start_idx = 0
-    current_round_size = first_round_matches_count
-    next_match_start_idx = first_round_matches_count
-    current_round_num = 1
-
-    while current_round_size > 1:
-        current_round_num += 1
-        for i in range(0, current_round_size, 2):
-            parent_match_idx = next_match_start_idx + (i // 2)
-
-            ub_matches[current_round_start_idx + i]["winner_proceeds_to"] = ub_matches[parent_match_idx]["match_num"]
-            ub_matches[current_round_start_idx + i + 1]["winner_proceeds_to"] = ub_matches[parent_match_idx]["match_num"]
-            problem_file, difficulty = assign_problem(current_round_num, available_problems)
-            ub_matches[parent_match_idx]["problem"], ub_matches[parent_match_idx]["problem_difficulty"] = problem_file, difficulty
-
-        current_round_start_idx = next_match_start_idx
-        current_round_size //= 2
-        next_match_start_idx += current_round_size
-    
-    return ub_matches
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="judge")
+            self._submissions[submission.id] = submission
+            while len(self._submissions) > self.history:
+                self._submissions.popitem(last=False)
+            for i, case in enumerate(cases):
+                self._pool.submit(self._run, submission, i, case, code_path)
+        return submission
+
+    def get(self, submission_id):
+        with self._lock:
+            submission = self._submissions.get(submission_id)
+            return submission.to_dict() if submission else None
+
+    def _run(self, submission, index, case, code_path):
+        with self._lock:
+            skip = submission.status not in ("queued", "running")
+            if not skip:
+                submission.status = "running"
+        try:
+            if skip:
+                result = {"test": case.name, "status": "skipped"}
+            else:
+                result = run_test(code_path, case, self.sandboxed)
+        except Exception as e:
+            app.logger.error("Judging submission %s failed: %s", submission.id, e)
+            result = {"test": case.name, "status": "judge_error"}
+
+        with self._lock:
+            submission.tests[index] = result
+            submission.remaining -= 1
+            # The verdict is the first failing test in order, once every test
+            # before it has finished. Acceptance is only shown once the match
+            # has been completed (in _finish).
+            verdict = "accepted"
+            for test in submission.tests:
+                if test is None:
+                    verdict = "running"
+                    break
+                if test["status"] not in ("passed", "skipped"):
+                    verdict = test["status"]
+                    break
+            if verdict != "accepted":
+                submission.status = verdict
+            done = submission.remaining == 0
+        if done:
+            self._finish(submission, verdict)
+
+    def _finish(self, submission, verdict):
+        shutil.rmtree(submission.dir, ignore_errors=True)
+        metrics.inc("judge_submissions_total", status=verdict)
+        completed = False
+        if verdict == "accepted":
+            completion = {"matchId": submission.match_num, "participant": submission.participant, "start_time": submission.start_time}
+            try:
+                completed = bool(record_completions([completion], submission.tournament_id, submission.submitted_at))
+            except Exception as e:
+                app.logger.error("Completing match %s for submission %s failed: %s", submission.match_num, submission.id, e)
+        with self._lock:
+            submission.status = verdict
+            submission.completed = completed
+
+
+test_cases = TestCaseStore(PROBLEMS_DIR, PROBLEM_TESTS_DIR)
+judge = Judge()
+
+# The sandbox can't see the hidden tests at all; other users on the machine
+# shouldn't be able to read them either.
+try:
+    if os.path.isdir(PROBLEM_TESTS_DIR):
+        os.chmod(PROBLEM_TESTS_DIR, 0o700)
+except OSError as e:
+    app.logger.warning("Couldn't make %s private: %s", PROBLEM_TESTS_DIR, e)
+
+metrics.describe("judge_submissions_total", "counter", "Judged submissions, by verdict.")
+metrics.describe("judge_test_duration_seconds", "histogram", "Time to run a submission on one test case.")
+
+
+# -----------------------------
+# Scheduling
+# -----------------------------
+
+def schedule_path(tournament_id):
+    """Where a tournament's station settings are kept."""
+    if tournament_id == DEFAULT_TOURNAMENT:
+        return SCHEDULE_FILE
+    return os.path.join(TOURNAMENTS_DIR, tournament_id + ".schedule.json")
 
-def generate_double_elim(participants_list_of_dicts, available_problems):
+def _match_finished(match):
+    """Whether everyone placed in a started match has a result."""
+    return all(r is not None for p, r in zip(match.players, match.results) if p is not None)
+
+def _station(match):
+    return match.extra.get("station") if match.extra else None
+
+def _schedule_state(match, feeders_decided):
     """
-    Generates a double-elimination bracket for a power-of-two number of participants.
+    Where a match stands for the scheduler: "running" (started, not
+    finished), "queued" (on a station, not started), "ready" (waiting for a
+    station) or None. feeders_decided() says whether every match that feeds
+    it is decided, and is only called if it matters.
     """
-    n = len(participants_list_of_dicts)
+    if match.is_bye or (match.extra or {}).get("match_type"):
+        return None
+    if match.start_time:
+        return None if _match_finished(match) else "running"
+    if _station(match) is not None:
+        return "queued"
+    if sum(p is not None for p in match.players) >= 2 and feeders_decided():
+        return "ready"
+    return None
 
-    if (n & (n - 1)) != 0 or n < 4:
-        raise ValueError("Double elimination requires a power of 2 with at least 4 participants.")
-    # Shuffling is now handled inside _generate_ub_matches
-
-    # --- 1. Generate Upper Bracket ---
-    upper_matches = _generate_ub_matches(participants_list_of_dicts, available_problems)
-    upper_matches = [m for m in upper_matches if not m.get("is_third_place")]
-    for match in upper_matches:
-        match['bracket'] = 'upper'
-
-    matches = list(upper_matches)
-    match_num_counter = len(matches) + 1
-
-    # --- 2. Create all Lower Bracket matches ---
-    lower_matches = []
-    # A DE bracket has (n-1) UB matches and (n-2) LB matches, total 2n-3.
-    # Grand final is the (2n-2)th match.
-    for _ in range(n - 2):
-        # For simplicity, we'll assign difficulty 1 to all lower bracket matches for now.
-        # This can be refined to have its own progression.
-        problem_file, difficulty = assign_problem(1, available_problems)
-        lower_matches.append({
-            "match_num": match_num_counter,
-            "winner_proceeds_to": None,
-            "loser_proceeds_to": None,
-            "problem": problem_file, "problem_difficulty": difficulty,
-            "participant1": None,
-            "participant2": None,
-            "participant1_result": None,
-            "participant2_result": None,
-            "start_time": None,
-            "bracket": "lower",
-        })
-        match_num_counter += 1
-
-    matches.extend(lower_matches)
-
-    # --- 3. Wire up the entire Lower Bracket dynamically ---
-    # The pattern of rounds in the lower bracket is: 2 small rounds, 1 big round, repeat.
-    upper_matches_by_round = {}
-    for match in upper_matches:
-        round_num = 1
-        curr = match
-        while True:
-            parent = next((m for m in upper_matches if m["winner_proceeds_to"] == curr["match_num"]), None)
-            if not parent: break
-            round_num += 1
-            curr = parent
-        if round_num not in upper_matches_by_round:
-            upper_matches_by_round[round_num] = []
-        upper_matches_by_round[round_num].append(match)
-
-    lower_match_idx = 0
-    # First set of lower rounds are fed by first round of upper
-    for i in range(0, len(upper_matches_by_round[1]), 2):
-        upper_matches_by_round[1][i]["loser_proceeds_to"] = lower_matches[lower_match_idx]["match_num"]
-        upper_matches_by_round[1][i+1]["loser_proceeds_to"] = lower_matches[lower_match_idx]["match_num"]
-        lower_match_idx += 1
-    
-    # Subsequent rounds
-    num_upper_rounds = len(upper_matches_by_round)
-    prev_lower_round_winners = list(range(lower_match_idx)) # Winners of the first LB matches
-
-    for r in range(2, num_upper_rounds + 1):
-        # "Big" round where LB winners play each other
-        next_lower_round_winners = []
-        for i in range(0, len(prev_lower_round_winners), 2):
-            lower_matches[prev_lower_round_winners[i]]["winner_proceeds_to"] = lower_matches[lower_match_idx]["match_num"]
-            lower_matches[prev_lower_round_winners[i+1]]["winner_proceeds_to"] = lower_matches[lower_match_idx]["match_num"]
-            next_lower_round_winners.append(lower_match_idx)
-            lower_match_idx += 1
-        
-        # "Small" round where UB losers play LB winners
-        # If it's not the final UB round's loser
-        if r <= num_upper_rounds:
-            upper_losers = upper_matches_by_round[r]
-            # Iterate through the winners of the previous LB round, pairing them with UB losers
-            for i in range(len(next_lower_round_winners)):
-                upper_losers[i]["loser_proceeds_to"] = lower_matches[lower_match_idx]["match_num"]
-                lower_matches[next_lower_round_winners[i]]["winner_proceeds_to"] = lower_matches[lower_match_idx]["match_num"]
-                lower_match_idx += 1
-            prev_lower_round_winners = list(range(lower_match_idx - len(next_lower_round_winners), lower_match_idx))
-
-    # --- 4. Create and wire Grand Final ---
-    grand_final_num = match_num_counter
-    # Grand final is always a high-difficulty problem
-    problem_file, difficulty = assign_problem(3, available_problems)
-    matches.append({
-        "match_num": grand_final_num,
-        "winner_proceeds_to": None,
-        "loser_proceeds_to": None,
-        "problem": problem_file, "problem_difficulty": difficulty,
-        "participant1": None, # Winner of Upper Bracket
-        "participant2": None, # Winner of Lower Bracket
-        "participant1_result": None,
-        "participant2_result": None,
-        "start_time": None,
-        "is_grand_final": True,
-        "bracket": "final"
-    })
+def _set_station(bracket, match, station):
+    bracket.touch(match.match_num)
+    extra = dict(match.extra or {})
+    if station is None:
+        extra.pop("station", None)
+    else:
+        extra["station"] = station
+    match.extra = extra or None
 
-    # Wire upper and lower bracket finals to Grand Final
-    upper_final = next(m for m in upper_matches if not m['winner_proceeds_to'])
-    upper_final['winner_proceeds_to'] = grand_final_num
-    
-    # The last match wired is the lower bracket final
-    matches[lower_match_idx-1]["winner_proceeds_to"] = grand_final_num
 
-    return matches
+class Scheduler:
+    """
+    Puts matches on stations as they become ready, so that no station sits
+    idle while a match could be played. A match is ready once every match
+    that feeds it is decided and it has at least two participants, none of
+    whom are playing elsewhere. Ready matches go to free stations earliest
+    round first, and the station is kept on the match (as "station") until
+    it finishes, so a reset match is replayed where it was, unless the
+    station has gone to another match since. What it works from is kept on
+    the live bracket as a ScheduleIndex, so filling the stations costs only
+    the matches changed since it last looked.
 
-def generate_hybrid_elim(participants_list_of_dicts, available_problems):
+    With `auto` on, the matches made ready by each batch of completions are
+    assigned in the same transaction (see record_completions). With
+    `auto_start` as well they are started together, with one start time;
+    otherwise they wait as "queued" until start_queued() (POST
+    /api/schedule/start) starts every queued match at once. Settings are kept
+    in schedule_path(), so they survive a restart.
     """
-    Generates a bracket for 12 or 24 participants.
-    Runs 1v1 rounds until 3 participants remain, then creates a 3-way
-    round-robin final.
+
+    def __init__(self, path):
+        self.path = path
+        self.stations = [f"Station {i}" for i in range(1, STATIONS + 1)]
+        self.auto = False
+        self.auto_start = False
+        self._load()
+
+    def settings(self):
+        return {"stations": self.stations, "auto": self.auto, "auto_start": self.auto_start}
+
+    def update(self, stations=None, auto=None, auto_start=None):
+        """Changes the settings (stations may be a list of names or a count) and saves them. Raises ValueError if they're invalid."""
+        if stations is not None:
+            if isinstance(stations, int) and not isinstance(stations, bool) and stations >= 0:
+                stations = [f"Station {i}" for i in range(1, stations + 1)]
+            if not isinstance(stations, list) or not all(isinstance(s, str) and s.strip() for s in stations):
+                raise ValueError("stations must be a count or a list of station names")
+            stations = [s.strip() for s in stations]
+            if len(set(stations)) != len(stations):
+                raise ValueError("Station names must be unique")
+            self.stations = stations
+        if auto is not None:
+            self.auto = bool(auto)
+        if auto_start is not None:
+            self.auto_start = bool(auto_start)
+        tmp_path = self.path + ".tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(self.settings(), f)
+        os.replace(tmp_path, self.path)
+
+    def assign(self, bracket, start_time=None):
+        """
+        Puts ready matches on free stations, touching each one it changes, and
+        starts them at start_time if one is given. Call it inside a
+        transaction. Returns the match_nums assigned.
+        """
+        index = self._index(bracket)
+        station_names = set(self.stations)
+        # A queued match on a station that has since been removed, or that
+        # another match is on, goes back in line.
+        moved = []
+        for station, match_nums in index.stations.items():
+            queued = sorted(num for num in match_nums if index.states[num][0] == "queued")
+            if station in station_names and len(queued) == len(match_nums):
+                queued = queued[1:] # No match running there: the first in line keeps it
+            for num in queued:
+                _set_station(bracket, bracket.get(num), None)
+                moved.append(num)
+        index.refresh(bracket, moved)
+
+        free = [s for s in self.stations if s not in index.stations]
+        busy = set(index.busy)
+        assigned = []
+        for _, match_num in list(index.ready):
+            if not free:
+                break
+            match = bracket.get(match_num)
+            players = {p for p in match.players if p is not None}
+            if players & busy:
+                continue
+            busy |= players
+            _set_station(bracket, match, free.pop(0))
+            if start_time is not None:
+                match.start_time = start_time
+            assigned.append(match_num)
+        index.refresh(bracket, assigned)
+        return assigned
+
+    def start_queued(self, bracket, start_time):
+        """Starts every match waiting on a station, touching each. Call it inside a transaction."""
+        index = self._index(bracket)
+        started = sorted(num for num, entry in index.states.items() if entry[0] == "queued")
+        for match_num in started:
+            bracket.touch(match_num)
+            bracket.get(match_num).start_time = start_time
+        index.refresh(bracket, started)
+        return started
+
+    def on_results(self, bracket):
+        """Called inside the transaction that records results: refills the stations they freed."""
+        if self.auto:
+            self.assign(bracket, server_time_us() if self.auto_start else None)
+
+    def on_reset(self, bracket, match):
+        """
+        Called inside the transaction that resets a match, after resetting
+        it: frees its station if another match has been put on it since the
+        match was played, sending the match back in line.
+        """
+        index = self._index(bracket)
+        station = _station(match)
+        if station is not None and len(index.stations.get(station, ())) > 1:
+            _set_station(bracket, match, None)
+            index.refresh(bracket, [match.match_num])
+
+    def status(self, bracket):
+        """What each station is doing and which ready matches are waiting for one."""
+        state = self._survey(bracket)
+        by_station = {_station(m): m for m in state["queued"] + state["running"]}
+        stations = []
+        for name in self.stations:
+            match = by_station.get(name)
+            stations.append({
+                "name": name,
+                "match_num": match.match_num if match else None,
+                "state": "free" if match is None else "running" if match.start_time else "queued",
+            })
+        return dict(self.settings(), stations=stations, ready=[m.match_num for m in state["ready"]])
+
+    def _index(self, bracket):
+        """The live bracket's ScheduleIndex, brought up to date with the current transaction's changes so far."""
+        if bracket.schedule is None:
+            bracket.schedule = ScheduleIndex(bracket)
+        else:
+            bracket.schedule.refresh(bracket, bracket.changed)
+        return bracket.schedule
+
+    def _survey(self, bracket):
+        """
+        Sorts the unfinished matches of a snapshot into queued (on a station,
+        not started), running (started) and ready (waiting for a station,
+        earliest round first), and collects the participants in running or
+        queued matches. Only for status(); writers use the ScheduleIndex.
+        """
+        decided = {m.match_num for m in bracket.matches if match_outcome(m) is not None}
+        fed_by = defaultdict(list)
+        for match in bracket.matches:
+            for target in (match.winner_proceeds_to, match.loser_proceeds_to):
+                if target is not None:
+                    fed_by[target].append(match.match_num)
+
+        states = {"queued": [], "running": [], "ready": []}
+        busy = set()
+        for match in bracket.matches:
+            state = _schedule_state(match, lambda: all(source in decided for source in fed_by[match.match_num]))
+            if state is None:
+                continue
+            states[state].append(match)
+            if state != "ready":
+                busy.update(p for p in match.players if p is not None)
+        states["ready"].sort(key=lambda m: (m.round or 0, m.match_num))
+        return dict(states, busy=busy)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                settings = json.load(f)
+            self.stations = settings.get("stations", self.stations)
+            self.auto = settings.get("auto", False)
+            self.auto_start = settings.get("auto_start", False)
+        except Exception as e:
+            app.logger.error("Failed to load %s: %s", self.path, e)
+
+
+class ScheduleIndex:
+    """
+    Which matches of a live bracket are running, queued on a station or
+    ready for one, and who is playing in the running and queued ones, as
+    _survey() would find them. It is built once per bracket and then kept up
+    to date by refresh(), with the matches each transaction touched (see
+    BracketStore.transaction and Scheduler._index), so it never needs the
+    whole bracket looked over again.
     """
-    n = len(participants_list_of_dicts)
 
-    if n not in [12, 24]:
-        raise ValueError("Hybrid elimination only supports 12 or 24 participants.")
-    current_participants = smart_shuffle_participants(participants_list_of_dicts)
-
-    matches = []
-    match_num_counter = 1
-    current_participants = list(participants_list_of_dicts)
-    last_round_match_indices = []
-    current_round_num = 0
-
-    while len(current_participants) > 3:
-        num_matches_in_round = len(current_participants) // 2
-        next_round_participants = []
-        current_round_match_indices = []
-
-        current_round_num += 1
-        for i in range(num_matches_in_round):
-            problem_file, difficulty = assign_problem(current_round_num, available_problems)
-            match = {
-                "match_num": match_num_counter,
-                "winner_proceeds_to": None, # Will be wired up later
-                "loser_proceeds_to": None,
-                "problem": problem_file, "problem_difficulty": difficulty,
-                # Store full participant objects
-                "participant1": current_participants[i*2],
-                "participant2": current_participants[i*2 + 1],
-                "participant1_result": None,
-                "participant2_result": None,
-                "start_time": None
-            }
-            matches.append(match)
-            current_round_match_indices.append(match_num_counter -1)
-            match_num_counter += 1
-
-        # Wire previous round to this round
-        if last_round_match_indices:
-            for i, parent_match_idx in enumerate(last_round_match_indices):
-                child_match_num = matches[current_round_match_indices[i // 2]]["match_num"]
-                matches[parent_match_idx]["winner_proceeds_to"] = child_match_num
-
-        last_round_match_indices = list(current_round_match_indices)
-        # Placeholder for winners
-        current_participants = [f"Winner of M{matches[idx]['match_num']}" for idx in current_round_match_indices]
+    def __init__(self, bracket):
+        self.states = {} # match_num -> (state, station or ready key, players)
+        self.ready = [] # (round, match_num) of each ready match, sorted
+        self.stations = {} # station -> match_nums running or queued on it
+        self.busy = Counter() # participant id -> running and queued matches they're in
+        self.refresh(bracket, [m.match_num for m in bracket])
 
-    # --- Create 3-way Round-Robin Final ---
-    finalists_placeholders = current_participants
-    sub_matches = []
-    for i in range(3):
-        problem_file, difficulty = assign_problem(current_round_num + 1, available_problems)
-        sub_match = {
-            "match_num": match_num_counter, # These are the sub-matches of the final
-            "problem": problem_file, "problem_difficulty": difficulty,
-            "participant1": None,
-            "participant2": None,
-            "participant1_result": None,
-            "participant2_result": None,
-            "start_time": None,
-        }
-        sub_matches.append(sub_match)
-        matches.append(sub_match)
-        match_num_counter += 1
+    def refresh(self, bracket, match_nums):
+        """Classifies the given matches again, along with the matches they feed, whose readiness can depend on them."""
+        match_nums = set(match_nums)
+        for match_num in list(match_nums):
+            match = bracket.get(match_num)
+            if match is not None:
+                match_nums.update(t for t in (match.winner_proceeds_to, match.loser_proceeds_to) if t is not None)
+        for match_num in match_nums:
+            self._remove(match_num)
+            match = bracket.get(match_num)
+            if match is None:
+                continue
+            state = _schedule_state(match, lambda: all(
+                match_outcome(bracket.get(source)) is not None for source, _ in bracket.feeders(match_num)
+            ))
+            if state is None:
+                continue
+            players = tuple(p for p in match.players if p is not None)
+            if state == "ready":
+                key = (match.round or 0, match_num)
+                bisect.insort(self.ready, key)
+            else:
+                key = _station(match)
+                if key is not None:
+                    self.stations.setdefault(key, set()).add(match_num)
+                self.busy.update(players)
+            self.states[match_num] = (state, key, players)
+
+    def _remove(self, match_num):
+        entry = self.states.pop(match_num, None)
+        if entry is None:
+            return
+        state, key, players = entry
+        if state == "ready":
+            self.ready.remove(key)
+            return
+        if key is not None:
+            self.stations[key].discard(match_num)
+            if not self.stations[key]:
+                del self.stations[key]
+        self.busy.subtract(players)
+        for participant_id in players:
+            if self.busy[participant_id] <= 0:
+                del self.busy[participant_id]
+
+
+_schedulers = {} # tournament id -> Scheduler
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(tournament_id):
+    with _schedulers_lock:
+        scheduler = _schedulers.get(tournament_id)
+        if scheduler is None:
+            scheduler = _schedulers[tournament_id] = Scheduler(schedule_path(tournament_id))
+        return scheduler
 
-    final_match = {
-        "match_num": match_num_counter,
-        "match_type": "three_way_round_robin",
-        "sub_matches": [m["match_num"] for m in sub_matches], # Store match_nums, not objects
-        "winner": None # Overall winner
-    }
-    matches.append(final_match)
 
-    return matches
 # -----------------------------
 # Routes
 # -----------------------------
 
+# Every bracket route is served twice: at /api/... for the default tournament
+# and at /api/t/<tournament id>/... for any other.
+class TournamentIdConverter(BaseConverter):
+    regex = TOURNAMENT_ID_REGEX
+
+app.url_map.converters["tournament"] = TournamentIdConverter
+
+@app.before_request
+def note_arrival_time():
+    # Taken before the request waits on any lock, so a start or completion
+    # is timed from when it reached the server rather than when it got its turn.
+    g.arrived_us = server_time_us()
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    if "started" in g:
+        # Labelled by the route's rule rather than the path, so ids don't each make a series.
+        route = request.url_rule.rule if request.url_rule else "(unmatched)"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - g.started,
+                        route=route, method=request.method, status=response.status_code)
+    return response
+
+def arrival_time_us():
+    """When the current request arrived, or now outside of a request."""
+    return g.arrived_us if "arrived_us" in g else server_time_us()
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 
 @app.route("/api/bracket")
-def get_bracket():
+@app.route("/api/t/<tournament:tournament_id>/bracket")
+def get_bracket(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Returns the whole bracket, with the version as its ETag so an unchanged
+    bracket costs a 304. With ?since=<version> it instead returns only the
+    matches changed after that version:
+    {"version": ..., "full": false, "matches": [...]}. "full" is true when
+    the history doesn't reach back that far and every match is included.
+
+    With ?layout=1 the whole bracket comes as
+    {"version": ..., "layout": ..., "matches": [...]}, where layout is
+    where to draw each match (see bracket_layout). The layout only changes
+    when the bracket is replaced, which clients hear about as a "bracket"
+    event, so a ?since= response only includes it when "full" is true.
+    """
     try:
-        bracket = load_bracket()
-        if bracket:
-            return jsonify(bracket)
-        return jsonify({"error": "No bracket"})
+        store = tournaments.get(tournament_id)
+        bracket = store.snapshot()
+        if not bracket:
+            return jsonify({"error": "No bracket"})
+
+        with_layout = request.args.get("layout", type=int) == 1
+        since = request.args.get("since", type=int)
+        if since is not None:
+            changed = store.changes_since(since, bracket)
+            matches = bracket.to_dicts(changed)
+            data = {"version": bracket.version, "full": changed is None, "matches": matches}
+            if with_layout and changed is None:
+                data["layout"] = json.loads(bracket.layout_json())
+            return jsonify(data)
+
+        etag = str(bracket.version)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        elif with_layout:
+            # Both parts are cached as JSON already, so they are only spliced together.
+            body = f'{{"version":{bracket.version},"layout":{bracket.layout_json()},"matches":{bracket.to_json()}}}'
+            response = Response(body, mimetype="application/json")
+        else:
+            response = Response(bracket.to_json(), mimetype="application/json")
+        response.set_etag(etag)
+        # Let browsers keep a copy, but always check back with the ETag.
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/standings")
+@app.route("/api/t/<tournament:tournament_id>/standings")
+def get_standings(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    House standings, the participant leaderboard and the fastest solves:
+    {"houses": [...], "leaderboard": [...], "fastest": [...]}. These are
+    kept up to date as matches complete, so serving them is cheap, and the
+    bracket version is the ETag so an unchanged screen costs a 304.
+    """
+    version, data = tournaments.get(tournament_id).standings_json()
+    etag = str(version)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(data, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/seeding_score")
+@app.route("/api/t/<tournament:tournament_id>/seeding_score")
+def get_seeding_score(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    How well the current draw keeps houses apart: the expected number of
+    same-house meetings, and how many same-house pairs first meet in each round.
+    """
+    bracket = load_bracket(tournament_id)
+    if not bracket:
+        return jsonify({"error": "No bracket"}), 404
+
+    targets = {m.winner_proceeds_to for m in bracket}
+    first_round = [
+        m for m in bracket
+        if (m.bracket or "upper") == "upper" and m.players and not (m.extra or {}).get("is_third_place")
+        and (m.round == 1 if m.round is not None else m.match_num not in targets)
+    ]
+    slots = [bracket.participant(m.player(i)) for m in first_round for i in (1, 2)]
+    is_hybrid = any((m.extra or {}).get("match_type") == "three_way_round_robin" for m in bracket)
+    finalists = 3 if is_hybrid else 1
+    levels = (len(slots) // finalists).bit_length() - 1
+    return jsonify(score_draw(slots, levels))
+
+@app.route("/api/stream")
+@app.route("/api/t/<tournament:tournament_id>/stream")
+def stream_bracket(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Server-sent events for bracket changes. After every start, completion or
+    reset a "matches" event carries just the matches that changed; a "bracket"
+    event means the bracket was created or deleted and should be re-fetched.
+    """
+    store = tournaments.get(tournament_id)
+    q = store.subscribe()
+    snapshot = store.snapshot()
+    version = snapshot.version if snapshot else store.version
+
+    def events():
+        try:
+            yield format_sse("hello", {"version": version}, version)
+            while True:
+                try:
+                    yield q.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            store.unsubscribe(q)
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # Stop nginx from buffering the stream
+    })
+
 @app.route("/api/create_bracket", methods=["POST"])
-def create_bracket():
-    # with bracket_lock: # Lock removed, will be handled in specific modification routes
+@app.route("/api/t/<tournament:tournament_id>/create_bracket", methods=["POST"])
+def create_bracket(tournament_id=DEFAULT_TOURNAMENT):
+    # The new bracket is swapped in under the tournament's lock by save_bracket().
     data = request.json
     elim_type = data["type"]
 
-    if not os.path.exists("participants.txt"): return jsonify({"error": "participants.txt missing"}), 400
-
-    with open("participants.txt") as f: participants_raw = [p.strip() for p in f if p.strip()]
-    
-    participants_list_of_dicts = []
-    # Regex to find a house initial in parentheses at the end of the string
-    house_regex = re.compile(r'\s*\(([YCBMA])\)$', re.IGNORECASE)
-
-    for p_line in participants_raw:
-        match = house_regex.search(p_line)
-        if match:
-            name = house_regex.sub('', p_line).strip()
-            house = match.group(1).upper()
-            participants_list_of_dicts.append({"name": name, "house": house})
-        # If no match, we can decide how to handle it. Here, we'll assign N/A.
-        else:
-            participants_list_of_dicts.append({"name": p_line.strip(), "house": "N/A"})
+    path = participants_path(tournament_id)
+    if not os.path.exists(path): return jsonify({"error": f"{path} missing"}), 400
 
-    n = len(participants_list_of_dicts)
+    # A line that can't be read is reported rather than guessed at, since a
+    # participant left out or given the wrong house is hard to fix mid-event.
+    participants_list_of_dicts, checked = read_participants(path)
+    if checked.error_count:
+        return jsonify({"error": f"{path} has {checked.error_count} invalid line(s)", "errors": checked.errors}), 400
 
-    # --- Problem Availability Check ---
-    # Calculate required problems based on bracket type and participant count
-    required_problems = defaultdict(int)
-    num_matches = 0
-    if elim_type == "single" and (n & (n - 1)) == 0 and n != 0:
-        num_matches = n - 1
-        if n >= 4: num_matches += 1 # 3rd place
-        # This is a simplification; a more detailed check is inside generate_single_elim
-        # For now, we'll just check total problems.
-    elif elim_type == "double" and (n & (n - 1)) == 0 and n >= 4:
-        num_matches = 2 * n - 2 # UB + LB + Final
-    elif n in [12, 24]:
-        num_matches = (n - 3) + 3 # Elimination matches + 3 final matches
-
-    available_problems_by_difficulty = get_problems_by_difficulty()
-    total_available_problems = sum(len(p_list) for p_list in available_problems_by_difficulty.values())
-
-    if total_available_problems < num_matches:
-        return jsonify({
-            "error": f"Not enough unique problems available. Required: {num_matches}, Available: {total_available_problems}. Please add more .md files to the /problems directory."
-        }), 400
-    
     try:
-        # Create a mutable copy of problems for assignment, and shuffle them for randomness
-        problems_for_bracket = {
-            diff: random.sample(p_list, len(p_list)) for diff, p_list in available_problems_by_difficulty.items()
-        }
+        curves = resolve_difficulty_curves(data.get("difficulty_curves"))
 
+        # Build the bracket's structure first; each match only records the
+        # difficulty it needs. Problems are then planned for the whole bracket at
+        # once, so a shortage is reported in full before anything is assigned.
         if elim_type == "double":
-            bracket = generate_double_elim(participants_list_of_dicts, problems_for_bracket)
-        elif elim_type == "single" and (n & (n - 1)) == 0 and n != 0: # Power of 2
-            bracket = generate_single_elim(participants_list_of_dicts, problems_for_bracket)
+            bracket = generate_double_elim(participants_list_of_dicts, curves)
+        elif elim_type == "single":
+            bracket = generate_single_elim(participants_list_of_dicts, curves)
         elif elim_type == "hybrid":
-            bracket = generate_hybrid_elim(participants_list_of_dicts, problems_for_bracket)
+            bracket = generate_hybrid_elim(participants_list_of_dicts, curves)
         else:
-            return jsonify({"error": f"Unsupported number of participants: {n}. Please use a power of 2, 12, or 24."}), 400
+            return jsonify({"error": f"Unsupported bracket type: {elim_type}."}), 400
+
+        assign_problems(bracket, get_problems_by_difficulty())
+    except ProblemShortage as e:
+        return jsonify({"error": str(e), "shortfalls": e.shortfalls}), 400
+    except ValueError as e:
+        # Catch specific errors from bracket generation and return them to the user.
+        return jsonify({"error": str(e)}), 400
+
+    save_bracket(bracket, tournament_id)
+    problem_catalog.record_usage(bracket)
+    # The seeding report is the one /api/seeding_score gives for this draw.
+    return jsonify({"matches": bracket.to_dicts(), "seeding": bracket.seeding})
+
+
+@app.route("/api/participants")
+@app.route("/api/t/<tournament:tournament_id>/participants")
+def get_participants(tournament_id=DEFAULT_TOURNAMENT):
+    """The participant list create_bracket will use, with any lines in it that aren't valid."""
+    path = participants_path(tournament_id)
+    if not os.path.exists(path):
+        return jsonify({"participants": [], "errors": [], "error_count": 0})
+    participants, checked = read_participants(path)
+    return jsonify({"participants": participants, "errors": checked.errors, "error_count": checked.error_count})
+
+@app.route("/api/participants", methods=["POST"])
+@app.route("/api/t/<tournament:tournament_id>/participants", methods=["POST"])
+def upload_participants(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Replaces the participant list, or adds to it with ?append=1, from a
+    "file" in a multipart form or from the request body itself. The format
+    (text, csv, ndjson or json) is ?format=, or else taken from the file's
+    extension or the Content-Type; see PARTICIPANT_FORMATS. The upload is
+    read as it arrives rather than all at once. If any record is invalid,
+    nothing changes and the errors are returned by line, unless
+    ?skip_invalid=1 is given to import the rest. Repeated names are dropped
+    and listed under "duplicates".
+    """
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("file")
+        if upload is None:
+            return jsonify({"error": "Expected the participants as a \"file\" field"}), 400
+        stream, filename, mimetype = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, mimetype = request.stream, None, request.mimetype
+
+    fmt = request.args.get("format") or _upload_format(filename, mimetype)
+    if fmt not in PARTICIPANT_FORMATS:
+        return jsonify({"error": f"Unsupported format: {fmt}. Expected one of {', '.join(PARTICIPANT_FORMATS)}."}), 400
+
+    path = participants_path(tournament_id, own=True)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    append = request.args.get("append", type=int)
+    skip_invalid = request.args.get("skip_invalid", type=int)
+    try:
+        checked = import_participants(
+            PARTICIPANT_FORMATS[fmt](stream), path,
+            append_to=participants_path(tournament_id) if append else None, skip_invalid=skip_invalid,
+        )
     except ValueError as e:
-        # Catch specific errors from problem assignment and return them to the user.
         return jsonify({"error": str(e)}), 400
 
-    save_bracket(bracket)
-    return jsonify(bracket)
+    if checked.error_count and not skip_invalid:
+        summary = dict(checked.summary(), imported=0)
+        return jsonify({"error": f"{checked.error_count} record(s) could not be imported; nothing was changed", **summary}), 400
+    return jsonify({"success": True, "total": len(checked.seen), **checked.summary()})
+
+def _upload_format(filename, mimetype):
+    """The participant list format for an upload, from its extension or else its Content-Type."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    by_extension = {".csv": "csv", ".json": "json", ".jsonl": "ndjson", ".ndjson": "ndjson", ".txt": "text"}
+    if extension in by_extension:
+        return by_extension[extension]
+    by_mimetype = {"text/csv": "csv", "application/json": "json", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+    return by_mimetype.get(mimetype, "text")
+
+
+@app.route("/api/clock")
+def get_clock():
+    """
+    The server's clock, for displays to line their timers up with. A client
+    should note its own time before (t0) and after (t1) the request and take
+    server_time_us - (t0 + t1) / 2 as its offset.
+    """
+    now = server_time_us()
+    response = jsonify({"server_time_us": now, "server_time": format_server_time(now)})
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@app.route("/api/tournaments")
+def list_tournaments():
+    """The ids of every tournament with a bracket on disk or in memory."""
+    return jsonify(tournaments.ids())
 
 
 @app.route("/match/<int:match_id>")
 def match_page(match_id):
     return render_template("match.html", match_id=match_id)
 
+def requested_match_ids():
+    """
+    The match ids a request asks for, in order and without repeats: either
+    ?ids=1,2,3 or, as older links do, ?m1=1&m2=2. Raises ValueError if
+    there are none, one isn't a number, or there are more than
+    MAX_BATCH_MATCHES.
+    """
+    if "ids" in request.args:
+        parts = [part.strip() for part in request.args["ids"].split(",") if part.strip()]
+    else:
+        parts = [request.args[f"m{i}"] for i in range(1, MAX_BATCH_MATCHES + 2) if f"m{i}" in request.args]
+    try:
+        match_ids = list(dict.fromkeys(int(part) for part in parts))
+    except ValueError:
+        raise ValueError("Match ids must be numbers, e.g., ?ids=1,2")
+    if not match_ids:
+        raise ValueError("Please provide match ids, e.g., ?ids=1,2")
+    if len(match_ids) > MAX_BATCH_MATCHES:
+        raise ValueError(f"At most {MAX_BATCH_MATCHES} matches can be shown at once")
+    return match_ids
+
 @app.route("/multimatch")
 def multi_match_page():
-    match_id1 = request.args.get('m1', type=int)
-    match_id2 = request.args.get('m2', type=int)
-    if not match_id1 or not match_id2:
-        return "Please provide two match IDs, e.g., /multimatch?m1=1&m2=2", 400
-    return render_template("multimatch.html", match_id1=match_id1, match_id2=match_id2)
+    """Any number of matches side by side, e.g., /multimatch?ids=1,2,3."""
+    try:
+        match_ids = requested_match_ids()
+    except ValueError as e:
+        return str(e), 400
+    return render_template("multimatch.html", match_ids=match_ids)
 
 @app.route("/api/match/<int:match_id>")
-def get_match(match_id):
-    bracket = load_bracket()
-    match = next(m for m in bracket if m["match_num"] == match_id)
-    return jsonify(match)
+@app.route("/api/t/<tournament:tournament_id>/match/<int:match_id>")
+def get_match(match_id, tournament_id=DEFAULT_TOURNAMENT):
+    bracket = load_bracket(tournament_id)
+    match = bracket.get(match_id) if bracket else None
+    if not match:
+        return jsonify({"error": "Match not found"}), 404
+    return jsonify(match.to_dict(bracket.participants))
+
+@app.route("/api/matches")
+@app.route("/api/t/<tournament:tournament_id>/matches")
+def get_matches(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Several matches and their problems in one response, for a multi-match
+    view: ?ids=1,2,3 gives
+    {"version": ..., "matches": [...], "problems": {filename: html}, "missing": [...]}.
+    Matches come in the order asked for, each problem is included once
+    however many of them share it, and "missing" lists the ids with no
+    match. The ETag covers the bracket version and every problem's, so an
+    unchanged view costs a 304.
+    """
+    try:
+        match_ids = requested_match_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    bracket = load_bracket(tournament_id)
+    if not bracket:
+        return jsonify({"error": "No bracket"}), 404
+
+    matches, missing, problems = [], [], {}
+    for match_id in match_ids:
+        match = bracket.get(match_id)
+        if not match:
+            missing.append(match_id)
+            continue
+        matches.append(match.to_dict(bracket.participants))
+        if match.problem and match.problem not in problems:
+            problems[match.problem] = problem_cache.get(match.problem)
+    problems = {filename: problem for filename, problem in problems.items() if problem}
+
+    etag = f"{bracket.version}-" + hashlib.sha1(
+        " ".join(f"{filename}:{problem.etag}" for filename, problem in problems.items()).encode("utf-8")
+    ).hexdigest()[:16]
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        body = json.dumps({
+            "version": bracket.version,
+            "matches": matches,
+            "problems": {filename: problem.html.decode("utf-8") for filename, problem in problems.items()},
+            "missing": missing,
+        }).encode("utf-8")
+        if "gzip" in request.accept_encodings and len(body) >= GZIP_MIN_BYTES:
+            response = Response(gzip.compress(body), mimetype="application/json")
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
 
 
 @app.route("/api/start/<int:match_id>", methods=["POST"])
-def start_match(match_id):
-    return start_matches([match_id])
+@app.route("/api/t/<tournament:tournament_id>/start/<int:match_id>", methods=["POST"])
+def start_match(match_id, tournament_id=DEFAULT_TOURNAMENT):
+    return start_matches([match_id], tournament_id)
 
 @app.route("/api/start_matches", methods=["POST"])
-def start_multiple_matches():
+@app.route("/api/t/<tournament:tournament_id>/start_matches", methods=["POST"])
+def start_multiple_matches(tournament_id=DEFAULT_TOURNAMENT):
     data = request.json
     match_ids = data.get("match_ids", [])
     if not match_ids:
         return jsonify({"error": "No match IDs provided"}), 400
-    return start_matches(match_ids)
+    return start_matches(match_ids, tournament_id)
 
-def start_matches(match_ids):
-    """A helper function to start one or more matches atomically."""
-    
-    bracket = load_bracket()
+def start_matches(match_ids, tournament_id=DEFAULT_TOURNAMENT):
+    """
+    A helper function to start one or more matches atomically. Returns the
+    start time, so the caller's timers can count from the server's clock.
+    """
     
-    start_time_iso = datetime.now(HKT_TZ).isoformat()
+    start_time = arrival_time_us()
 
-    for match_id in match_ids:
-        match = next((m for m in bracket if m["match_num"] == match_id), None)
-        if match:
-            match["start_time"] = start_time_iso
+    with tournaments.get(tournament_id).transaction("start") as bracket:
+        if not bracket:
+            return jsonify({"error": "Bracket not loaded"}), 500
 
-    save_bracket(bracket)
-    return jsonify({"success": True})
+        for match_id in match_ids:
+            match = bracket.get(match_id)
+            if match:
+                bracket.touch(match_id)
+                match.start_time = start_time
+
+    return jsonify({"success": True, "start_time": format_server_time(start_time), "start_time_us": start_time})
 
 @app.route("/api/complete/<int:match_id>", methods=["POST"])
-def complete_match(match_id):
+@app.route("/api/t/<tournament:tournament_id>/complete/<int:match_id>", methods=["POST"])
+def complete_match(match_id, tournament_id=DEFAULT_TOURNAMENT):
     """Endpoint for a single match completion, now acts as a wrapper for the batch endpoint."""
     data = request.json
     participant = data["participant"]
     
     # Call the batch endpoint with a single item
-    return complete_matches([{"matchId": match_id, "participant": participant}])
+    return complete_matches([{"matchId": match_id, "participant": participant}], tournament_id)
 
 @app.route("/api/complete_matches", methods=["POST"])
-def complete_multiple_matches():
+@app.route("/api/t/<tournament:tournament_id>/complete_matches", methods=["POST"])
+def complete_multiple_matches(tournament_id=DEFAULT_TOURNAMENT):
     """
     Endpoint to process a batch of match completions. This is the primary
     endpoint for completing matches, ensuring atomicity with a lock.
@@ -636,121 +4071,284 @@ def complete_multiple_matches():
     if not isinstance(completions, list):
         return jsonify({"error": "Invalid payload: expected a list of completions."}), 400
         
-    return complete_matches(completions)
+    return complete_matches(completions, tournament_id)
 
-def complete_matches(completions):
-    """Helper function to process a list of completions atomically."""
+def complete_matches(completions, tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Helper function to process a list of completions atomically. Each is
+    timed from its match's start to when the request arrived, less the
+    "queued_ms" the client says it held the completion back for batching
+    (at most MAX_COMPLETION_QUEUE_MS).
+    """
     
-    bracket = load_bracket()
-    if not bracket:
+    # Taken before waiting for the lock, so a queued batch isn't charged for the wait.
+    try:
+        touched = record_completions(completions, tournament_id, arrival_time_us())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if touched is None:
         return jsonify({"error": "Bracket not loaded"}), 500
+    return jsonify({"success": True})
 
-    for completion in completions:
-        match_id = completion["matchId"]
-        participant = completion["participant"]
+def record_completions(completions, tournament_id, end_time):
+    """
+    Records a batch of completions (as complete_matches takes them), timed
+    to end_time, and advances the winners. A completion that gives the
+    "start_time" its match was started at is skipped if the match has been
+    restarted since. Returns the match_nums that were given a result, or
+    None if there is no bracket. Raises ValueError, and
+    records nothing, if a completion names a participant slot its match
+    doesn't have.
+    """
+    op = "dnf" if completions and all(c.get("dnf") for c in completions) else "complete"
 
-        match = next((m for m in bracket if m["match_num"] == match_id), None)
+    with tournaments.get(tournament_id).transaction(op) as bracket:
+        if not bracket:
+            return None
 
-        if not match: continue # Skip if match not found
-        if not match["start_time"]: continue # Skip if match not started
-        if match[f"participant{participant}_result"]: continue # Skip if already completed
-        
-        # Check for a special DNF signal from the frontend
-        if completion.get("dnf"):
-            match[f"participant{participant}_result"] = "DNF"
-        else:
-            # Standard completion with time calculation
-            end_time = datetime.now(HKT_TZ)
-            start_time = datetime.fromisoformat(match["start_time"])
-            elapsed = str(end_time - start_time)
-            match[f"participant{participant}_result"] = elapsed
-            
-    # --- Post-completion processing (advancing winners) ---
-    # This should run after all times in the batch are recorded.
-    # We iterate through all matches to check for newly completed ones.
-    for match in bracket:
-        # Check if match is complete and has a winner to advance
-        if match.get("participant1_result") and match.get("participant2_result") and match.get("winner_proceeds_to"):
-            
-            # Avoid re-advancing winners
-            next_match = next((m for m in bracket if m["match_num"] == match["winner_proceeds_to"]), None)
-            if not next_match: continue
-
-            t1 = parse_time(match["participant1_result"])
-            t2 = parse_time(match["participant2_result"])
-            winner_participant_obj = match["participant1"] if t1 < t2 else match["participant2"]
-            loser_participant_obj = match["participant2"] if t1 < t2 else match["participant1"]
-
-            # --- Logic to advance winner ---
-            # Check if winner is already in any participant slot of the next match
-            is_winner_placed = False
-            for i in range(1, 5): # Check participant1 to participant4
-                p_slot = next_match.get(f"participant{i}")
-                if p_slot and p_slot.get("name") == winner_participant_obj.get("name"):
-                    is_winner_placed = True
-                    break
+        touched = []
+        for completion in completions:
+            match_id = completion["matchId"]
+            participant = completion.get("participant")
+            if isinstance(participant, str) and participant.strip().isdigit():
+                participant = int(participant)
+            if not isinstance(participant, int) or isinstance(participant, bool):
+                raise ValueError(f"Invalid participant for match {match_id}: {participant!r}")
 
-            if not is_winner_placed:
-                # Find the first empty participant slot in the next match and place the winner
-                placed = False
-                for i in range(1, 5): # Check participant1 to participant4
-                    if not next_match.get(f"participant{i}"):
-                        next_match[f"participant{i}"] = winner_participant_obj
-                        placed = True
-                        break
-
-            # --- Logic to advance loser ---
-            if match.get("loser_proceeds_to"):
-                third_match = next((m for m in bracket if m["match_num"] == match["loser_proceeds_to"]), None)
-                if third_match:
-                    is_loser_placed = (third_match.get("participant1") and third_match["participant1"]["name"] == loser_participant_obj["name"]) or \
-                                      (third_match.get("participant2") and third_match["participant2"]["name"] == loser_participant_obj["name"])
-                    if not is_loser_placed:
-                        if not third_match.get("participant1"):
-                            third_match["participant1"] = loser_participant_obj
-                        else:
-                            third_match["participant2"] = loser_participant_obj
-
-    save_bracket(bracket)
-    return jsonify({"success": True})
+            match = bracket.get(match_id)
 
-@app.route("/api/reset/<int:match_id>", methods=["POST"])
-def reset_match(match_id):
-    
-    bracket = load_bracket()
-    match = next((m for m in bracket if m["match_num"] == match_id), None)
+            if not match: continue # Skip if match not found
+            if not 1 <= participant <= len(match.players):
+                raise ValueError(f"Match {match_id} has no participant {participant}")
+            if match.is_bye: continue # Nothing to complete in a bye
+            if not match.start_time: continue # Skip if match not started
+            if completion.get("start_time", match.start_time) != match.start_time: continue # Reset and restarted since
+            if match.result(participant) is not None: continue # Skip if already completed
+
+            bracket.touch(match_id)
+            # Check for a special DNF signal from the frontend
+            if completion.get("dnf"):
+                match.set_result(participant, "DNF")
+            else:
+                # Standard completion with time calculation, in microseconds
+                queued_ms = min(max(int(completion.get("queued_ms") or 0), 0), MAX_COMPLETION_QUEUE_MS)
+                match.set_result(participant, max(end_time - queued_ms * 1000 - match.start_time, 0))
+            touched.append(match_id)
+
+        # --- Post-completion processing (advancing winners) ---
+        # This runs after all times in the batch are recorded, and only looks at
+        # the matches that received a result in this batch.
+        advance_from(bracket, touched)
+        get_scheduler(tournament_id).on_results(bracket)
+
+    return touched
 
+@app.route("/api/submit/<int:match_id>", methods=["POST"])
+@app.route("/api/t/<tournament:tournament_id>/submit/<int:match_id>", methods=["POST"])
+def submit_solution(match_id, tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Queues a participant's Python code for judging against the match's
+    problem: {"participant": 1|2, "code": "..."}. Returns 202 with the
+    submission's id, to follow at /api/submission/<id>. If it is accepted,
+    the participant's result is recorded as if they had completed the match
+    when the code arrived.
+    """
+    submitted_at = arrival_time_us()
+    data = request.json or {}
+    code = data.get("code")
+    if not isinstance(code, str) or not code.strip():
+        return jsonify({"error": "No code submitted"}), 400
+    if len(code.encode("utf-8")) > JUDGE_MAX_CODE_BYTES:
+        return jsonify({"error": f"Code is larger than {JUDGE_MAX_CODE_BYTES} bytes"}), 400
+    try:
+        participant = int(data.get("participant"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Expected \"participant\": 1 or 2"}), 400
+
+    bracket = load_bracket(tournament_id)
+    match = bracket.get(match_id) if bracket else None
     if not match:
         return jsonify({"error": "Match not found"}), 404
+    if match.is_bye or not match.problem:
+        return jsonify({"error": "This match has no problem to solve"}), 400
+    if participant < 1 or match.player(participant) is None:
+        return jsonify({"error": f"No participant {participant} in this match"}), 400
+    if not match.start_time or submitted_at < match.start_time:
+        return jsonify({"error": "Match not started"}), 409
+    if match.result(participant) is not None:
+        return jsonify({"error": "Participant already has a result"}), 409
+    if not judge.available:
+        return jsonify({"error": "Judging is off: submissions can't be sandboxed on this server"}), 503
+
+    try:
+        submission = judge.submit(tournament_id, match_id, participant, match.problem, code, submitted_at, match.start_time)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"submission_id": submission.id, "status": submission.status}), 202
+
+@app.route("/api/submission/<submission_id>")
+def get_submission(submission_id):
+    """A submission's status ("queued", "running", "accepted" or the failing test's) and each test's result."""
+    submission = judge.get(submission_id)
+    if submission is None:
+        return jsonify({"error": "Submission not found"}), 404
+    return jsonify(submission)
+
+@app.route("/api/schedule")
+@app.route("/api/t/<tournament:tournament_id>/schedule")
+def get_schedule(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    The station settings, what each station is doing ("free", "queued" or
+    "running", with its match) and the ready matches waiting for a station.
+    """
+    bracket = load_bracket(tournament_id)
+    scheduler = get_scheduler(tournament_id)
+    if not bracket:
+        return jsonify(dict(scheduler.settings(), stations=[], ready=[]))
+    return jsonify(scheduler.status(bracket))
+
+@app.route("/api/schedule", methods=["POST"])
+@app.route("/api/t/<tournament:tournament_id>/schedule", methods=["POST"])
+def update_schedule(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Changes the station settings, all optional: {"stations": [names] or a
+    count, "auto": bool, "auto_start": bool}. Then fills any free stations
+    with ready matches (starting them too with auto_start) and returns the
+    schedule as GET does.
+    """
+    data = request.json or {}
+    scheduler = get_scheduler(tournament_id)
+    try:
+        scheduler.update(data.get("stations"), data.get("auto"), data.get("auto_start"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start_time = arrival_time_us() if scheduler.auto_start else None
+    with tournaments.get(tournament_id).transaction("schedule") as bracket:
+        if bracket:
+            scheduler.assign(bracket, start_time)
+    return get_schedule(tournament_id)
+
+@app.route("/api/schedule/start", methods=["POST"])
+@app.route("/api/t/<tournament:tournament_id>/schedule/start", methods=["POST"])
+def start_scheduled_matches(tournament_id=DEFAULT_TOURNAMENT):
+    """Starts every match queued on a station at once, with one start time."""
+    start_time = arrival_time_us()
+    with tournaments.get(tournament_id).transaction("start") as bracket:
+        if not bracket:
+            return jsonify({"error": "Bracket not loaded"}), 500
+        started = get_scheduler(tournament_id).start_queued(bracket, start_time)
+    return jsonify({"success": True, "started": started, "start_time": format_server_time(start_time), "start_time_us": start_time})
+
+@app.route("/api/reset/<int:match_id>", methods=["POST"])
+@app.route("/api/t/<tournament:tournament_id>/reset/<int:match_id>", methods=["POST"])
+def reset_match(match_id, tournament_id=DEFAULT_TOURNAMENT):
+    
+    with tournaments.get(tournament_id).transaction("reset") as bracket:
+        match = bracket.get(match_id) if bracket else None
+
+        if not match:
+            return jsonify({"error": "Match not found"}), 404
 
-    # Reset match progress
-    match["start_time"] = None
-    # Loop to reset all possible participants
-    for i in range(1, 5):
-        if f"participant{i}_result" in match:
-            match[f"participant{i}_result"] = None
+        bracket.touch(match_id)
+        # Reset match progress
+        match.start_time = None
+        match.results = (None,) * len(match.results)
+        get_scheduler(tournament_id).on_reset(bracket, match)
 
-    save_bracket(bracket)
     return jsonify({"success": True})
 
 @app.route("/api/delete_bracket", methods=["POST"])
-def delete_bracket():
-    """Deletes the bracket.json file."""
+@app.route("/api/t/<tournament:tournament_id>/delete_bracket", methods=["POST"])
+def delete_bracket(tournament_id=DEFAULT_TOURNAMENT):
+    """Deletes the bracket, both in memory and its file on disk."""
     
     try:
-        if os.path.exists(BRACKET_FILE):
-            os.remove(BRACKET_FILE)
+        store = tournaments.get(tournament_id)
+        store.clear()
+        store.flush()
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/history")
+@app.route("/api/t/<tournament:tournament_id>/history")
+def get_history(tournament_id=DEFAULT_TOURNAMENT):
+    """The snapshots the bracket can be restored from, with their times."""
+    return jsonify(tournaments.get(tournament_id).history())
+
+@app.route("/api/restore", methods=["POST"])
+@app.route("/api/t/<tournament:tournament_id>/restore", methods=["POST"])
+def restore_bracket(tournament_id=DEFAULT_TOURNAMENT):
+    """
+    Puts the bracket back the way it was at {"at": "<ISO time>"} (HKT if no
+    offset is given), replaying the event log from the snapshot before then.
+    """
+    data = request.json or {}
+    try:
+        at = datetime.fromisoformat(data["at"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Expected {\"at\": \"<ISO time>\"}"}), 400
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=HKT_TZ)
+
+    try:
+        bracket = tournaments.get(tournament_id).restore(at)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "matches": len(bracket) if bracket else 0})
+
 
 @app.route("/api/problem/<filename>")
 def get_problem(filename):
-    path = os.path.join(PROBLEMS_DIR, filename)
-    with open(path) as f:
-        html = markdown.markdown(f.read())
-    return html
+    problem = problem_cache.get(filename)
+    if not problem:
+        return jsonify({"error": "Problem not found"}), 404
+
+    if problem.etag in request.if_none_match:
+        response = Response(status=304)
+    elif "gzip" in request.accept_encodings and len(problem.html) >= GZIP_MIN_BYTES:
+        response = Response(problem.gzipped(), mimetype="text/html")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(problem.html, mimetype="text/html")
+    response.set_etag(problem.etag)
+    response.headers["Cache-Control"] = f"public, max-age={PROBLEM_MAX_AGE_SECONDS}"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/metrics")
+def get_metrics():
+    """Request latencies, storage and cache counters and a few gauges, in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/profiler")
+def get_profile():
+    """
+    The stacks the sampling profiler has seen, in the collapsed format flame
+    graph tools read (e.g. flamegraph.pl or speedscope).
+    """
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
+@app.route("/api/profiler", methods=["POST"])
+def set_profiler():
+    """
+    Turns the sampling profiler on or off: {"enabled": true|false}, with an
+    optional "interval_ms" between samples and "reset": true to forget the
+    stacks seen so far.
+    """
+    data = request.json or {}
+    interval_ms = data.get("interval_ms")
+    if interval_ms is not None and (not isinstance(interval_ms, (int, float)) or interval_ms <= 0):
+        return jsonify({"error": "interval_ms must be a positive number"}), 400
+    if data.get("reset"):
+        profiler.reset()
+    if data.get("enabled"):
+        profiler.start(interval_ms / 1000 if interval_ms is not None else None)
+    elif "enabled" in data:
+        profiler.stop()
+    return jsonify({"enabled": profiler.running, "interval_ms": profiler.interval * 1000, "samples": profiler.samples})
 
 
 @app.route('/problems/<path:filename>')
@@ -759,5 +4357,45 @@ def serve_problem_asset(filename):
     return send_from_directory(PROBLEMS_DIR, filename)
 
 
+# -----------------------------
+# Command Line
+# -----------------------------
+
+def import_bracket(path, tournament_id):
+    """
+    Copies a bracket JSON file, with its event log if it has one, into the
+    SQLite database as the given tournament's bracket. Returns the number of
+    matches imported, or None if the file holds no bracket.
+    """
+    bracket = JsonFileStorage(path).read()
+    if bracket is None:
+        return None
+    backfill_advancement_slots(bracket)
+    snapshot = BracketSnapshot(int(time.time() * 1000), bracket.matches, bracket.participants)
+    SqliteStorage(SQLITE_FILE, tournament_id).save(snapshot, [], True, snapshot.version)
+    return len(bracket)
+
+@app.cli.command("import-bracket")
+@click.argument("path")
+@click.argument("tournament_id", required=False)
+def import_bracket_command(path, tournament_id):
+    """
+    Imports a bracket JSON file into SQLITE_FILE. The tournament defaults to
+    the default one for BRACKET_FILE and to the file's name otherwise. Stop
+    the server first, or it won't see the imported bracket.
+    """
+    if tournament_id is None:
+        if os.path.abspath(path) == os.path.abspath(BRACKET_FILE):
+            tournament_id = DEFAULT_TOURNAMENT
+        else:
+            tournament_id = os.path.splitext(os.path.basename(path))[0]
+    if not re.fullmatch(TOURNAMENT_ID_REGEX, tournament_id):
+        raise click.BadParameter(f"Invalid tournament id: {tournament_id!r}")
+    imported = import_bracket(path, tournament_id)
+    if imported is None:
+        raise click.ClickException(f"No bracket in {path}")
+    click.echo(f"Imported {imported} matches from {path} into {SQLITE_FILE} as {tournament_id!r}")
+
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+Benchmarks for bracket generation, seeding and the match routes, run on
+synthetic participants and problems.
+
+    python benchmark.py                           # every size, results in benchmark.json
+    python benchmark.py --sizes 8 64 --out before.json
+    python benchmark.py --compare before.json     # and report anything that got slower
+
+Everything runs in a scratch directory, so the brackets, participant lists
+and problems in the working tree are never touched. Each result records the
+median wall time over --repeat runs and, from one further run under
+tracemalloc, the peak and retained memory it allocated. The routes are
+driven through Flask's test client and also report requests per second.
+With --compare, results are matched up with an earlier run by benchmark and
+size, and the script exits with status 1 if any is more than --threshold
+times slower. A run over every size takes several minutes, most of it in
+the seeding search, which is run without its time budget at the largest
+sizes so the results don't depend on the machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SIZES = [8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096]
+HOUSES = "YCBMA"
+
+
+# -----------------------------
+# Synthetic Data
+# -----------------------------
+
+def make_participants(n, rng):
+    """n participants spread unevenly over the houses, as real sign-ups are."""
+    weights = [rng.uniform(0.5, 1.5) for _ in HOUSES]
+    return [{"name": f"Participant {i}", "house": rng.choices(HOUSES, weights)[0]} for i in range(n)]
+
+def write_problems(problems_dir, max_size):
+    """
+    Writes enough small markdown problems for a double-elimination bracket of
+    max_size with the default difficulty curves: about 1.5 level 1 problems
+    per participant, and a quarter each at levels 2 and 3.
+    """
+    os.makedirs(problems_dir, exist_ok=True)
+    counts = {1: 2 * max_size, 2: max_size // 2 + 2, 3: max_size // 2 + 2}
+    for difficulty, count in counts.items():
+        for i in range(count):
+            with open(os.path.join(problems_dir, f"{difficulty}bench{i}.md"), "w") as f:
+                f.write(f"# Problem {difficulty}-{i}\n\nPrint the sum of the numbers from 1 to {i + 1}.\n\n    print({i + 1} * {i + 2} // 2)\n")
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+
+def measure(fn, repeat):
+    """Runs fn repeat times for its timing, then once more under tracemalloc."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "repeat": repeat,
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+    }
+
+def measure_requests(send, count):
+    """Calls send(i) for i in range(count) and reports the throughput."""
+    start = time.perf_counter()
+    for i in range(count):
+        send(i)
+    seconds = time.perf_counter() - start
+    return {
+        "requests": count,
+        "seconds": seconds / count if count else 0.0, # Per request, so sizes compare
+        "requests_per_second": count / seconds if seconds else None,
+    }
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+
+def bench_generation(app, size, repeat, seed):
+    """Bracket generation (including the seeding search) and problem assignment."""
+    participants = make_participants(size, random.Random(seed))
+    problems = app.get_problems_by_difficulty()
+    results = []
+    generators = [
+        ("generate_single_elim", app.generate_single_elim),
+        ("generate_double_elim", app.generate_double_elim),
+        ("generate_hybrid_elim", app.generate_hybrid_elim),
+    ]
+    # The generators run the seeding search to SEEDING_RESTARTS too: cut off
+    # by the clock, how far it gets (and so which draw wins) would depend on
+    # the machine, and the timings would mostly measure the time budget.
+    time_budget = app.SEEDING_TIME_BUDGET_SECONDS
+    app.SEEDING_TIME_BUDGET_SECONDS = float("inf")
+    try:
+        for name, generate in generators:
+            def run():
+                random.seed(seed)
+                return generate(participants)
+            results.append(dict(benchmark=name, size=size, **measure(run, repeat)))
+    finally:
+        app.SEEDING_TIME_BUDGET_SECONDS = time_budget
+
+    # assign_problems() skips matches that already have a problem, so each
+    # run starts from a bracket with none assigned.
+    bracket = app.generate_double_elim(participants)
+    def run_assign_problems():
+        for match in bracket:
+            match.problem = None
+        app.assign_problems(bracket, problems)
+    results.append(dict(benchmark="assign_problems", size=size, **measure(run_assign_problems, repeat)))
+
+    # The seeding search on its own, run to SEEDING_RESTARTS rather than
+    # cut off by SEEDING_TIME_BUDGET_SECONDS, so its timing reflects the work done.
+    draw_size = app.draw_size(size)
+    def run_seed_draw():
+        app.seed_draw(participants, draw_size, draw_size.bit_length() - 1, time_budget=float("inf"), rng=random.Random(seed))
+    results.append(dict(benchmark="seed_draw", size=size, **measure(run_seed_draw, repeat)))
+    return results
+
+def bench_routes(app, client, size, requests_per_route, seed):
+    """
+    The bracket, standings and match routes against a double-elimination
+    bracket of the given size. Every first-round match is started and then
+    completed in one /api/complete_matches batch per match.
+    """
+    participants = make_participants(size, random.Random(seed))
+    with open(app.PARTICIPANTS_FILE, "w") as f:
+        f.writelines(app.format_participant(p) + "\n" for p in participants)
+
+    results = []
+    random.seed(seed)
+    start = time.perf_counter()
+    response = client.post("/api/create_bracket", json={"type": "double"})
+    if response.status_code != 200:
+        raise RuntimeError(f"create_bracket failed for {size}: {response.get_json()}")
+    results.append({"benchmark": "POST /api/create_bracket", "size": size, "requests": 1, "seconds": time.perf_counter() - start})
+
+    store = app.tournaments.get(app.DEFAULT_TOURNAMENT)
+    bracket = store.snapshot()
+    ready = [
+        m.match_num for m in bracket.matches
+        if not m.is_bye and m.player(1) is not None and m.player(2) is not None
+    ][:requests_per_route]
+
+    def route(name, send, count=requests_per_route):
+        results.append(dict(benchmark=name, size=size, **measure_requests(send, count)))
+
+    route("GET /api/bracket", lambda i: client.get("/api/bracket"))
+    etag = client.get("/api/bracket").headers["ETag"]
+    route("GET /api/bracket (304)", lambda i: client.get("/api/bracket", headers={"If-None-Match": etag}))
+    route("GET /api/bracket?layout=1", lambda i: client.get("/api/bracket?layout=1"))
+    route("POST /api/start", lambda i: client.post(f"/api/start/{ready[i]}"), len(ready))
+    version = store.version
+    route("GET /api/bracket?since", lambda i: client.get(f"/api/bracket?since={version - 1}"))
+    route("POST /api/complete_matches", lambda i: client.post("/api/complete_matches", json=[
+        {"matchId": ready[i], "participant": 1},
+        {"matchId": ready[i], "participant": 2, "queued_ms": 10},
+    ]), len(ready))
+    route("GET /api/standings", lambda i: client.get("/api/standings"))
+    route("GET /api/match", lambda i: client.get(f"/api/match/{ready[i % len(ready)]}"))
+    station_ids = ",".join(str(num) for num in ready[:8])
+    route("GET /api/matches (8)", lambda i: client.get(f"/api/matches?ids={station_ids}"))
+
+    store.flush()
+    client.post("/api/delete_bracket")
+    return results
+
+
+# -----------------------------
+# Running and Comparing
+# -----------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    scratch = tempfile.mkdtemp(prefix="bracket-bench-")
+    cwd = os.getcwd()
+    try:
+        # The app resolves its files relative to the working directory when
+        # imported, so it is imported from inside the scratch directory.
+        os.chdir(scratch)
+        write_problems(os.path.join("static", "problems"), max(args.sizes))
+        sys.path.insert(0, REPO_DIR)
+        import app as app_module
+        app_module.app.logger.disabled = True
+        client = app_module.app.test_client()
+
+        results = []
+        for size in args.sizes:
+            print(f"size {size}...", file=sys.stderr)
+            results.extend(bench_generation(app_module, size, args.repeat, args.seed))
+            results.extend(bench_routes(app_module, client, size, args.requests, args.seed))
+        app_module.tournaments.flush_all()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "meta": {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+def compare(baseline, current, threshold):
+    """Prints each result against the baseline and returns those more than threshold times slower."""
+    before = {(r["benchmark"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<30} {'size':>5} {'before':>12} {'after':>12} {'ratio':>7}")
+    for result in current["results"]:
+        old = before.get((result["benchmark"], result["size"]))
+        if old is None or not old["seconds"]:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        flag = "  SLOWER" if ratio > threshold else ""
+        print(f"{result['benchmark']:<30} {result['size']:>5} {old['seconds'] * 1000:>10.3f}ms {result['seconds'] * 1000:>10.3f}ms {ratio:>6.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(result)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="participant counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and size")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic data and draws")
+    parser.add_argument("--out", default="benchmark.json", help="where to write the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="an earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio --compare reports as a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {len(results['results'])} results to {args.out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) more than {args.threshold}x slower", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
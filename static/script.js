@@ -4,9 +4,11 @@ let scrollIntervals = {}; // Object to hold scroll animation intervals
 let activeModalMatches = []; // Holds the match IDs currently in the modal
 
 let bracketData = null; // Global variable to hold bracket data
+let bracketLayout = null; // Where the server placed each match, which only changes with the bracket's structure
 
 let completionQueue = [];
 let completionTimer = null;
+const COMPLETION_BATCH_MS = 200; // How long completions are held back to be sent together
 
 let isAutoScrolling = false;
 let pageScrollInterval = null;
@@ -16,7 +18,7 @@ PIXELS_SCROLL_PER_FRAME = .5
 COUNT_DOWN_FROM = 5
 
 async function loadBracket() {
-    const res = await fetch("/api/bracket");
+    const res = await fetch("/api/bracket?layout=1");
     const data = await res.json();
 
     // If there's an error (no bracket), show the creation section.
@@ -24,18 +26,19 @@ async function loadBracket() {
         document.getElementById("createSection").style.display = "block";
         return;
     }
+    bracketLayout = data.layout;
 
     // Check for a URL parameter to decide whether to reveal the bracket immediately.
     const urlParams = new URLSearchParams(window.location.search);
     if (urlParams.get('reveal') === 'true') {
         // Store data and reveal bracket directly
-        bracketData = data;
+        bracketData = data.matches;
         revealBracket();
         return;
     }
 
     // Otherwise, if bracket data exists, store it and show the intro section.
-    bracketData = data;
+    bracketData = data.matches;
     document.getElementById("introSection").style.display = "block";
 }
 
@@ -43,7 +46,7 @@ function revealBracket() {
     if (bracketData) {
         document.getElementById("introSection").style.display = "none";
         document.getElementById("bracket-container").style.display = "block";
-        renderBracketSVG(bracketData);
+        renderBracketSVG(bracketData, bracketLayout);
 
         // Add the scroll button dynamically if it doesn't exist
         if (!document.getElementById('autoScrollBtn')) {
@@ -85,7 +88,7 @@ async function createBracket(type) {
 /* -----------------------------------------
    SVG BRACKET RENDERER
 ------------------------------------------*/
-function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
+function renderBracketSVG(data, layout) { // Renamed 'matches' to 'data' for clarity
 
     const container = document.getElementById("bracket");
     
@@ -109,11 +112,11 @@ function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
     const isDoubleElim = data.some(m => m.bracket === 'lower' || m.is_grand_final);
 
     if (threeWayFinal) {
-        return renderHybridBracket(svg, data, matchesByNum, threeWayFinal);
+        return renderHybridBracket(svg, data, layout, matchesByNum, threeWayFinal);
     }
 
     if (isDoubleElim) {
-        return renderDoubleElimBracket(svg, data, matchesByNum);
+        return renderDoubleElimBracket(svg, data, layout, matchesByNum);
     }
 
     // --- Standard Single Elimination Bracket Rendering (if not hybrid) ---
@@ -123,36 +126,20 @@ function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
     const VERTICAL_SPACING = 40;
 
     const FINAL_SCALE = 1.5;
-    const THIRD_PLACE_SPACING = 80;
 
-    // Identify special matches
-    const finalMatch = data.find( // Use 'data' here
-        m => !m.winner_proceeds_to && !m.is_third_place
-    );
+    // The server works out where each match goes, in rounds (columns) and
+    // match heights (rows), so drawing needs no walking of the tree here.
+    const ROW_HEIGHT = BOX_HEIGHT + VERTICAL_SPACING;
 
-    const thirdPlaceMatch = data.find( // Changed 'matches' to 'data'
-        m => m.is_third_place
+    const finalMatch = data.find(
+        m => !m.winner_proceeds_to && !m.is_third_place
     );
 
-    // Build rounds EXCLUDING third place
-    const rounds = {};
-    data // Use 'data' here
-        .filter(m => !m.is_third_place)
-        .forEach(match => { // Changed 'matches' to 'data'
-            const round = getRound(match, data);
-            if (!rounds[round]) rounds[round] = [];
-            rounds[round].push(match);
-        });
-
-    const roundNumbers = Object.keys(rounds)
-        .map(Number)
-        .sort((a, b) => a - b);
+    const totalRounds = layout.columns;
 
-    const firstRoundCount = rounds[1].length;
+    const totalHeight = layout.rows * ROW_HEIGHT;
 
-    const totalHeight = firstRoundCount * (BOX_HEIGHT + VERTICAL_SPACING);
-
-    const svgWidth = roundNumbers.length * HORIZONTAL_SPACING + 400;
+    const svgWidth = totalRounds * HORIZONTAL_SPACING + 400;
 
     const svgHeight = totalHeight + 300; // Add some padding
 
@@ -174,9 +161,9 @@ function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
         return `Round ${roundNum}`;
     };
 
-    roundNumbers.forEach(r => {
+    for (let r = 1; r <= totalRounds; r++) {
         const x = 50 + (r - 1) * HORIZONTAL_SPACING;
-        const roundName = getRoundName(r, roundNumbers.length);
+        const roundName = getRoundName(r, totalRounds);
  
         // Draw label directly into the SVG for perfect alignment
         const label = document.createElementNS("http://www.w3.org/2000/svg", "text");
@@ -188,105 +175,37 @@ function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
         label.setAttribute("fill", "#1f2937"); // A dark gray color
         label.textContent = roundName;
         svg.appendChild(label);
-    });
-    // -----------------------------
-    // FIRST ROUND
-    // -----------------------------
-    rounds[1].forEach((match, i) => {
-        const x = 50; // Initial X offset
-        const y = 50 + i * (BOX_HEIGHT + VERTICAL_SPACING);
-
-        positions[match.match_num] = {
-            x,
-            y,
-            width: BOX_WIDTH,
-            height: BOX_HEIGHT
-        };
-
-        drawMatchBox(svg, match, x, y, BOX_WIDTH, BOX_HEIGHT);
-    });
+    }
 
     // -----------------------------
-    // OTHER ROUNDS (normal + final)
+    // MATCHES
     // -----------------------------
-    for (let r = 2; r <= roundNumbers.length; r++) {
-
-        rounds[r].forEach(match => {
-            // Use 'data' here
-            const children = data.filter(
-                m => m.winner_proceeds_to === match.match_num
-            );
-
-            if (children.length !== 2 && children.length !== 4) return; // Allow 2 or 4 children
-
-            let centerY;
-            if (children.length === 4) {
-                // For a 4-way final, find the top-most and bottom-most children to center between them.
-                const childYPositions = children.map(c => positions[c.match_num].y).sort((a, b) => a - b);
-                const yTop = childYPositions[0];
-                const yBottom = childYPositions[childYPositions.length - 1];
-                centerY = (yTop + yBottom) / 2;
-            } else { // The standard case with 2 children
-                const y1 = positions[children[0].match_num].y;
-                const y2 = positions[children[1].match_num].y;
-                centerY = (y1 + y2) / 2;
-            }
-
-            let width = BOX_WIDTH;
-            let height = BOX_HEIGHT;
-            let borderWidth = 2;
-
-            const isFinal =
-                finalMatch &&
-                match.match_num === finalMatch.match_num;
-
-            if (isFinal) { // Scale final match box
-                width *= FINAL_SCALE;
-                height *= FINAL_SCALE;
-                borderWidth = 4;
-            }
-
-            const x = (r - 1) * HORIZONTAL_SPACING + 50; // X position for this round
-
-            let y = centerY;
-
-            if (isFinal) {
-                y -= (height - BOX_HEIGHT) / 2;
-            }
-
-            positions[match.match_num] = {
-                x,
-                y,
-                width,
-                height
-            };
+    data.forEach(match => {
+        const place = layout.matches[match.match_num];
+        if (!place) return;
 
-            drawMatchBox(
-                svg,
-                match,
-                x,
-                y,
-                width,
-                height,
-                borderWidth
-            );
-        });
-    }
+        let width = BOX_WIDTH;
+        let height = BOX_HEIGHT;
+        let borderWidth = 2;
 
-    // -----------------------------
-    // THIRD PLACE (manually positioned)
-    // -----------------------------
-    if (thirdPlaceMatch && finalMatch) {
+        const isFinal =
+            finalMatch &&
+            match.match_num === finalMatch.match_num;
 
-        const finalPos = positions[finalMatch.match_num];
+        if (isFinal) { // Scale final match box
+            width *= FINAL_SCALE;
+            height *= FINAL_SCALE;
+            borderWidth = 4;
+        }
 
-        const width = BOX_WIDTH;
-        const height = BOX_HEIGHT;
+        const x = 50 + place.column * HORIZONTAL_SPACING;
+        let y = 50 + place.row * ROW_HEIGHT;
 
-        const x = finalPos.x;
-        const y = finalPos.y + finalPos.height + THIRD_PLACE_SPACING;
+        if (isFinal) {
+            y -= (height - BOX_HEIGHT) / 2;
+        }
 
-        positions[thirdPlaceMatch.match_num] = {
+        positions[match.match_num] = {
             x,
             y,
             width,
@@ -295,14 +214,14 @@ function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
 
         drawMatchBox(
             svg,
-            thirdPlaceMatch,
+            match,
             x,
             y,
             width,
             height,
-            2
+            borderWidth
         );
-    }
+    });
 
     // -----------------------------
     // CONNECTORS
@@ -344,25 +263,11 @@ function renderBracketSVG(data) { // Renamed 'matches' to 'data' for clarity
     });
 }
 
-function getRound(match, allMatches) { // Renamed 'matches' to 'allMatches' for clarity
-    let round = 1;
-    let current = match;
-
-    while (true) {
-        const parent = allMatches.find(m => // Use 'allMatches' here
-            m.winner_proceeds_to === current.match_num && !m.is_third_place // Exclude 3rd place from round calculation
-        );
-        if (!parent) break;
-        round++;
-        current = parent;
-    }
-    return round;
-}
-
 function drawMatchBox(svg, match, x, y, width, height, borderWidth = 2) {
 
-    const p1_name_display = getParticipantNameOnly(match.participant1);
-    const p2_name_display = getParticipantNameOnly(match.participant2);
+    // A bye only ever has one participant; label the empty side rather than showing TBD.
+    const p1_name_display = match.is_bye && !match.participant1 ? "BYE" : getParticipantNameOnly(match.participant1);
+    const p2_name_display = match.is_bye && !match.participant2 ? "BYE" : getParticipantNameOnly(match.participant2);
     const p3_name_display = getParticipantNameOnly(match.participant3);
     const p4_name_display = getParticipantNameOnly(match.participant4);
     const p1_house = getParticipantHouse(match.participant1);
@@ -587,10 +492,11 @@ function drawConnector(svg, x1, y1, x2, y2, dashed = false) {
  * Renders a hybrid elimination bracket with a 3-way round-robin final.
  * @param {SVGElement} svg The SVG container.
  * @param {Array<Object>} data All match data.
+ * @param {Object} layout Where the server placed each match (see /api/bracket?layout=1).
  * @param {Object} matchesByNum A map of match_num to match object.
  * @param {Object} threeWayFinal The special three-way round-robin match object.
  */
-function renderHybridBracket(svg, data, matchesByNum, threeWayFinal) {
+function renderHybridBracket(svg, data, layout, matchesByNum, threeWayFinal) {
     const BOX_WIDTH = 150;
     const BOX_HEIGHT = 75; // Increased height to accommodate 3 lines of text
     const V_SPACING = 40;
@@ -603,59 +509,21 @@ function renderHybridBracket(svg, data, matchesByNum, threeWayFinal) {
 
     const roundRobinSubMatches = threeWayFinal.sub_matches.map(num => matchesByNum[num]);
 
-    const positions = {};
-    let maxRoundX = 0;
-    let maxBracketHeight = 0;
-
-    // --- Calculate positions for regular elimination rounds ---
-    const rounds = [];
-    // Start with matches that have participants and are not placeholders
-    let currentRoundMatches = regularMatches.filter(m => m.participant1 && (typeof m.participant1 === 'string' ? !m.participant1.startsWith("Winner of M") : true));
-    if (currentRoundMatches.length > 0) {
-        rounds.push(currentRoundMatches);
-    }
-
-    // Build subsequent rounds until we hit the semi-finals leading to the 3-way final
-    while (currentRoundMatches.length > 0) {
-        const nextRoundMatchNums = new Set(currentRoundMatches.map(m => m.winner_proceeds_to).filter(num => num !== null));
-        const nextRoundMatches = Array.from(nextRoundMatchNums)
-            .map(num => matchesByNum[num])
-            .filter(m => m && m.match_type !== 'three_way_round_robin' && !threeWayFinal.sub_matches.includes(m.match_num));
-
-        if (nextRoundMatches.length === 0) break; // No more regular rounds
-        rounds.push(nextRoundMatches);
-        currentRoundMatches = nextRoundMatches;
-    }
-
-    // Position regular matches
-    rounds.forEach((round, roundIndex) => {
-        const x = roundIndex * (BOX_WIDTH + H_SPACING) + 50; // Initial X offset
-        const roundHeight = round.length * (BOX_HEIGHT + V_SPACING);
+    const columnX = column => 50 + column * (BOX_WIDTH + H_SPACING);
+    const rowY = row => 50 + row * (BOX_HEIGHT + V_SPACING);
 
-        // Calculate vertical start position to center the bracket
-        const startY = (maxBracketHeight / 2) - (roundHeight / 2); // This will be adjusted after first pass
-
-        round.forEach((match, matchIndex) => {
-            const matchY = 50 + matchIndex * (BOX_HEIGHT + V_SPACING); // Temporary Y for initial layout
-            positions[match.match_num] = { x, y: matchY };
-            if (matchY + BOX_HEIGHT > maxBracketHeight) maxBracketHeight = matchY + BOX_HEIGHT;
-            if (x + BOX_WIDTH > maxRoundX) maxRoundX = x + BOX_WIDTH;
-        });
-    });
-
-    // Recalculate Y positions to center the bracket vertically
-    const bracketCenterY = maxBracketHeight / 2;
-    rounds.forEach((round, roundIndex) => {
-        const roundHeight = round.length * (BOX_HEIGHT + V_SPACING);
-        const startY = bracketCenterY - (roundHeight / 2);
-        round.forEach((match, matchIndex) => {
-            positions[match.match_num].y = startY + matchIndex * (BOX_HEIGHT + V_SPACING);
-        });
+    // --- Position regular matches where the server laid them out ---
+    const positions = {};
+    regularMatches.forEach(match => {
+        const place = layout.matches[match.match_num];
+        if (place) positions[match.match_num] = { x: columnX(place.column), y: rowY(place.row) };
     });
 
     // --- Position 3-way Round-Robin Final ---
-    const rrCenterX = maxRoundX + H_SPACING * 2 + BOX_WIDTH / 2;
-    const rrCenterY = bracketCenterY; // Center vertically with the main bracket
+    // The final and its sub-matches share one place, which the sub-matches are arranged around
+    const rrPlace = layout.matches[threeWayFinal.match_num];
+    const rrCenterX = columnX(rrPlace.column) + H_SPACING + BOX_WIDTH / 2;
+    const rrCenterY = rowY(rrPlace.row) + BOX_HEIGHT / 2; // Center vertically with the main bracket
 
     // Position sub-matches around the center point
     positions[roundRobinSubMatches[0].match_num] = { x: rrCenterX - BOX_WIDTH / 2, y: rrCenterY - BOX_HEIGHT * 1.5 - V_SPACING }; // Top
@@ -755,105 +623,35 @@ function createTextSpan(text, dy = 0) {
  * Renders a double elimination bracket.
  * @param {SVGElement} svg The SVG container.
  * @param {Array<Object>} data All match data.
+ * @param {Object} layout Where the server placed each match (see /api/bracket?layout=1).
  * @param {Object} matchesByNum A map of match_num to match object.
  */
-function renderDoubleElimBracket(svg, data, matchesByNum) {
+function renderDoubleElimBracket(svg, data, layout, matchesByNum) {
     const BOX_WIDTH = 180;
     const BOX_HEIGHT = 75; // Increased height to accommodate 3 lines of text
     const H_SPACING = 80;
     const V_SPACING = 30;
 
-    const upperMatches = data.filter(m => m.bracket === 'upper');
-    const lowerMatches = data.filter(m => m.bracket === 'lower');
     const grandFinal = data.find(m => m.is_grand_final);
 
+    // --- 1. Position both brackets where the server laid them out ---
+    // The lower bracket's rows already start below the upper bracket's.
     const positions = {};
-    let maxSvgWidth = 0;
-    let maxSvgHeight = 0;
-
-    // --- 1. Position Upper Bracket ---
-    const upperRounds = {};
-    upperMatches.forEach(match => {
-        let round = 1;
-        let current = match;
-        while (true) {
-            const parent = upperMatches.find(p => p.winner_proceeds_to === current.match_num);
-            if (!parent) break;
-            current = parent;
-            round++;
-        }
-        if (!upperRounds[round]) upperRounds[round] = [];
-        upperRounds[round].push(match);
-    });
-
-    const upperRoundNumbers = Object.keys(upperRounds).map(Number).sort((a, b) => a - b);
-    let lastUpperX = 0;
-
-    upperRoundNumbers.forEach(r => {
-        const round = upperRounds[r];
-        const x = 50 + (r - 1) * (BOX_WIDTH + H_SPACING);
-        lastUpperX = x;
-        round.forEach((match, i) => {
-            let y;
-            if (r === 1) {
-                y = 50 + i * (BOX_HEIGHT + V_SPACING);
-            } else {
-                const children = upperMatches.filter(c => c.winner_proceeds_to === match.match_num);
-                const y1 = positions[children[0].match_num].y;
-                const y2 = positions[children[1].match_num].y;
-                y = (y1 + y2) / 2;
-            }
-            positions[match.match_num] = { x, y, width: BOX_WIDTH, height: BOX_HEIGHT };
-            if (y + BOX_HEIGHT > maxSvgHeight) maxSvgHeight = y + BOX_HEIGHT;
-        });
-    });
-
-    // --- 2. Position Lower Bracket ---
-    const lowerRounds = {};
-    let maxLowerRound = 0;
-    lowerMatches.forEach(match => {
-        let round = 1;
-        let current = match;
-        while (true) {
-            const parent = lowerMatches.find(p => p.winner_proceeds_to === current.match_num);
-            if (!parent) break;
-            current = parent;
-            round++;
-        }
-        if (!lowerRounds[round]) lowerRounds[round] = [];
-        lowerRounds[round].push(match);
-        if (round > maxLowerRound) maxLowerRound = round;
-    });
-
-    const lowerRoundNumbers = Object.keys(lowerRounds).map(Number).sort((a, b) => a - b);
-    const lowerBracketYOffset = maxSvgHeight + 120;
-
-    lowerRoundNumbers.forEach(r => {
-        const round = lowerRounds[r];
-        const x = 50 + (r - 1) * (BOX_WIDTH + H_SPACING);
-        round.forEach((match, i) => {
-            let y;
-            const feedingMatches = data.filter(m => m.winner_proceeds_to === match.match_num || m.loser_proceeds_to === match.match_num);
-            if (feedingMatches.length > 0) {
-                y = feedingMatches.reduce((sum, m) => sum + positions[m.match_num].y, 0) / feedingMatches.length;
-                if (feedingMatches.every(m => m.bracket === 'upper')) { // Dropping down
-                    y += BOX_HEIGHT + V_SPACING * 2;
-                }
-            } else { // Should not happen, but as a fallback
-                y = lowerBracketYOffset + i * (BOX_HEIGHT + V_SPACING);
-            }
-            positions[match.match_num] = { x, y, width: BOX_WIDTH, height: BOX_HEIGHT };
-        });
+    data.forEach(match => {
+        const place = layout.matches[match.match_num];
+        if (!place || match.is_grand_final) return;
+        const x = 50 + place.column * (BOX_WIDTH + H_SPACING);
+        const y = 50 + place.row * (BOX_HEIGHT + V_SPACING);
+        positions[match.match_num] = { x, y, width: BOX_WIDTH, height: BOX_HEIGHT };
     });
 
-    // --- 3. Position Grand Final ---
-    const upperFinalPos = positions[upperMatches.find(m => !m.winner_proceeds_to).match_num];
-    const lowerFinalPos = positions[lowerMatches.find(m => !m.winner_proceeds_to).match_num];
-    const finalX = Math.max(upperFinalPos.x, lowerFinalPos.x) + BOX_WIDTH + H_SPACING;
-    const finalY = (upperFinalPos.y + lowerFinalPos.y) / 2;
+    // --- 2. Position Grand Final ---
+    const finalPlace = layout.matches[grandFinal.match_num];
+    const finalX = 50 + finalPlace.column * (BOX_WIDTH + H_SPACING);
+    const finalY = 50 + finalPlace.row * (BOX_HEIGHT + V_SPACING);
     positions[grandFinal.match_num] = { x: finalX, y: finalY, width: BOX_WIDTH * 1.5, height: BOX_HEIGHT * 1.5 };
 
-    // --- 4. Draw Everything ---
+    // --- 3. Draw Everything ---
     data.forEach(match => {
         const pos = positions[match.match_num];
         if (!pos) return;
@@ -974,12 +772,15 @@ function toggleMatchSelection(matchId) {
         group.classList.add('selected-match');
     }
 
-    // If two matches are now selected, open the multi-modal
-    if (selectedMatches.length === 2) {
-        openMultiMatchModal(selectedMatches);
-    }
 }
 
+// Shift-click matches to select them; letting go of Shift opens them together.
+window.addEventListener('keyup', (event) => {
+    if (event.key === 'Shift' && selectedMatches.length >= 2) {
+        openMultiMatchModal([...selectedMatches]);
+    }
+});
+
 function clearSelection() {
     selectedMatches.forEach(id => {
         const group = document.querySelector(`.match-group-${id}`);
@@ -990,20 +791,32 @@ function clearSelection() {
     selectedMatches = [];
 }
 
-async function openMultiMatchModal(matchIds) {
-    const [match1, match2] = await Promise.all([
-        (await fetch(`/api/match/${matchIds[0]}`)).json(),
-        (await fetch(`/api/match/${matchIds[1]}`)).json()
-    ]);
+// Keys that complete a participant in the multi-match view, two per match in
+// column order: 1 and 2 for the first match, 3 and 4 for the second, and so on.
+// Matches past the eighteenth are completed with the mouse.
+const MULTI_MATCH_KEYS = "1234567890qwertyuiopasdfghjklzxcvbnm";
+
+async function fetchMatches(matchIds) {
+    // One round trip for every match and each distinct problem among them.
+    const res = await fetch(`/api/matches?ids=${matchIds.join(",")}`);
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.error || "Could not load the matches");
+    return data;
+}
 
-    // Fetch problem HTML for both matches
-    const [problem1Html, problem2Html] = await Promise.all([
-        match1.problem ? (await fetch(`/api/problem/${match1.problem}`)).text() : Promise.resolve(""),
-        match2.problem ? (await fetch(`/api/problem/${match2.problem}`)).text() : Promise.resolve("")
-    ]);
+async function openMultiMatchModal(matchIds) {
+    let data;
+    try {
+        data = await fetchMatches(matchIds);
+    } catch (error) {
+        showToast(`Error: ${error.message}`, 'error');
+        clearSelection();
+        return;
+    }
+    const { matches, problems, missing } = data;
 
     // Basic validation
-    if (!match1.participant1 || !match1.participant2 || !match2.participant1 || !match2.participant2) {
+    if (missing.length || matches.some(m => !m.participant1 || !m.participant2)) {
         showToast("One or more selected matches are not ready.", 'info');
         clearSelection();
         return;
@@ -1016,40 +829,43 @@ async function openMultiMatchModal(matchIds) {
     const modalTitle = document.getElementById("modalTitle");
     const modalBody = document.getElementById("modalBody");
 
+    const ids = matches.map(m => m.match_num);
+    const which = ids.length === 2 ? 'Both' : 'All';
+
     modalTitle.innerHTML = `Simultaneous Match`;
 
-    // Create two columns for the two matches
+    // One column per match
     modalBody.innerHTML = `
         <div class="multi-match-container">
-            <div id="multiMatchCol1" class="multi-match-column"></div>
-            <div id="multiMatchCol2" class="multi-match-column"></div>
+            ${ids.map(id => `<div id="multiMatchCol-${id}" class="multi-match-column"></div>`).join('')}
         </div>
         <div class="match-controls" style="margin-top: 1.5rem;">
-             <button id="startBtn" class="start-btn" onclick="startMultiMatch([${match1.match_num}, ${match2.match_num}])">Start Both Matches</button>
+             <button id="startBtn" class="start-btn" onclick="startMultiMatch([${ids.join(', ')}])">Start ${which} Matches</button>
              <button id="returnBtn" class="return-btn" onclick="closeModal()" style="display: none;">Return to Bracket & Refresh</button>
         </div>
          <div style="text-align: right; margin-top: 1rem;">
-            <button class="reset-btn" onclick="resetMatch(${match1.match_num}); resetMatch(${match2.match_num});">Reset Both</button>
+            <button class="reset-btn" onclick="${ids.map(id => `resetMatch(${id});`).join(' ')}">Reset ${which}</button>
         </div>
     `;
 
     // Populate each column with its match data
-    populateMatchColumn(document.getElementById('multiMatchCol1'), match1, problem1Html);
-    populateMatchColumn(document.getElementById('multiMatchCol2'), match2, problem2Html);
+    matches.forEach(match => {
+        populateMatchColumn(document.getElementById(`multiMatchCol-${match.match_num}`), match, problems[match.problem] || "");
+    });
 
-    // If either match has started, disable the "Start Both" button
-    if (match1.start_time || match2.start_time) {
+    // If any match has started, disable the start button
+    if (matches.some(m => m.start_time)) {
         document.getElementById('startBtn').disabled = true;
         document.getElementById('startBtn').textContent = 'Matches in Progress or Complete';
     }
 
-    // If both matches are fully complete, show the return button
-    if (match1.participant1_result && match1.participant2_result && match2.participant1_result && match2.participant2_result) {
+    // If every match is fully complete, show the return button
+    if (matches.every(m => m.participant1_result && m.participant2_result)) {
         document.getElementById('startBtn').style.display = 'none';
         document.getElementById('returnBtn').style.display = 'inline-block';
     }
 
-    activeModalMatches = matchIds; // Set the active matches for keybindings
+    activeModalMatches = ids; // Set the active matches for keybindings
 
     modal.style.display = "flex";
     clearSelection(); // Clear selection after opening modal
@@ -1205,7 +1021,7 @@ async function openMatchModal(matchId) {
             }
 
         matchTimers[matchId] = setInterval(() => {
-                const elapsed = Date.now() - startTime;
+                const elapsed = serverNow() - startTime;
                 const seconds = Math.floor((elapsed / 1000) % 60).toString().padStart(2, '0');
                 const minutes = Math.floor((elapsed / (1000 * 60)) % 60).toString().padStart(2, '0');
                 const hours = Math.floor(elapsed / (1000 * 60 * 60));
@@ -1247,7 +1063,7 @@ function closeModal(shouldReveal = false) {
     matchTimers = {};
     activeModalMatches = []; // Clear active matches when modal closes
 
-    if (shouldReveal) {
+    if (shouldReveal || window.location.pathname !== "/") {
         // Navigate with a query parameter to trigger auto-reveal on the homepage.
         window.location.href = '/?reveal=true';
     } else {
@@ -1288,18 +1104,18 @@ async function startMatchAnimation(matchId) {
 }
 
 async function startMatch(matchId) { // Renamed from startMatchAnimation
-    await fetch(`/api/start/${matchId}`, { method: "POST" });
-    const matchRes = await fetch(`/api/match/${matchId}`);
+    const startRes = await fetch(`/api/start/${matchId}`, { method: "POST" });
+    const { start_time } = await startRes.json();
 
-    // Start the live timer
-    const startTime = Date.now(); // Use client's current time for live display
+    // Start the live timer, counting from the server's start time
+    const startTime = new Date(start_time).getTime();
     const timerDisplay = document.getElementById("startTimeDisplay");
 
     // Clear any existing timer for this specific match
     if (matchTimers[matchId]) clearInterval(matchTimers[matchId]);
 
     matchTimers[matchId] = setInterval(() => {
-        const elapsed = Date.now() - startTime;
+        const elapsed = serverNow() - startTime;
         const seconds = Math.floor((elapsed / 1000) % 60).toString().padStart(2, '0');
         const minutes = Math.floor((elapsed / (1000 * 60)) % 60).toString().padStart(2, '0');
         const hours = Math.floor(elapsed / (1000 * 60 * 60));
@@ -1346,26 +1162,27 @@ async function startMultiMatch(matchIds) {
                 countdownDisplay.remove(); // Remove the element
                 modalBody.style.display = "block"; // Show controls again
 
-                // Start both matches on the backend
-                await fetch(`/api/start_matches`, {
+                // Start the matches on the backend
+                const startRes = await fetch(`/api/start_matches`, {
                     method: "POST",
                     headers: { "Content-Type": "application/json" },
                     body: JSON.stringify({ match_ids: matchIds })
                 });
+                const { start_time } = await startRes.json();
 
                 // Enable all complete buttons
-                document.getElementById(`p1CompleteBtn-${matchIds[0]}`).disabled = false;
-                document.getElementById(`p2CompleteBtn-${matchIds[0]}`).disabled = false;
-                document.getElementById(`p1CompleteBtn-${matchIds[1]}`).disabled = false;
-                document.getElementById(`p2CompleteBtn-${matchIds[1]}`).disabled = false;
+                matchIds.forEach(id => {
+                    document.getElementById(`p1CompleteBtn-${id}`).disabled = false;
+                    document.getElementById(`p2CompleteBtn-${id}`).disabled = false;
+                });
 
-                // Start live timers for both
-                const startTime = Date.now();
+                // Start live timers for each, counting from the server's start time
+                const startTime = new Date(start_time).getTime();
                 matchIds.forEach(id => {
                     const timerDisplay = document.getElementById(`timerDisplay-${id}`);
                     if (matchTimers[id]) clearInterval(matchTimers[id]);
                     matchTimers[id] = setInterval(() => {
-                        const elapsed = Date.now() - startTime;
+                        const elapsed = serverNow() - startTime;
                         const seconds = Math.floor((elapsed / 1000) % 60).toString().padStart(2, '0');
                         const minutes = Math.floor((elapsed / (1000 * 60)) % 60).toString().padStart(2, '0');
                         const hours = Math.floor(elapsed / (1000 * 60 * 60));
@@ -1379,7 +1196,7 @@ async function startMultiMatch(matchIds) {
                     if (problemBody) problemBody.style.display = 'block';
                 });
 
-                // Start auto-scrolling for both problems
+                // Start auto-scrolling for each problem
                 matchIds.forEach(id => startProblemAutoScroll(document.getElementById(`problemArea-${id}`), id));
 
             }, 1000);
@@ -1402,16 +1219,16 @@ async function completeMatch(matchId, participant) {
     }
 
     // --- Queueing Logic ---
-    // Add the completion request to the queue
-    completionQueue.push({ matchId, participant });
-
-    // Clear any existing timer to reset the debounce window
-    if (completionTimer) {
-        clearTimeout(completionTimer);
+    // Add the completion request to the queue, noting when, so the server can
+    // take the time spent waiting for the batch off the participant's time.
+    completionQueue.push({ matchId, participant, queuedAt: performance.now() });
+
+    // The first completion in a batch starts the timer and later ones join
+    // it, so none waits longer than COMPLETION_BATCH_MS (which the server
+    // caps the reported wait near).
+    if (!completionTimer) {
+        completionTimer = setTimeout(sendCompletionBatch, COMPLETION_BATCH_MS);
     }
-
-    // Set a new timer. The batch will be sent after 200ms of inactivity.
-    completionTimer = setTimeout(sendCompletionBatch, 200);
 }
 
 function showWinnerAnimation(winnerName, winnerHouse, houseColor) {
@@ -1475,16 +1292,20 @@ function triggerConfetti(element) {
 }
 
 async function sendCompletionBatch() {
+    completionTimer = null;
     if (completionQueue.length === 0) return;
 
     const batch = [...completionQueue]; // Copy the queue
     completionQueue = []; // Clear the original queue
 
+    const sentAt = performance.now();
+    const payload = batch.map(({ queuedAt, ...item }) => ({ ...item, queued_ms: Math.round(sentAt - queuedAt) }));
+
     try {
         const res = await fetch('/api/complete_matches', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(batch)
+            body: JSON.stringify(payload)
         });
 
         if (!res.ok) {
@@ -1495,11 +1316,14 @@ async function sendCompletionBatch() {
         // --- UI Update Logic ---
         // Instead of closing the modal, fetch the updated state of the matches
         // that were part of the batch and update the UI in place.
+        // One request covers both the updated matches and the rest of the modal.
         const updatedMatchIds = [...new Set(batch.map(item => item.matchId))];
-        
+        const { matches } = await fetchMatches([...new Set([...updatedMatchIds, ...activeModalMatches])]);
+        const matchesById = Object.fromEntries(matches.map(m => [m.match_num, m]));
+
         for (const matchId of updatedMatchIds) {
-            const matchRes = await fetch(`/api/match/${matchId}`);
-            const updatedMatch = await matchRes.json();
+            const updatedMatch = matchesById[matchId];
+            if (!updatedMatch) continue;
 
             const isFourWayFinal = !!updatedMatch.is_final;
             const numParticipants = isFourWayFinal ? 4 : 2;
@@ -1556,9 +1380,7 @@ async function sendCompletionBatch() {
         }
 
         // After updating all UIs, check if ALL matches in the modal are complete.
-        const allMatchesInModal = await Promise.all(
-            activeModalMatches.map(id => fetch(`/api/match/${id}`).then(res => res.json()))
-        );
+        const allMatchesInModal = activeModalMatches.map(id => matchesById[id]).filter(Boolean);
 
         const allDone = allMatchesInModal.every(m => {
             const numPs = m.is_final ? 4 : 2;
@@ -1587,7 +1409,7 @@ function dnfParticipant(matchId, participant) {
     showConfirm("Are you sure you want to mark this participant as DNF?", () => {
         // Add the DNF action to the queue and send it immediately.
         // We add a 'dnf: true' flag for the backend to recognize.
-        completionQueue.push({ matchId, participant, dnf: true });
+        completionQueue.push({ matchId, participant, dnf: true, queuedAt: performance.now() });
         
         // Clear any existing timer and send the batch immediately.
         if (completionTimer) clearTimeout(completionTimer);
@@ -1751,10 +1573,99 @@ function startProblemAutoScroll(element, id) {
     }, 500);
 }
 
+/* -----------------------------------------
+   LIVE UPDATES (SERVER-SENT EVENTS)
+------------------------------------------*/
+// The server pushes only the matches that changed, so spectator screens stay
+// up to date without re-fetching the whole bracket.
+let bracketVersion = null;
+
+function isBracketVisible() {
+    const container = document.getElementById("bracket-container");
+    return container && container.style.display === "block";
+}
+
+async function refreshBracketData() {
+    const res = await fetch("/api/bracket?layout=1");
+    const data = await res.json();
+    if (data.error) return;
+    bracketData = data.matches;
+    bracketLayout = data.layout;
+    if (isBracketVisible()) renderBracketSVG(bracketData, bracketLayout);
+}
+
+function subscribeToBracketUpdates() {
+    if (!window.EventSource) return;
+    const source = new EventSource("/api/stream");
+
+    source.addEventListener("hello", (event) => {
+        const { version } = JSON.parse(event.data);
+        // After a reconnect we may have missed events, so catch up in one go.
+        if (bracketVersion !== null && version !== bracketVersion) refreshBracketData();
+        bracketVersion = version;
+    });
+
+    source.addEventListener("matches", (event) => {
+        const { version, matches } = JSON.parse(event.data);
+        bracketVersion = version;
+        if (!bracketData) return;
+        const indexByNum = Object.fromEntries(bracketData.map((m, i) => [m.match_num, i]));
+        matches.forEach(match => {
+            const i = indexByNum[match.match_num];
+            if (i !== undefined) bracketData[i] = match;
+        });
+        // Updates to matches never move them, so the layout still holds.
+        if (isBracketVisible()) renderBracketSVG(bracketData, bracketLayout);
+    });
+
+    source.addEventListener("bracket", (event) => {
+        bracketVersion = JSON.parse(event.data).version;
+        refreshBracketData();
+    });
+}
+
 if (window.location.pathname === "/") {
     loadBracket();
+    subscribeToBracketUpdates();
+} else if (window.location.pathname === "/multimatch" && typeof multiMatchIds !== "undefined") {
+    openMultiMatchModal(multiMatchIds);
 }
 
+/* -----------------------------------------
+   SERVER CLOCK
+------------------------------------------*/
+
+// Match times are measured by the server, so timers count from the server's
+// start_time using the server's clock rather than this machine's.
+const CLOCK_SYNC_INTERVAL_MS = 5 * 60 * 1000;
+let serverClockOffset = 0; // Server time minus local time, in ms
+
+function serverNow() {
+    return Date.now() + serverClockOffset;
+}
+
+async function syncServerClock() {
+    // Take the sample with the shortest round trip, which bounds the error best.
+    let best = null;
+    for (let i = 0; i < 3; i++) {
+        try {
+            const t0 = Date.now();
+            const res = await fetch("/api/clock", { cache: "no-store" });
+            const { server_time_us } = await res.json();
+            const t1 = Date.now();
+            if (!best || t1 - t0 < best.roundTrip) {
+                best = { roundTrip: t1 - t0, offset: server_time_us / 1000 - (t0 + t1) / 2 };
+            }
+        } catch (e) {
+            // Keep the last good offset if the server can't be reached.
+        }
+    }
+    if (best) serverClockOffset = best.offset;
+}
+
+syncServerClock();
+setInterval(syncServerClock, CLOCK_SYNC_INTERVAL_MS);
+
 /* -----------------------------------------
    UI HELPERS (TOASTS & CONFIRM MODAL)
 ------------------------------------------*/
@@ -1887,12 +1798,13 @@ window.addEventListener('keydown', (event) => {
         // Single match mode
         keyMap['1'] = { matchId: activeModalMatches[0], participant: 1 };
         keyMap['2'] = { matchId: activeModalMatches[0], participant: 2 };
-    } else if (activeModalMatches.length === 2) {
-        // Multi-match mode
-        keyMap['1'] = { matchId: activeModalMatches[0], participant: 1 };
-        keyMap['2'] = { matchId: activeModalMatches[0], participant: 2 };
-        keyMap['3'] = { matchId: activeModalMatches[1], participant: 1 };
-        keyMap['4'] = { matchId: activeModalMatches[1], participant: 2 };
+    } else {
+        // Multi-match mode: two keys per match, in column order
+        activeModalMatches.forEach((matchId, i) => {
+            if (2 * i + 1 >= MULTI_MATCH_KEYS.length) return;
+            keyMap[MULTI_MATCH_KEYS[2 * i]] = { matchId, participant: 1 };
+            keyMap[MULTI_MATCH_KEYS[2 * i + 1]] = { matchId, participant: 2 };
+        });
     }
 
     const action = keyMap[event.key];
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# app.py is a script beside this directory, not an installed package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
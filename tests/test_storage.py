@@ -0,0 +1,249 @@
+"""
+Crash recovery and history for the storage backends: what a BracketStore
+saves must load back the same, whatever point a save was cut short at, and
+restore() must rebuild the bracket as it was at any time in its history.
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+import app
+
+PARTICIPANTS = [{"name": f"Player {i}", "house": "YCBMA"[i % 5]} for i in range(8)]
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def open_storage(request, tmp_path):
+    """Opens the backend's storage afresh each call, as a restarted server would."""
+    if request.param == "json":
+        return lambda: app.JsonFileStorage(str(tmp_path / "bracket.json"))
+    return lambda: app.SqliteStorage(str(tmp_path / "brackets.db"), "main")
+
+
+@pytest.fixture
+def few_events_per_snapshot(monkeypatch):
+    monkeypatch.setattr(app, "EVENTS_PER_SNAPSHOT", 3)
+
+
+def open_store(open_storage):
+    # Never flushed in the background, so each test decides when saves happen.
+    return app.BracketStore(open_storage(), flush_delay=3600)
+
+def new_bracket(store):
+    store.set(app.generate_single_elim(PARTICIPANTS))
+    store.flush()
+
+def first_round(store):
+    return [m.match_num for m in store.snapshot().matches if m.round == 1 and not m.is_bye]
+
+def start(store, match_num):
+    with store.transaction("start") as bracket:
+        bracket.touch(match_num)
+        bracket.get(match_num).start_time = app.server_time_us()
+
+def complete(store, match_num, slot, result):
+    with store.transaction("complete") as bracket:
+        bracket.touch(match_num)
+        bracket.get(match_num).set_result(slot, result)
+        app.advance_from(bracket, [match_num])
+
+def play(store, match_num, first=1_000_000, second=2_000_000):
+    start(store, match_num)
+    complete(store, match_num, 1, first)
+    complete(store, match_num, 2, second)
+
+def state(store):
+    snapshot = store.snapshot()
+    return snapshot.to_dicts() if snapshot is not None else None
+
+def reloaded(open_storage):
+    return state(open_store(open_storage))
+
+
+def test_transactions_load_back(open_storage):
+    store = open_store(open_storage)
+    new_bracket(store)
+    for match_num in first_round(store)[:2]:
+        play(store, match_num)
+        store.flush()
+    start(store, first_round(store)[2])
+    store.flush()
+    assert reloaded(open_storage) == state(store)
+
+def test_unflushed_changes_are_not_loaded(open_storage):
+    store = open_store(open_storage)
+    new_bracket(store)
+    saved = state(store)
+    play(store, first_round(store)[0])
+    assert reloaded(open_storage) == saved
+
+def test_compaction_loads_back(open_storage, few_events_per_snapshot):
+    store = open_store(open_storage)
+    new_bracket(store)
+    for match_num in first_round(store):
+        play(store, match_num)
+        store.flush() # Three events a match, so every flush compacts
+    assert reloaded(open_storage) == state(store)
+    assert len(store.history()) > 1
+
+def test_deleted_bracket_stays_deleted(open_storage):
+    store = open_store(open_storage)
+    new_bracket(store)
+    store.clear()
+    store.flush()
+    assert reloaded(open_storage) is None
+
+def test_restore_to_a_point_in_history(open_storage, few_events_per_snapshot):
+    store = open_store(open_storage)
+    new_bracket(store)
+    # One match at a time, noting the bracket after each, so the points
+    # restored to fall both inside a log and right after a compaction.
+    points = []
+    for match_num in first_round(store):
+        start(store, match_num)
+        complete(store, match_num, 1, 1_000_000)
+        store.flush()
+        time.sleep(0.01)
+        points.append((datetime.now(app.HKT_TZ), state(store)))
+        time.sleep(0.01)
+        complete(store, match_num, 2, 2_000_000)
+        store.flush()
+    time.sleep(0.01)
+    before_restores, final = datetime.now(app.HKT_TZ), state(store)
+    time.sleep(0.01)
+
+    for at, expected in points:
+        store.restore(at)
+        assert state(store) == expected
+        store.flush()
+        assert reloaded(open_storage) == expected
+
+    # The bracket replaced by a restore is kept, so the restore can be undone.
+    store.restore(before_restores)
+    assert state(store) == final
+
+def test_restore_before_the_history_fails(open_storage):
+    store = open_store(open_storage)
+    new_bracket(store)
+    with pytest.raises(ValueError):
+        store.restore(datetime(2000, 1, 1, tzinfo=app.HKT_TZ))
+
+
+# JsonFileStorage: a compaction writes the new snapshot, then starts the new
+# log. Cut short between the two, the old log is left beside a snapshot that
+# already includes it.
+
+def test_json_crash_between_snapshot_and_log(tmp_path, monkeypatch, few_events_per_snapshot):
+    open_storage = lambda: app.JsonFileStorage(str(tmp_path / "bracket.json"))
+    store = open_store(open_storage)
+    new_bracket(store)
+    match_num = first_round(store)[0]
+    start(store, match_num)
+    complete(store, match_num, 1, 1_000_000)
+    store.flush()
+    # The next flush compacts. Its last event changes the match the old log
+    # also changed, so replaying that log over the new snapshot would undo it.
+    complete(store, match_num, 2, 2_000_000)
+    def crash(*args):
+        raise OSError("Crashed before the new log was started")
+    monkeypatch.setattr(store.storage, "_write_log_header", crash)
+    with pytest.raises(OSError):
+        store.flush()
+
+    assert reloaded(open_storage) == state(store)
+    # Loading starts a new log for the snapshot, which later events go on.
+    store = open_store(open_storage)
+    play(store, first_round(store)[1])
+    store.flush()
+    assert reloaded(open_storage) == state(store)
+
+def test_json_crash_mid_append(tmp_path):
+    open_storage = lambda: app.JsonFileStorage(str(tmp_path / "bracket.json"))
+    store = open_store(open_storage)
+    new_bracket(store)
+    match_num = first_round(store)[0]
+    start(store, match_num)
+    store.flush()
+    saved = state(store)
+    complete(store, match_num, 1, 1_000_000)
+    store.flush()
+    log_path = store.storage.log_path
+    with open(log_path, "rb+") as f:
+        f.truncate(os.path.getsize(log_path) - 10) # The last event cut short
+    assert reloaded(open_storage) == saved
+
+def test_json_history_is_pruned(tmp_path, monkeypatch, few_events_per_snapshot):
+    monkeypatch.setattr(app, "SNAPSHOT_HISTORY", 2)
+    open_storage = lambda: app.JsonFileStorage(str(tmp_path / "bracket.json"))
+    store = open_store(open_storage)
+    new_bracket(store)
+    for match_num in first_round(store):
+        play(store, match_num)
+        store.flush()
+    assert len(store.storage._archived()) == 2
+    assert reloaded(open_storage) == state(store)
+
+
+# SqliteStorage: each save is one database transaction, which writes a
+# snapshot every EVENTS_PER_SNAPSHOT events.
+
+def test_sqlite_snapshot_every_few_events(tmp_path, few_events_per_snapshot):
+    open_storage = lambda: app.SqliteStorage(str(tmp_path / "brackets.db"), "main")
+    store = open_store(open_storage)
+    new_bracket(store)
+    match_num, next_match = first_round(store)[:2]
+    start(store, match_num)
+    store.flush()
+    complete(store, match_num, 1, 1_000_000)
+    store.flush()
+    assert len(store.storage.segments()) == 1 # Just the new bracket's
+    complete(store, match_num, 2, 2_000_000)
+    store.flush()
+    segments = store.storage.segments()
+    assert len(segments) == 2
+    assert segments[-1][2] == []
+    assert segments[-1][3]().to_dicts() == state(store)
+
+    # The count carries over a restart.
+    store = open_store(open_storage)
+    start(store, next_match)
+    complete(store, next_match, 1, 1_000_000)
+    store.flush()
+    assert len(store.storage.segments()) == 2
+    complete(store, next_match, 2, 2_000_000)
+    store.flush()
+    assert len(store.storage.segments()) == 3
+    assert reloaded(open_storage) == state(store)
+
+def test_sqlite_crash_writing_snapshot(tmp_path, monkeypatch, few_events_per_snapshot):
+    open_storage = lambda: app.SqliteStorage(str(tmp_path / "brackets.db"), "main")
+    store = open_store(open_storage)
+    new_bracket(store)
+    saved = state(store)
+    play(store, first_round(store)[0])
+    def crash(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+    with monkeypatch.context() as m:
+        m.setattr(store.storage, "_write_snapshot", crash)
+        with pytest.raises(sqlite3.OperationalError):
+            store.flush()
+    # None of the save was committed, and the store still has it to write.
+    assert reloaded(open_storage) == saved
+    store.flush()
+    assert reloaded(open_storage) == state(store)
+
+def test_sqlite_tournaments_are_kept_apart(tmp_path):
+    db_path = str(tmp_path / "brackets.db")
+    first = open_store(lambda: app.SqliteStorage(db_path, "first"))
+    second = open_store(lambda: app.SqliteStorage(db_path, "second"))
+    new_bracket(first)
+    new_bracket(second)
+    play(first, first_round(first)[0])
+    first.flush()
+    assert reloaded(lambda: app.SqliteStorage(db_path, "first")) == state(first)
+    assert reloaded(lambda: app.SqliteStorage(db_path, "second")) == state(second)
+    assert sorted(app.SqliteStorage.tournament_ids(db_path)) == ["first", "second"]